@@ -0,0 +1,11 @@
+using System.Runtime.InteropServices;
+
+namespace CeresGpu.Graphics
+{
+    [StructLayout(LayoutKind.Explicit, Size=16)]
+    public struct DoubleVector2
+    {
+        [FieldOffset(0)] public double X;
+        [FieldOffset(8)] public double Y;
+    }
+}
\ No newline at end of file
@@ -0,0 +1,12 @@
+using System.Runtime.InteropServices;
+
+namespace CeresGpu.Graphics
+{
+    [StructLayout(LayoutKind.Explicit, Size=24)]
+    public struct DoubleVector3
+    {
+        [FieldOffset(0)] public double X;
+        [FieldOffset(8)] public double Y;
+        [FieldOffset(16)] public double Z;
+    }
+}
\ No newline at end of file
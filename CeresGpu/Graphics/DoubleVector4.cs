@@ -0,0 +1,13 @@
+using System.Runtime.InteropServices;
+
+namespace CeresGpu.Graphics
+{
+    [StructLayout(LayoutKind.Explicit, Size=32)]
+    public struct DoubleVector4
+    {
+        [FieldOffset(0)] public double X;
+        [FieldOffset(8)] public double Y;
+        [FieldOffset(16)] public double Z;
+        [FieldOffset(24)] public double W;
+    }
+}
\ No newline at end of file
@@ -3,13 +3,28 @@ using CeresGpu.Graphics.Shaders;
 
 namespace CeresGpu.Graphics;
 
+/// <summary>
+/// Receives the vertex buffers of an adapter, see <see cref="IUntypedVertexBufferAdapter.VisitVertexBuffers{TVisitor}"/>.
+/// Implement this on a struct so that visiting the buffers doesn't allocate or go through interface dispatch.
+/// </summary>
+public interface IVertexBufferVisitor
+{
+    /// <param name="index">Index of the vertex buffer in the vertex buffer layout.</param>
+    /// <param name="buffer">The buffer, or null if no buffer has been set at this index.</param>
+    void Visit(int index, IBuffer? buffer);
+}
+
 public interface IUntypedVertexBufferAdapter
 {
-    // TODO: This is meant to return any IBuffer<T> without type info. 
-    //    Buffer<T> doesn't implement an untyped interface because I want to make it hard to mix and match usage of the
-    //    typed and untyped buffer manipulation. However, maybe that's not necesary, and there could be benefits of
-    //    allowing the typed and untyped interfaces to coexist?
-    ReadOnlySpan<object?> VertexBuffers { get; }
+    /// <summary>
+    /// Number of vertex buffers the adapter provides. Buffer indices passed to the visitor are less than this.
+    /// </summary>
+    int VertexBufferCount { get; }
+    
+    /// <summary>
+    /// Calls <see cref="IVertexBufferVisitor.Visit"/> once for every vertex buffer index of the adapter.
+    /// </summary>
+    void VisitVertexBuffers<TVisitor>(ref TVisitor visitor) where TVisitor : struct, IVertexBufferVisitor;
 }
 
 /// <summary>
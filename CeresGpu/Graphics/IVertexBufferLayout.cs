@@ -60,4 +60,10 @@ public interface IVertexBufferLayout
 {
     ReadOnlySpan<VblBufferDescriptor> BufferDescriptors { get; }
     ReadOnlySpan<VblAttributeDescriptor> AttributeDescriptors { get; }
+    
+    /// <summary>
+    /// Hash of the buffer and attribute descriptors, computed when the layout was generated. Layouts with equal
+    /// descriptors have equal hashes, across runs as well. See <see cref="IShader.InterfaceHash"/>.
+    /// </summary>
+    ulong LayoutHash { get; }
 }
@@ -0,0 +1,12 @@
+using System.Runtime.InteropServices;
+
+namespace CeresGpu.Graphics
+{
+    [StructLayout(LayoutKind.Explicit, Size=12)]
+    public struct IntVector3
+    {
+        [FieldOffset(0)] public int X;
+        [FieldOffset(4)] public int Y;
+        [FieldOffset(8)] public int Z;
+    }
+}
\ No newline at end of file
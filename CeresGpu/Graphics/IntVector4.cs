@@ -0,0 +1,13 @@
+using System.Runtime.InteropServices;
+
+namespace CeresGpu.Graphics
+{
+    [StructLayout(LayoutKind.Explicit, Size=16)]
+    public struct IntVector4
+    {
+        [FieldOffset(0)] public int X;
+        [FieldOffset(4)] public int Y;
+        [FieldOffset(8)] public int Z;
+        [FieldOffset(12)] public int W;
+    }
+}
\ No newline at end of file
@@ -242,24 +242,35 @@ public sealed class MetalPass : PassEncoder, IMetalPass
             throw new InvalidOperationException("No shader instance set. Must call SetPipeline first!");
         }
 
-        ReadOnlySpan<object?> vertexBuffers = CurrentShaderInstance.VertexBufferAdapter.VertexBuffers;
+        SetVertexBufferVisitor setVisitor = new(_encoder);
+        CurrentShaderInstance.VertexBufferAdapter.VisitVertexBuffers(ref setVisitor);
             
-        for (int i = 0, ilen = vertexBuffers.Length; i < ilen; ++i) {
+        _shaderInstanceBacking.Update(_encoder);
+    }
+    
+    private readonly struct SetVertexBufferVisitor : IVertexBufferVisitor
+    {
+        private readonly IntPtr _encoder;
+
+        public SetVertexBufferVisitor(IntPtr encoder)
+        {
+            _encoder = encoder;
+        }
+        
+        public void Visit(int index, IBuffer? untypedVertexBuffer)
+        {
             // No vertex buffer set.
             // TODO: log to let the user know they didn't set a vertex buffer.
-            object? untypedVertexBuffer = vertexBuffers[i];
             if (untypedVertexBuffer == null) {
-                continue;
+                return;
             }
             if (untypedVertexBuffer is IMetalBuffer buffer) {
                 buffer.Commit();
-                MetalApi.metalbinding_command_encoder_set_vertex_buffer(_encoder, buffer.GetHandleForCurrentFrame(), 0, MetalBufferTableConstants.INDEX_VERTEX_BUFFER_MAX - (uint)i);    
+                MetalApi.metalbinding_command_encoder_set_vertex_buffer(_encoder, buffer.GetHandleForCurrentFrame(), 0, MetalBufferTableConstants.INDEX_VERTEX_BUFFER_MAX - (uint)index);    
             } else {
-                throw new InvalidOperationException($"Buffer returned by vertex buffer adapter at index {i} is not compatible with MetalPass.");
+                throw new InvalidOperationException($"Buffer returned by vertex buffer adapter at index {index} is not compatible with MetalPass.");
             }
         }
-            
-        _shaderInstanceBacking.Update(_encoder);
     }
 
 
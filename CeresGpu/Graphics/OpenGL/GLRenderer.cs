@@ -24,6 +24,11 @@ namespace CeresGpu.Graphics.OpenGL
         public uint UniqueFrameId { get; private set; }
         
         public IGLProvider GLProvider => _context;
+        
+        /// <summary>
+        /// Whether shaders can be created from SPIR-V binaries (GL 4.6), instead of compiling GLSL source.
+        /// </summary>
+        public bool SupportsSpirvShaders { get; }
 
         public readonly GLTexture FallbackTexture;
         public readonly GLSampler FallbackSampler;
@@ -66,6 +71,8 @@ namespace CeresGpu.Graphics.OpenGL
             
             Console.WriteLine($"OpenGLRenderer: OpenGL version {majorVersion}.{minorVersion}, context flags: {flags}");
             
+            SupportsSpirvShaders = (majorVersion > 4 || (majorVersion == 4 && minorVersion >= 6)) && HasSpirvBinaryFormat(gl);
+            
             // TODO: Fix parameter validation in gl.GetIntegerv
             
             if (isDebugContext) {
@@ -89,6 +96,19 @@ namespace CeresGpu.Graphics.OpenGL
             NewFrame();
         }
 
+        private static bool HasSpirvBinaryFormat(GL gl)
+        {
+            Span<int> pNumFormats = stackalloc int[1];
+            gl.GetIntegerv(GetPName.NUM_SHADER_BINARY_FORMATS, pNumFormats);
+            if (pNumFormats[0] <= 0) {
+                return false;
+            }
+            
+            Span<int> formats = stackalloc int[pNumFormats[0]];
+            gl.GetIntegerv(GetPName.SHADER_BINARY_FORMATS, formats);
+            return formats.Contains((int)ShaderBinaryFormat.SHADER_BINARY_FORMAT_SPIR_V);
+        }
+
         private delegate void DebugCallback(DebugSource source, DebugType type, uint id, DebugSeverity severity, uint length, IntPtr message, IntPtr userParam); 
 
         private void HandleDebugMessage(DebugSource source, DebugType type, uint id, DebugSeverity severity, uint length, IntPtr message, IntPtr userParam)
@@ -132,7 +152,7 @@ namespace CeresGpu.Graphics.OpenGL
 
         public IShaderBacking CreateShaderBacking(IShader shader)
         {
-            return new GLShaderBacking(_context, shader);
+            return new GLShaderBacking(_context, shader, SupportsSpirvShaders);
         }
 
         public IShaderInstanceBacking CreateShaderInstanceBacking(IShader shader)
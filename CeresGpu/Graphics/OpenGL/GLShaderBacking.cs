@@ -12,19 +12,22 @@ namespace CeresGpu.Graphics.OpenGL
 
         public uint Program => _program;
         
-        public GLShaderBacking(IGLProvider glProvider, IShader shader)
+        public GLShaderBacking(IGLProvider glProvider, IShader shader, bool supportsSpirv)
         {
             _provider = glProvider;
             GL gl = glProvider.Gl;
             
+            // Prefer SPIR-V when the driver takes it, as it skips the driver's GLSL front end.
+            bool useSpirv = supportsSpirv && (shader.Artifacts & ShaderArtifacts.GLSpirv) != 0;
+            
             _program = gl.CreateProgram();
 
             uint vertShader = gl.CreateShader(ShaderType.VERTEX_SHADER);
             try {
                 uint fragShader = gl.CreateShader(ShaderType.FRAGMENT_SHADER);
                 try {
-                    SetShader(gl, vertShader, shader, ".vert_gl.glsl");
-                    SetShader(gl, fragShader, shader, ".frag_gl.glsl");
+                    SetShader(gl, vertShader, shader, ".vert_gl", useSpirv);
+                    SetShader(gl, fragShader, shader, ".frag_gl", useSpirv);
                     gl.AttachShader(_program, vertShader);
                     gl.AttachShader(_program, fragShader);
                     gl.LinkProgram(_program);
@@ -37,38 +40,51 @@ namespace CeresGpu.Graphics.OpenGL
             }
         }
 
-        private void SetShader(GL gl, uint handle, IShader shader, string postfix)
+        private void SetShader(GL gl, uint handle, IShader shader, string postfix, bool useSpirv)
         {
-            //Span<uint> shaders = stackalloc uint[1] { handle };
-            byte[] spirv = GetSource(shader, postfix);
+            if (useSpirv && TrySetSpirv(gl, handle, shader, postfix)) {
+                return;
+            }
+            
+            byte[] source = GetResource(shader, postfix + ".glsl");
             
-            gl.ShaderSource(handle, spirv);
+            gl.ShaderSource(handle, source);
             gl.CompileShader(handle);
             
-            //gl.ShaderBinary(1, shaders, ShaderBinaryFormat.SHADER_BINARY_FORMAT_SPIR_V, spirv, spirv.Length);
-            //gl.SpecializeShader(handle, "main", 0, null, null);
             Console.WriteLine($"Shader Log: {GLUtil.GetShaderInfoLog(gl, handle)}"); // TODO: Needs more info
         }
+
+        private bool TrySetSpirv(GL gl, uint handle, IShader shader, string postfix)
+        {
+            using Stream? stream = shader.GetShaderResource(postfix + ".spv");
+            if (stream == null) {
+                return false;
+            }
+            byte[] spirv = new byte[stream.Length];
+            stream.ReadExactly(spirv);
+            
+            Span<uint> shaders = stackalloc uint[1] { handle };
+            gl.ShaderBinary(1, shaders, ShaderBinaryFormat.SHADER_BINARY_FORMAT_SPIR_V, spirv, spirv.Length);
+            gl.SpecializeShader(handle, "main", 0, null, null);
+            
+            Span<int> pCompileStatus = stackalloc int[1];
+            gl.GetShaderiv(handle, ShaderParameterName.COMPILE_STATUS, pCompileStatus);
+            if (pCompileStatus[0] == 0) {
+                // Calling ShaderSource afterwards drops the binary, so the caller can still fall back to GLSL.
+                Console.WriteLine($"Failed to specialize SPIR-V shader, falling back to GLSL: {GLUtil.GetShaderInfoLog(gl, handle)}");
+                return false;
+            }
+            return true;
+        }
         
-        private byte[] GetSource(IShader shader, string postfix)
+        private byte[] GetResource(IShader shader, string postfix)
         {
             using Stream? stream = shader.GetShaderResource(postfix);
             if (stream == null) {
                 throw new InvalidOperationException($"Cannot find resource with {postfix}");
             }
-            long len = stream.Length;
-            byte[] spirv = new byte[len];
-            int offset = 0;
-            while (true) {
-                int read = stream.Read(spirv, offset, (int)len - offset);
-                offset += read;
-                if (read == 0) {
-                    if (offset != len) {
-                        throw new InvalidOperationException("Internal error. Fewer bytes than stream.Length read.");
-                    }
-                    break;
-                }
-            } 
+            byte[] spirv = new byte[stream.Length];
+            stream.ReadExactly(spirv);
             return spirv;
         }
 
@@ -35,14 +35,8 @@ public sealed class GLShaderInstanceBacking : IShaderInstanceBacking
     public void PrepareAndBindVertexArrayObject(IVertexBufferLayout layout, IUntypedVertexBufferAdapter adapter)
     {
         VertexArray vao = _vaos[_renderer.WorkingFrame];
-            
-        // Note: This will throw a cast exception if any of the buffers are not a GLBuffer.
-        // Which is correct, mixing buffers meant for different renderer types is bad.
-        // TODO: However, maybe we could surface this issue a bit more gracefully?
-        foreach (IGLBuffer? buffer in adapter.VertexBuffers) {
-            buffer?.Commit();
-        }
 
+        // Note: This also commits the vertex buffers.
         vao.RecreateIfNecesaryAndBind(Shader, layout, adapter);
     }
 
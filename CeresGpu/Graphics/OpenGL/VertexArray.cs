@@ -12,7 +12,8 @@ namespace CeresGpu.Graphics.OpenGL
 
         public uint Handle => _handle;
 
-        private readonly List<uint> _prevVertexBufferHandles = new();
+        private uint[] _vertexBufferHandles = [];
+        private uint[] _prevVertexBufferHandles = [];
 
         public VertexArray(IGLProvider glProvider)
         {
@@ -26,22 +27,18 @@ namespace CeresGpu.Graphics.OpenGL
         {
             GL gl = _glProvider.Gl;
 
-            ReadOnlySpan<object?> buffers = adapter.VertexBuffers;
+            int bufferCount = adapter.VertexBufferCount;
+            if (_vertexBufferHandles.Length != bufferCount) {
+                _vertexBufferHandles = new uint[bufferCount];
+            }
+            CommitAndGetHandlesVisitor handlesVisitor = new(_vertexBufferHandles);
+            adapter.VisitVertexBuffers(ref handlesVisitor);
+            ReadOnlySpan<uint> bufferHandles = _vertexBufferHandles;
             
-            if (_prevVertexBufferHandles.Count == buffers.Length) {
-                bool same = true;
-                for (int i = 0, ilen = _prevVertexBufferHandles.Count; i < ilen; ++i) {
-                    IGLBuffer? buffer = adapter.VertexBuffers[i] as IGLBuffer;
-                    if (_prevVertexBufferHandles[i] != buffer?.GetHandleForCurrentFrame()) {
-                        same = false;
-                        break;
-                    }
-                }
-                if (same) {
-                    // Buffers have not changed, VAO is still valid.
-                    gl.BindVertexArray(_handle);
-                    return;
-                }
+            if (bufferHandles.SequenceEqual(_prevVertexBufferHandles)) {
+                // Buffers have not changed, VAO is still valid.
+                gl.BindVertexArray(_handle);
+                return;
             }
             
             Span<uint> pVao = stackalloc uint[1] { _handle };
@@ -62,17 +59,17 @@ namespace CeresGpu.Graphics.OpenGL
                     // TODO: Should this log an error or something?
                     continue;
                 }
-                if (attributeDescriptor.BufferIndex > buffers.Length) {
+                if (attributeDescriptor.BufferIndex >= bufferHandles.Length) {
                     // TODO: Should this log an error or something?
                     continue;
                 }
-                if (attributeDescriptor.BufferIndex > bufferDescriptors.Length) {
+                if (attributeDescriptor.BufferIndex >= bufferDescriptors.Length) {
                     // TODO: Should this log an error or something?
                     continue;
                 }
                 
-                IGLBuffer? buffer = buffers[(int)attributeDescriptor.BufferIndex] as IGLBuffer;
-                if (buffer == null) {
+                uint bufferHandle = bufferHandles[(int)attributeDescriptor.BufferIndex];
+                if (bufferHandle == 0) {
                     // TODO: This should log an error?
                     continue;
                 }
@@ -81,14 +78,37 @@ namespace CeresGpu.Graphics.OpenGL
                 ref readonly ShaderVertexAttributeDescriptor shaderAttributeDescriptor = ref shaderAttributes[(int)shaderAttributeIndex];
                 
                 gl.EnableVertexAttribArray(shaderAttributeIndex);
-                gl.BindBuffer(BufferTargetARB.ARRAY_BUFFER, buffer.GetHandleForCurrentFrame());
+                gl.BindBuffer(BufferTargetARB.ARRAY_BUFFER, bufferHandle);
                 SetAttribute(gl, shaderAttributeIndex, shaderAttributeDescriptor, attributeDescriptor, bufferDescriptor);
                 gl.VertexAttribDivisor(shaderAttributeIndex, bufferDescriptor.StepFunction == VertexStepFunction.PerInstance ? 1u : 0u);
             }
 
-            _prevVertexBufferHandles.Clear();
-            foreach (IGLBuffer? buffer in buffers) {
-                _prevVertexBufferHandles.Add(buffer?.GetHandleForCurrentFrame() ?? 0);
+            // Swap rather than copy, the current handles get overwritten on the next call anyway.
+            (_prevVertexBufferHandles, _vertexBufferHandles) = (_vertexBufferHandles, _prevVertexBufferHandles);
+        }
+        
+        private readonly struct CommitAndGetHandlesVisitor : IVertexBufferVisitor
+        {
+            private readonly uint[] _handles;
+
+            public CommitAndGetHandlesVisitor(uint[] handles)
+            {
+                _handles = handles;
+            }
+            
+            public void Visit(int index, IBuffer? buffer)
+            {
+                if (buffer == null) {
+                    _handles[index] = 0;
+                    return;
+                }
+                
+                // Note: This will throw a cast exception if the buffer is not a GLBuffer.
+                // Which is correct, mixing buffers meant for different renderer types is bad.
+                // TODO: However, maybe we could surface this issue a bit more gracefully?
+                IGLBuffer glBuffer = (IGLBuffer)buffer;
+                glBuffer.Commit();
+                _handles[index] = glBuffer.GetHandleForCurrentFrame();
             }
         }
         
@@ -173,8 +193,8 @@ namespace CeresGpu.Graphics.OpenGL
                 VertexFormat.Int4 => 4,
                 VertexFormat.UInt4 => 4
                 
-                , VertexFormat.Int1010102Normalized => 1
-                , VertexFormat.UInt1010102Normalized => 1
+                , VertexFormat.Int1010102Normalized => 4
+                , VertexFormat.UInt1010102Normalized => 4
                 , VertexFormat.UChar4Normalized_BGRA => (int)PixelFormat.BGRA
                 , VertexFormat.Invalid => 0
                 , _ => throw new ArgumentOutOfRangeException()
@@ -254,7 +274,7 @@ namespace CeresGpu.Graphics.OpenGL
                 case VertexFormat.UShort2Normalized:
                 case VertexFormat.UShort3Normalized:
                 case VertexFormat.UShort4Normalized:
-                    gl.glVertexAttribPointer(index, size, (uint)VertexAttribType.SHORT, true, stride, offset);
+                    gl.glVertexAttribPointer(index, size, (uint)VertexAttribType.UNSIGNED_SHORT, true, stride, offset);
                     break;
                 
                 case VertexFormat.Half:
@@ -280,7 +300,7 @@ namespace CeresGpu.Graphics.OpenGL
                     gl.glVertexAttribPointer(index, size, (uint)VertexAttribType.UNSIGNED_INT_2_10_10_10_REV, true, stride, offset);
                     break;
                 case VertexFormat.UChar4Normalized_BGRA:
-                    gl.glVertexAttribPointer(index, size, (uint)VertexAttribType.FLOAT, true, stride, offset);
+                    gl.glVertexAttribPointer(index, size, (uint)VertexAttribType.UNSIGNED_BYTE, true, stride, offset);
                     break;
                 default:
                     throw new ArgumentOutOfRangeException();
@@ -94,8 +94,15 @@ public abstract class PassEncoder : IPass
             CommitBufferOrThrow(buffer);
         }
         
-        foreach (object? untypedBuff in CurrentShaderInstance.VertexBufferAdapter.VertexBuffers) {
-            if (untypedBuff is IBuffer buffer) {
+        CommitVertexBufferVisitor commitVisitor = new();
+        CurrentShaderInstance.VertexBufferAdapter.VisitVertexBuffers(ref commitVisitor);
+    }
+    
+    private struct CommitVertexBufferVisitor : IVertexBufferVisitor
+    {
+        public void Visit(int index, IBuffer? buffer)
+        {
+            if (buffer != null) {
                 CommitBufferOrThrow(buffer);
             }
         }
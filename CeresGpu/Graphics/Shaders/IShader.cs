@@ -15,6 +15,18 @@ namespace CeresGpu.Graphics.Shaders
         IShaderBacking? Backing { get; set; }
         Stream? GetShaderResource(string postfix);
         
+        /// <summary>
+        /// The kinds of compiled shader code that can be retrieved with <see cref="GetShaderResource"/>.
+        /// </summary>
+        ShaderArtifacts Artifacts { get; }
+        
+        /// <summary>
+        /// Hash of the shader's vertex inputs, descriptor layout and compiled code, computed when the shader was
+        /// generated. It is stable across runs, so it can be used together with
+        /// <see cref="IVertexBufferLayout.LayoutHash"/> to key an in-memory or on-disk pipeline cache.
+        /// </summary>
+        ulong InterfaceHash { get; }
+        
         /// <summary>
         /// Get the vertex attribute descriptors of this shader. 
         /// The elements in the returned span must correspond exactly with the shader's vertex attribute indices.
@@ -0,0 +1,158 @@
+using System;
+using System.Collections.Generic;
+using System.IO;
+using System.IO.Compression;
+using System.Reflection;
+using System.Runtime.CompilerServices;
+using System.Text;
+
+namespace CeresGpu.Graphics.Shaders
+{
+    /// <summary>
+    /// Reads the shader archive that ggen packs all compiled shader code of an assembly into.
+    /// Uncompressed entries are handed out as streams over the assembly's own resource memory, without copying.
+    /// The format is described in ggen/shaderarchive.py.
+    /// </summary>
+    public sealed class ShaderArchive
+    {
+        /// <summary>
+        /// Logical name of the embedded resource holding the archive.
+        /// </summary>
+        public const string ResourceName = "CeresGpu.ShaderArchive";
+        
+        private const uint Magic = 0x41534743; // "CGSA"
+        private const uint Version = 1;
+        private const byte EntryFlagDeflate = 1;
+
+        private readonly struct Entry
+        {
+            public readonly byte Flags;
+            public readonly int Offset;
+            public readonly int StoredSize;
+            public readonly int Size;
+
+            public Entry(byte flags, int offset, int storedSize, int size)
+            {
+                Flags = flags;
+                Offset = offset;
+                StoredSize = storedSize;
+                Size = size;
+            }
+        }
+
+        private static readonly ConditionalWeakTable<Assembly, ShaderArchive?> _archivesByAssembly = new();
+        private static readonly object _loadLock = new();
+        
+        // Exactly one of these is set. The resource stream is kept around as it owns the memory that entries point to.
+        private readonly UnmanagedMemoryStream? _resourceStream;
+        private readonly byte[]? _bytes;
+        
+        private readonly Dictionary<string, Entry> _entries;
+
+        /// <summary>
+        /// Get the shader archive embedded in the given assembly, or null if it doesn't have one.
+        /// </summary>
+        public static ShaderArchive? Get(Assembly assembly)
+        {
+            lock (_loadLock) {
+                if (!_archivesByAssembly.TryGetValue(assembly, out ShaderArchive? archive)) {
+                    archive = Load(assembly);
+                    _archivesByAssembly.Add(assembly, archive);
+                }
+                return archive;
+            }
+        }
+
+        private static ShaderArchive? Load(Assembly assembly)
+        {
+            Stream? stream = assembly.GetManifestResourceStream(ResourceName);
+            if (stream == null) {
+                return null;
+            }
+            
+            // Resources of assemblies loaded from disk are memory mapped, and come back as UnmanagedMemoryStreams.
+            if (stream is UnmanagedMemoryStream unmanagedStream) {
+                return new ShaderArchive(unmanagedStream);
+            }
+            
+            using (stream) {
+                byte[] bytes = new byte[stream.Length];
+                stream.ReadExactly(bytes);
+                return new ShaderArchive(bytes);
+            }
+        }
+        
+        private ShaderArchive(UnmanagedMemoryStream resourceStream)
+        {
+            _resourceStream = resourceStream;
+            _entries = ReadEntries(resourceStream);
+        }
+
+        private ShaderArchive(byte[] bytes)
+        {
+            _bytes = bytes;
+            using MemoryStream stream = new(bytes, false);
+            _entries = ReadEntries(stream);
+        }
+
+        private static Dictionary<string, Entry> ReadEntries(Stream stream)
+        {
+            using BinaryReader reader = new(stream, Encoding.UTF8, leaveOpen: true);
+            if (reader.ReadUInt32() != Magic) {
+                throw new InvalidDataException("Shader archive has an invalid header.");
+            }
+            uint version = reader.ReadUInt32();
+            if (version != Version) {
+                throw new InvalidDataException($"Unsupported shader archive version {version}. Rebuild the shaders with a matching ggen.");
+            }
+            
+            int count = (int)reader.ReadUInt32();
+            Dictionary<string, Entry> entries = new(count);
+            for (int i = 0; i < count; ++i) {
+                int nameLength = reader.ReadUInt16();
+                string name = Encoding.UTF8.GetString(reader.ReadBytes(nameLength));
+                byte flags = reader.ReadByte();
+                int offset = (int)reader.ReadUInt32();
+                int storedSize = (int)reader.ReadUInt32();
+                int size = (int)reader.ReadUInt32();
+                if ((long)offset + storedSize > stream.Length) {
+                    throw new InvalidDataException($"Shader archive entry {name} is out of bounds.");
+                }
+                entries[name] = new Entry(flags, offset, storedSize, size);
+            }
+            return entries;
+        }
+
+        /// <summary>
+        /// Open the entry with the given name, or return null if there is no such entry.
+        /// The returned stream always supports Length.
+        /// </summary>
+        public Stream? OpenEntry(string name)
+        {
+            if (!_entries.TryGetValue(name, out Entry entry)) {
+                return null;
+            }
+
+            Stream stored = OpenStored(entry);
+            if ((entry.Flags & EntryFlagDeflate) == 0) {
+                return stored;
+            }
+
+            byte[] decompressed = new byte[entry.Size];
+            using (DeflateStream deflateStream = new(stored, CompressionMode.Decompress)) {
+                deflateStream.ReadExactly(decompressed);
+            }
+            return new MemoryStream(decompressed, false);
+        }
+
+        private unsafe Stream OpenStored(in Entry entry)
+        {
+            if (_resourceStream != null) {
+                // Point straight into the assembly's resource memory.
+                byte* start = _resourceStream.PositionPointer - _resourceStream.Position + entry.Offset;
+                return new UnmanagedMemoryStream(start, entry.StoredSize);
+            }
+            return new MemoryStream(_bytes!, entry.Offset, entry.StoredSize, false);
+        }
+    }
+}
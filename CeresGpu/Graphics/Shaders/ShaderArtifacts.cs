@@ -0,0 +1,32 @@
+using System;
+
+namespace CeresGpu.Graphics.Shaders;
+
+/// <summary>
+/// The kinds of compiled shader code a shader ships with.
+/// </summary>
+[Flags]
+public enum ShaderArtifacts
+{
+    None = 0,
+    
+    /// <summary>
+    /// GLSL source for OpenGL, per stage (.vert_gl.glsl, .frag_gl.glsl).
+    /// </summary>
+    GLSource = 1 << 0,
+    
+    /// <summary>
+    /// SPIR-V for OpenGL 4.6, per stage (.vert_gl.spv, .frag_gl.spv).
+    /// </summary>
+    GLSpirv = 1 << 1,
+    
+    /// <summary>
+    /// Linked SPIR-V module for Vulkan (.vulkan).
+    /// </summary>
+    VulkanSpirv = 1 << 2,
+    
+    /// <summary>
+    /// Metal shading language source, per stage (.vert.metal, .frag.metal).
+    /// </summary>
+    MetalSource = 1 << 3,
+}
@@ -0,0 +1,11 @@
+using System.Runtime.InteropServices;
+
+namespace CeresGpu.Graphics
+{
+    [StructLayout(LayoutKind.Explicit, Size=8)]
+    public struct UIntVector2
+    {
+        [FieldOffset(0)] public uint X;
+        [FieldOffset(4)] public uint Y;
+    }
+}
\ No newline at end of file
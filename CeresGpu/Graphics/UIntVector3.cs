@@ -0,0 +1,12 @@
+using System.Runtime.InteropServices;
+
+namespace CeresGpu.Graphics
+{
+    [StructLayout(LayoutKind.Explicit, Size=12)]
+    public struct UIntVector3
+    {
+        [FieldOffset(0)] public uint X;
+        [FieldOffset(4)] public uint Y;
+        [FieldOffset(8)] public uint Z;
+    }
+}
\ No newline at end of file
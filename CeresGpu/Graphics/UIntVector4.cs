@@ -0,0 +1,13 @@
+using System.Runtime.InteropServices;
+
+namespace CeresGpu.Graphics
+{
+    [StructLayout(LayoutKind.Explicit, Size=16)]
+    public struct UIntVector4
+    {
+        [FieldOffset(0)] public uint X;
+        [FieldOffset(4)] public uint Y;
+        [FieldOffset(8)] public uint Z;
+        [FieldOffset(12)] public uint W;
+    }
+}
\ No newline at end of file
@@ -0,0 +1,24 @@
+﻿using Silk.NET.Vulkan;
+using VkDescriptorType = Silk.NET.Vulkan.DescriptorType;
+
+namespace CeresGpu.Graphics.Vulkan;
+
+/// <summary>
+/// Implemented by generated shaders to provide Vulkan descriptor set layout data that was computed when the shader
+/// was generated, so that <see cref="VulkanShaderBacking"/> doesn't have to derive it from
+/// <see cref="Shaders.IShader.GetDescriptors"/>.
+///
+/// The returned arrays are shared by all backings of the shader, and must not be modified.
+/// </summary>
+public interface IVulkanBakedShader
+{
+    /// <summary>
+    /// The layout bindings of each descriptor set, indexed by set. Sets without any descriptors have an empty array.
+    /// </summary>
+    DescriptorSetLayoutBinding[][] VulkanDescriptorSetLayoutBindings { get; }
+    
+    /// <summary>
+    /// The number of descriptors of each type in each descriptor set, indexed by set.
+    /// </summary>
+    (VkDescriptorType, int)[][] VulkanDescriptorCountsBySet { get; }
+}
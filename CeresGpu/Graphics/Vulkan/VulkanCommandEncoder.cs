@@ -208,23 +208,36 @@ public sealed class VulkanCommandEncoder : PassEncoder, IVulkanCommandEncoder, I
         VulkanShaderInstanceBacking vulkanShaderInstanceBacking = (VulkanShaderInstanceBacking)CurrentShaderInstance.Backing;
         vulkanShaderInstanceBacking.Update();
         
-        ReadOnlySpan<object?> vertexBuffers = CurrentShaderInstance.VertexBufferAdapter.VertexBuffers;
-            
-        for (int i = 0, ilen = vertexBuffers.Length; i < ilen; ++i) {
+        BindVertexBufferVisitor bindVisitor = new(_renderer.Vk, _commandBuffer);
+        CurrentShaderInstance.VertexBufferAdapter.VisitVertexBuffers(ref bindVisitor);
+    }
+    
+    private readonly struct BindVertexBufferVisitor : IVertexBufferVisitor
+    {
+        private readonly Vk _vk;
+        private readonly CommandBuffer _commandBuffer;
+
+        public BindVertexBufferVisitor(Vk vk, CommandBuffer commandBuffer)
+        {
+            _vk = vk;
+            _commandBuffer = commandBuffer;
+        }
+        
+        public void Visit(int index, IBuffer? untypedVertexBuffer)
+        {
             // No vertex buffer set.
             // TODO: log to let the user know they didn't set a vertex buffer.
-            object? untypedVertexBuffer = vertexBuffers[i];
             if (untypedVertexBuffer == null) {
-                continue;
+                return;
             }
             if (untypedVertexBuffer is IVulkanBuffer buffer) {
                 buffer.Commit();
                 // TODO: Get clever and reduce this to a single vkCmdBindVertexBuffers call.
                 Buffer bufferHandle = buffer.GetBufferForCurrentFrame();
                 ulong offset = 0;  
-                _renderer.Vk.CmdBindVertexBuffers(_commandBuffer, (uint)i, 1, in bufferHandle, in offset);
+                _vk.CmdBindVertexBuffers(_commandBuffer, (uint)index, 1, in bufferHandle, in offset);
             } else {
-                throw new InvalidOperationException($"Buffer returned by vertex buffer adapter at index {i} is not compatible with VulkanCommandEncoder.");
+                throw new InvalidOperationException($"Buffer returned by vertex buffer adapter at index {index} is not compatible with VulkanCommandEncoder.");
             }
         }
     }
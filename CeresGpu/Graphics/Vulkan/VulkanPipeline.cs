@@ -301,8 +301,8 @@ public class VulkanPipeline<TShader, TVertexBufferLayout> : IPipeline<TShader, T
             VertexFormat.UInt2 => Format.R32G32Uint,
             VertexFormat.UInt3 => Format.R32G32B32Uint,
             VertexFormat.UInt4 => Format.R32G32B32A32Uint,
-            VertexFormat.Int1010102Normalized => Format.A2B10G10R10SintPack32,
-            VertexFormat.UInt1010102Normalized => Format.A2B10G10R10UintPack32,
+            VertexFormat.Int1010102Normalized => Format.A2B10G10R10SNormPack32,
+            VertexFormat.UInt1010102Normalized => Format.A2B10G10R10UnormPack32,
             VertexFormat.UChar4Normalized_BGRA => Format.B8G8R8A8Unorm,
             VertexFormat.UChar => Format.R8Uint,
             VertexFormat.Char => Format.R8Sint,
@@ -310,8 +310,8 @@ public class VulkanPipeline<TShader, TVertexBufferLayout> : IPipeline<TShader, T
             VertexFormat.CharNormalized => Format.R8SNorm,
             VertexFormat.UShort => Format.R16Uint,
             VertexFormat.Short => Format.R16Sint,
-            VertexFormat.UShortNormalized => Format.R16SNorm,
-            VertexFormat.ShortNormalized => Format.R16Unorm,
+            VertexFormat.UShortNormalized => Format.R16Unorm,
+            VertexFormat.ShortNormalized => Format.R16SNorm,
             VertexFormat.Half => Format.R16Sfloat,
             _ => throw new ArgumentOutOfRangeException(nameof(vertexFormat), vertexFormat, null)
         };
@@ -31,74 +31,44 @@ public class VulkanShaderBacking : IShaderBacking
         // Create the shader module.
         //
         
-        using MemoryStream memoryStream = new();
-        Stream? stream = shader.GetShaderResource(".vulkan");
+        using Stream? stream = shader.GetShaderResource(".vulkan");
         if (stream == null) {
             throw new InvalidOperationException("Cannot find vulkan shader binary.");
         }
-        stream.CopyTo(memoryStream);
 
-        byte[] bytes = memoryStream.ToArray();
-        fixed (byte* pBytes = bytes) {
-            ShaderModuleCreateInfo moduleCreateInfo = new(
-                StructureType.ShaderModuleCreateInfo,
-                pNext: null,
-                flags: ShaderModuleCreateFlags.None,
-                codeSize: (nuint)bytes.Length, // Yes, this is size in bytes, despite pCode being a uint pointer.
-                pCode: (uint*)pBytes // Yes, it's a uint pointer, not a byte or void pointer.
-            );
-
-            Result createResult = vk.CreateShaderModule(renderer.Device, in moduleCreateInfo, null, out ShaderModule);
-            if (createResult != Result.Success) {
-                Console.Error.WriteLine($"Failed to create shader module: {createResult}");
+        // Resources from the shader archive point straight into the assembly's memory, so use them in place when the
+        // code is suitably aligned.
+        if (stream is UnmanagedMemoryStream unmanagedStream && ((nuint)unmanagedStream.PositionPointer & 3) == 0) {
+            ShaderModule = CreateShaderModule(vk, renderer.Device, unmanagedStream.PositionPointer, (nuint)unmanagedStream.Length);
+        } else {
+            byte[] bytes = new byte[stream.Length];
+            stream.ReadExactly(bytes);
+            fixed (byte* pBytes = bytes) {
+                ShaderModule = CreateShaderModule(vk, renderer.Device, pBytes, (nuint)bytes.Length);
             }
         }
         
-        ReadOnlySpan<DescriptorInfo> descriptors = shader.GetDescriptors();
-        
         //
-        // How many descriptor sets do we need?
+        // Get the bindings and descriptor counts of each descriptor set. Generated shaders have these baked in, 
+        // otherwise derive them from the shader's descriptors.
         //
-        // TODO: Can this count be baked into the generated shader?
-        uint numDescriptorSets = 0;
-        for (int descriptorIndex = 0; descriptorIndex < descriptors.Length; ++descriptorIndex) {
-            ref readonly DescriptorInfo descriptorInfo = ref descriptors[descriptorIndex];
-            VulkanDescriptorBindingInfo binding = (VulkanDescriptorBindingInfo)descriptorInfo.Binding;
-            numDescriptorSets = Math.Max(binding.Set + 1, numDescriptorSets);
+        DescriptorSetLayoutBinding[][] bindingsBySet;
+        if (shader is IVulkanBakedShader bakedShader) {
+            bindingsBySet = bakedShader.VulkanDescriptorSetLayoutBindings;
+            _descriptorCountsBySet = bakedShader.VulkanDescriptorCountsBySet;
+        } else {
+            BuildDescriptorSetLayoutBindings(shader.GetDescriptors(), out bindingsBySet, out _descriptorCountsBySet);
         }
+        
+        uint numDescriptorSets = (uint)bindingsBySet.Length;
         _descriptorSetLayouts = new DescriptorSetLayout[numDescriptorSets];
-        _descriptorCountsBySet = new (VkDescriptorType, int)[numDescriptorSets][];
         NumDescriptorSets = numDescriptorSets;
 
         //
         // Create the layouts
         //
         for (int descriptorSetIndex = 0; descriptorSetIndex < numDescriptorSets; ++descriptorSetIndex) {
-            List<DescriptorSetLayoutBinding> bindings = [];
-            Dictionary<DescriptorType, int> descriptorCounts = [];
-            
-            for (int descriptorIndex = 0; descriptorIndex < descriptors.Length; ++descriptorIndex) {
-                ref readonly DescriptorInfo descriptorInfo = ref descriptors[descriptorIndex];
-                VulkanDescriptorBindingInfo binding = (VulkanDescriptorBindingInfo)descriptorInfo.Binding;
-
-                // TODO: This loop is inefficient with multiple descriptor sets.
-                if (binding.Set != descriptorSetIndex) {
-                    continue;
-                }
-                
-                bindings.Add(new DescriptorSetLayoutBinding(
-                    binding: binding.Binding,
-                    descriptorType: TranslateDescriptorType(descriptorInfo.DescriptorType),
-                    descriptorCount: 1,
-                    ShaderStageFlags.VertexBit | ShaderStageFlags.FragmentBit,
-                    pImmutableSamplers: null
-                ));
-                
-                descriptorCounts.TryAdd(descriptorInfo.DescriptorType, 0);
-                descriptorCounts[descriptorInfo.DescriptorType]++;
-            }
-
-            DescriptorSetLayoutBinding[] bindingsArray = bindings.ToArray();
+            DescriptorSetLayoutBinding[] bindingsArray = bindingsBySet[descriptorSetIndex];
             fixed (DescriptorSetLayoutBinding* pLayoutBindings = bindingsArray) {
                 DescriptorSetLayoutCreateInfo layoutCreateInfo = new(
                     StructureType.DescriptorSetLayoutCreateInfo,
@@ -110,10 +80,6 @@ public class VulkanShaderBacking : IShaderBacking
             
                 vk.CreateDescriptorSetLayout(renderer.Device, in layoutCreateInfo, null, out _descriptorSetLayouts[descriptorSetIndex])
                     .AssertSuccess("Failed to create descriptor set layout");
-                
-                _descriptorCountsBySet[descriptorSetIndex] = descriptorCounts
-                    .Select(kvp => (TranslateDescriptorType(kvp.Key), kvp.Value))
-                    .ToArray();
             }
         }
         
@@ -154,6 +120,74 @@ public class VulkanShaderBacking : IShaderBacking
     }
     
 
+    private static unsafe ShaderModule CreateShaderModule(Vk vk, Device device, byte* code, nuint codeSize)
+    {
+        ShaderModuleCreateInfo moduleCreateInfo = new(
+            StructureType.ShaderModuleCreateInfo,
+            pNext: null,
+            flags: ShaderModuleCreateFlags.None,
+            codeSize: codeSize, // Yes, this is size in bytes, despite pCode being a uint pointer.
+            pCode: (uint*)code // Yes, it's a uint pointer, not a byte or void pointer.
+        );
+
+        Result createResult = vk.CreateShaderModule(device, in moduleCreateInfo, null, out ShaderModule shaderModule);
+        if (createResult != Result.Success) {
+            Console.Error.WriteLine($"Failed to create shader module: {createResult}");
+        }
+        return shaderModule;
+    }
+
+    /// <summary>
+    /// Derive the descriptor set layout bindings and descriptor counts of each descriptor set from the given
+    /// descriptors. Only used for shaders which don't implement <see cref="IVulkanBakedShader"/>.
+    /// </summary>
+    private static unsafe void BuildDescriptorSetLayoutBindings(ReadOnlySpan<DescriptorInfo> descriptors,
+        out DescriptorSetLayoutBinding[][] bindingsBySet, out (VkDescriptorType, int)[][] descriptorCountsBySet)
+    {
+        //
+        // How many descriptor sets do we need?
+        //
+        uint numDescriptorSets = 0;
+        for (int descriptorIndex = 0; descriptorIndex < descriptors.Length; ++descriptorIndex) {
+            ref readonly DescriptorInfo descriptorInfo = ref descriptors[descriptorIndex];
+            VulkanDescriptorBindingInfo binding = (VulkanDescriptorBindingInfo)descriptorInfo.Binding;
+            numDescriptorSets = Math.Max(binding.Set + 1, numDescriptorSets);
+        }
+        bindingsBySet = new DescriptorSetLayoutBinding[numDescriptorSets][];
+        descriptorCountsBySet = new (VkDescriptorType, int)[numDescriptorSets][];
+
+        for (int descriptorSetIndex = 0; descriptorSetIndex < numDescriptorSets; ++descriptorSetIndex) {
+            List<DescriptorSetLayoutBinding> bindings = [];
+            Dictionary<DescriptorType, int> descriptorCounts = [];
+            
+            for (int descriptorIndex = 0; descriptorIndex < descriptors.Length; ++descriptorIndex) {
+                ref readonly DescriptorInfo descriptorInfo = ref descriptors[descriptorIndex];
+                VulkanDescriptorBindingInfo binding = (VulkanDescriptorBindingInfo)descriptorInfo.Binding;
+
+                // TODO: This loop is inefficient with multiple descriptor sets.
+                if (binding.Set != descriptorSetIndex) {
+                    continue;
+                }
+                
+                bindings.Add(new DescriptorSetLayoutBinding(
+                    binding: binding.Binding,
+                    descriptorType: TranslateDescriptorType(descriptorInfo.DescriptorType),
+                    descriptorCount: 1,
+                    ShaderStageFlags.VertexBit | ShaderStageFlags.FragmentBit,
+                    pImmutableSamplers: null
+                ));
+                
+                descriptorCounts.TryAdd(descriptorInfo.DescriptorType, 0);
+                descriptorCounts[descriptorInfo.DescriptorType]++;
+            }
+
+            bindingsBySet[descriptorSetIndex] = bindings.ToArray();
+            descriptorCountsBySet[descriptorSetIndex] = descriptorCounts
+                .Select(kvp => (TranslateDescriptorType(kvp.Key), kvp.Value))
+                .ToArray();
+        }
+    }
+
     private static VkDescriptorType TranslateDescriptorType(DescriptorType descriptorType)
     {
         return descriptorType switch {
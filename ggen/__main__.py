@@ -1,60 +1,181 @@
+import time
+# Before the other imports, so that --timings can report how long they take.
+IMPORT_STARTED_AT = time.perf_counter()
+
 import argparse
+import fnmatch
 import glob
+import hashlib
 import json
 import os
 import re
 import sys
-import subprocess
-from typing import Dict, List, Tuple
+from collections import deque
+from typing import Dict, List, Tuple, Callable, Any, Optional, Iterable, Set, Union, TYPE_CHECKING
 
 from .graph import Graph, Node
-from . import genbuffers
 from . import genshaders
-from . import validate
-from .genbuffers import Vertex
-from .genshaders import SpirvReflection, ShaderStage, ArgumentBufferBinding
+from .genshaders import SpirvReflection, ShaderStage, ArgumentBufferBinding, SpirvOptPreset, ShaderDirectives
+
+# Everything a no-op build doesn't need is imported where it's first used instead: the buffer definitions, validate, 
+# the shader archive, the remote workers and subprocess.
+if TYPE_CHECKING:
+    from . import remote
+    from .genbuffers import Vertex
+
+IMPORTED_AT = time.perf_counter()
 
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument('root')
 
-argparser.add_argument('--files', help="List of file paths to glsl files. Optional, used by msbuild target. "
-                                       "The list of files is a single argument, delimited by semicolons.")
+argparser.add_argument('--files', help="List of file paths to glsl and .buffer.json files. Optional, used by msbuild "
+                                       "target. The list of files is a single argument, delimited by semicolons.")
 
-argparser.add_argument('--ggen-script-files')
+argparser.add_argument('--ggen-script-files',
+                       help='Unused. Changes to ggen are detected per action, see Action.')
 
 argparser.add_argument('--rebuild', default=False, action='store_true')
 
 argparser.add_argument('--output-dir',
                        help='Directory to output generated cs files to.')
 
+argparser.add_argument('--spirv-opt', default='none', choices=['none', 'performance', 'size'],
+                       help='spirv-opt preset used for shaders which don\'t specify one with a '
+                            '"// #SpirvOpt: <none|performance|size>" directive. Defaults to none.')
+
+argparser.add_argument('--shader-archive',
+                       help='Path of a shader archive to pack all compiled shader code into, so that it can be '
+                            'embedded as a single resource. Relative paths are relative to the output dir.')
+
+argparser.add_argument('--target', action='append', default=[],
+                       help='Only build this output and what it depends on. Can be a path or a glob pattern, relative '
+                            'to the working directory or the output dir. Can be given multiple times.')
+
+argparser.add_argument('--backends', default='gl,metal,vulkan',
+                       help='Comma separated list of backends to build shader code for, out of gl, metal and vulkan. '
+                            'Metal sources are still generated for the C# code, which depends on them. '
+                            'Defaults to all.')
+
+argparser.add_argument('--shader-archive-compression', default='none', choices=['none', 'deflate'],
+                       help='Compression used for entries of the shader archive. Uncompressed entries can be used '
+                            'without copying them out of the assembly. Defaults to none.')
+
+
+argparser.add_argument('--workers',
+                       help='Comma separated host:port list of workers (see ggen/remote.py) to run the compile and '
+                            'cross compile actions on, in parallel.')
+
+argparser.add_argument('--spawn-workers', type=int, default=0,
+                       help='Start this many workers on localhost to run actions on, in addition to --workers.')
+
+argparser.add_argument('--worker-jobs', type=int, default=4,
+                       help='Number of actions to run at once on each worker. Defaults to 4.')
+
+argparser.add_argument('--keep-going', default=False, action='store_true',
+                       help='Keep building what doesn\'t depend on a failed action, and report the errors of all failed '
+                            'actions at the end.')
+
+argparser.add_argument('--timings', default=False, action='store_true',
+                       help='Print how long importing ggen, building the graph and finding what\'s dirty took. A no-op '
+                            'build should stay within a few tens of milliseconds.')
+
+argparser.add_argument('--tools-dir',
+                       help='Directory containing glslangValidator, spirv-cross, spirv-link and spirv-opt. Defaults to '
+                            'the tools staged by the MSBuild target.')
+
 
 binaries_path = os.path.normpath(os.path.join(__file__, '..', '..', 'CeresGpu', 'obj', 'staged_tools'))
 EXE_POSTFIX = '.exe' if sys.platform.lower() == 'win32' else ''
 GLSLANG_BINARY = os.path.join(binaries_path, 'glslangValidator' + EXE_POSTFIX)
 SPIRV_CROSS_BINARY = os.path.join(binaries_path, 'spirv-cross' + EXE_POSTFIX)
 SPIRV_LINK_BINARY = os.path.join(binaries_path, 'spirv-link' + EXE_POSTFIX)
+SPIRV_OPT_BINARY = os.path.join(binaries_path, 'spirv-opt' + EXE_POSTFIX)
+
 
+def set_tools_dir(path: str):
+    global GLSLANG_BINARY, SPIRV_CROSS_BINARY, SPIRV_LINK_BINARY, SPIRV_OPT_BINARY
+    GLSLANG_BINARY = os.path.join(path, 'glslangValidator' + EXE_POSTFIX)
+    SPIRV_CROSS_BINARY = os.path.join(path, 'spirv-cross' + EXE_POSTFIX)
+    SPIRV_LINK_BINARY = os.path.join(path, 'spirv-link' + EXE_POSTFIX)
+    SPIRV_OPT_BINARY = os.path.join(path, 'spirv-opt' + EXE_POSTFIX)
 
-def parse_buffers(root: str) -> Dict[str, Vertex]:
-    paths = glob.glob('**/*.buffer.json', recursive=True, root_dir=root)
 
+def parse_buffers(paths: List[str]) -> Dict[str, Tuple[str, 'Vertex']]:
+    """
+    Parses the given buffer definition files, returning each vertex definition and the path of the file defining it by
+    the name shaders refer to it with.
+    """
+    from . import genbuffers
     buffers = {}
 
     for path in paths:
-        print(f'Parsing buffer at {path}')
-        with open(path, encoding='utf-8-sig') as f:
-            buffer_data = json.load(f)
-        buffer = genbuffers.parse_buffer(buffer_data)
-        buffers[buffer.name] = buffer
+        for buffer in genbuffers.parse_buffer_file(path):
+            if buffer.name in buffers:
+                raise ValueError(f'Vertex {buffer.name} is defined in both {buffers[buffer.name][0]} and {path}')
+            buffers[buffer.name] = (path, buffer)
 
     return buffers
 
 
+def parse_shared_vertex_structures(path: str) -> List[genshaders.SharedVertexStructure]:
+    from . import genbuffers
+    structures = []
+    for vertex in genbuffers.parse_buffer_file(path):
+        offsets, stride = genbuffers.get_attribute_layout(vertex)
+        structure = genshaders.SharedVertexStructure(f'{vertex.namespace}.{vertex.name}', stride)
+        for attrib, offset in zip(vertex.attributes, offsets):
+            structure.attributes_by_name[attrib.name] = (offset, genbuffers.get_vertex_format(vertex, attrib))
+        structures.append(structure)
+    return structures
+
+
+class ActionFailed(Exception):
+    """
+    An action failed because of its inputs, e.g. a shader which doesn't compile, rather than because of a bug in ggen.
+    output is what the failed tool printed, which diagnostics are parsed from.
+    """
+    def __init__(self, message: str, output: str = ''):
+        super().__init__(message)
+        self.output = output
+
+
+def run_tool(command: List[str], capture_output: bool = False, text: bool = False) -> Union[str, bytes, None]:
+    """
+    Runs a tool, raising ActionFailed when it fails. Returns its output when capture_output is set, otherwise it goes 
+    to ggen's output.
+    """
+    import subprocess
+    result = subprocess.run(command, stdout=subprocess.PIPE, 
+                            stderr=subprocess.PIPE if capture_output else subprocess.STDOUT)
+    if result.returncode != 0:
+        output = result.stdout.decode('utf-8', errors='replace')
+        if capture_output:
+            output += result.stderr.decode('utf-8', errors='replace')
+        raise ActionFailed(f'{os.path.basename(command[0])} failed with exit code {result.returncode}', output)
+    
+    if not capture_output:
+        sys.stdout.write(result.stdout.decode('utf-8', errors='replace'))
+        return None
+    return result.stdout.decode('utf-8') if text else result.stdout
+
+
 def compile_to_spv(node: Node):
     input_path = node.tagged_inputs[0][1].filepath
     output_path = node.filepath
-    subprocess.check_call([GLSLANG_BINARY, '-V', '-o', output_path, input_path])
+    defines = [f'-D{define}' for define in node.options.get('defines', [])]
+    # The depfile lists the files the shader includes, which become inputs of this node on the next run.
+    run_tool([GLSLANG_BINARY, '-V', *defines, '--depfile', get_depfile_path(output_path), 
+              '-o', output_path, input_path])
+    
+    
+def optimize_spv(node: Node):
+    input_path = node.tagged_inputs[0][1].filepath
+    output_path = node.filepath
+    if not os.path.isfile(SPIRV_OPT_BINARY):
+        raise FileNotFoundError(f'spirv-opt is needed to optimize {input_path}, but was not found at {SPIRV_OPT_BINARY}')
+    preset_flag = SPIRV_OPT_PRESET_FLAGS[node.action]
+    run_tool([SPIRV_OPT_BINARY, preset_flag, '--target-env=vulkan1.0', '-o', output_path, input_path])
     
     
 def spv_to_opengl(node: Node):
@@ -64,14 +185,24 @@ def spv_to_opengl(node: Node):
     #     '-Dgl_VertexIndex=gl_VertexID',
     #     '-Dgl_InstanceIndex=gl_InstanceID'
     # ]
-    subprocess.check_call([SPIRV_CROSS_BINARY, '--output', output_path, input_path])
+    run_tool([SPIRV_CROSS_BINARY, '--output', output_path, input_path])
+
+
+def compile_opengl_to_spv(node: Node):
+    mode, input = node.tagged_inputs[0]
+    output_path = node.filepath
+    # Compile the cross compiled GLSL rather than the original source. It already has descriptor sets flattened into 
+    # the plain bindings the GL backend binds to, and Vulkan built-ins swapped for their GL equivalents.
+    run_tool([GLSLANG_BINARY, '-G', '--target-env', 'opengl', '--auto-map-locations', '-S', mode,
+              '-o', output_path, input.filepath])
 
 
 def spv_to_metal(node: Node):
     input_path = node.tagged_inputs[0][1].filepath
     output_path = node.filepath
     
-    metal_source = subprocess.check_output([SPIRV_CROSS_BINARY, input_path, '--msl', '--msl-version', '20000', '--msl-argument-buffers'], text=True)
+    metal_source = run_tool([SPIRV_CROSS_BINARY, input_path, '--msl', '--msl-version', '20000', 
+                             '--msl-argument-buffers'], capture_output=True, text=True)
     with open(output_path, 'w') as f:
         f.write(metal_source)
 
@@ -80,7 +211,7 @@ def spv_to_reflection(node: Node):
     input_path = node.tagged_inputs[0][1].filepath
     output_path = node.filepath
 
-    reflection_json = subprocess.check_output([SPIRV_CROSS_BINARY, input_path, '--reflect'])
+    reflection_json = run_tool([SPIRV_CROSS_BINARY, input_path, '--reflect'], capture_output=True)
     with open(output_path, 'wb') as f:
         f.write(reflection_json)
 
@@ -88,13 +219,97 @@ def spv_to_reflection(node: Node):
 def link_spv_for_vulkan(node: Node):
     input_paths = [node.filepath for tag, node in node.tagged_inputs]
     output_path = node.filepath    
-    subprocess.check_output([SPIRV_LINK_BINARY, '--target-env', 'vulkan1.0', '-o', output_path, *input_paths])
+    run_tool([SPIRV_LINK_BINARY, '--target-env', 'vulkan1.0', '-o', output_path, *input_paths], capture_output=True)
+
 
+def gen_buffers(node: Node):
+    from . import genbuffers
+    buffer_input = node.tagged_inputs[0][1]
+    genbuffers.generate_buffer_file(buffer_input.filepath, node.filepath)
 
-def gen_cs(node: Node):
-    source_inputs = [(t, n) for t, n in node.tagged_inputs if n.action == '']
-    reflection_inputs = [(t, n) for t, n in node.tagged_inputs if n.action == ACTION_SPVCROSS_REFLECT]
+
+def pack_shader_archive(node: Node, compression_name: str):
+    from . import shaderarchive
+    entries = []
+    for entry_name, input in node.tagged_inputs:
+        with open(input.filepath, 'rb') as f:
+            data = f.read()
+        if input.action in SPIRV_ACTIONS:
+            data = shaderarchive.strip_spirv_debug_info(data)
+        entries.append((entry_name, data))
+    
+    with open(node.filepath, 'wb') as f:
+        f.write(shaderarchive.pack_shader_archive(entries, shaderarchive.ArchiveCompression[compression_name]))
+
+
+def get_depfile_path(output_path: str) -> str:
+    return output_path + '.d'
+
+
+DEPFILE_RULE_PATTERN = re.compile(r'(.*?):(?:\s+|$)(.*)')
+DEPFILE_PATH_SEPARATOR_PATTERN = re.compile(r'(?<!\\)\s+')
+
+
+def parse_depfile(path: str) -> List[str]:
+    """
+    Gets the prerequisites listed by a Makefile style depfile, as written by glslangValidator --depfile.
+    """
+    with open(path, encoding='utf-8') as f:
+        # Join lines continued with a backslash.
+        contents = re.sub(r'\\\r?\n', ' ', f.read())
+    
+    prerequisites = []
+    for line in contents.splitlines():
+        match = DEPFILE_RULE_PATTERN.match(line)
+        if not match:
+            continue
+        for prerequisite in DEPFILE_PATH_SEPARATOR_PATTERN.split(match.group(2).strip()):
+            if prerequisite:
+                prerequisites.append(prerequisite.replace('\\ ', ' '))
+    return prerequisites
+
+
+def add_include_inputs(node: Node, include_nodes_by_path: Dict[str, Node]):
+    """
+    Adds the files included by the compile of the given node, as recorded in its depfile by the last compile, as inputs 
+    of the node. Nothing is added before the node was first compiled, but then it's dirty anyway.
+    """
+    depfile_path = get_depfile_path(node.filepath)
+    if not os.path.isfile(depfile_path):
+        return
+    
+    source_paths = {os.path.normcase(os.path.abspath(input.filepath)) for input in node.get_input_nodes()}
+    for include_path in parse_depfile(depfile_path):
+        include_path = os.path.normcase(os.path.abspath(include_path))
+        if include_path in source_paths:
+            continue
+        include_node = include_nodes_by_path.get(include_path)
+        if include_node is None:
+            include_node = Node(include_path, '', [], {'implicit': True})
+            include_nodes_by_path[include_path] = include_node
+        node.tagged_inputs.append(('include', include_node))
+
+
+def get_file_digest(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def get_archive_entry_name(path: str, output_dir: str) -> str:
+    return os.path.relpath(path, output_dir).replace(os.sep, '/')
+
+
+def gen_cs(node: Node, output_dir: str):
+    source_inputs = [(t, n) for t, n in node.tagged_inputs if n.action == '' and t != 'buffer']
+    # Buffer definitions of the vertex structs the shader shares.
+    buffer_inputs = [n for t, n in node.tagged_inputs if t == 'buffer']
+    # Reflection of the default variant is tagged with the stage, that of other variants with the stage and suffix.
+    reflection_inputs = [(t, n) for t, n in node.tagged_inputs if n.action == ACTION_SPVCROSS_REFLECT and '@' not in t]
+    variant_reflection_inputs = [(t, n) for t, n in node.tagged_inputs 
+                                 if n.action == ACTION_SPVCROSS_REFLECT and '@' in t]
     metal_inputs = [(t, n) for t, n in node.tagged_inputs if n.action == ACTION_SPVCROSS_METAL]
+    # Linked Vulkan SPIR-V of each variant, tagged with the variant's suffix.
+    linked_vulkan_inputs = {t: n for t, n in node.tagged_inputs if n.action == ACTION_LINK_VULKAN}
     output_path = node.filepath
 
     # Get output filename without '.generated.cs'
@@ -131,11 +346,35 @@ def gen_cs(node: Node):
         if t == 'vert':
             continue
         directives.descriptor_field_hints_by_name.update(other_directives.descriptor_field_hints_by_name)    
+        directives.writer_struct_names.update(other_directives.writer_struct_names)
+    directives.variant_defines_by_name = merge_variant_defines(directives_by_tag)
         
-    shader = genshaders.Shader(shader_name, directives, reflections)
+    archive_prefix = get_archive_entry_name(os.path.join(os.path.dirname(output_path), shader_name), output_dir)
+    shader = genshaders.Shader(shader_name, archive_prefix, directives, reflections)
+    shader.spirv_digest = get_file_digest(linked_vulkan_inputs[''].filepath)
+    for buffer_input in buffer_inputs:
+        for structure in parse_shared_vertex_structures(buffer_input.filepath):
+            shader.shared_structures_by_name[structure.full_name.split('.')[-1]] = structure
+    
+    variant_reflections_by_suffix: Dict[str, Dict[ShaderStage, SpirvReflection]] = {}
+    for tag, reflection_input in variant_reflection_inputs:
+        mode, suffix = tag.split('@', 1)
+        with open(reflection_input.filepath, 'r') as f:
+            reflection = genshaders.parse_spv_reflection(json.load(f))
+        stage = ShaderStage.VERTEX if mode == 'vert' else ShaderStage.FRAGMENT
+        variant_reflections_by_suffix.setdefault('@' + suffix, {})[stage] = reflection
+    
+    variant_suffixes = get_variant_suffixes(directives.variant_defines_by_name)
+    for variant_name, suffix in variant_suffixes.items():
+        spirv_digest = get_file_digest(linked_vulkan_inputs[suffix].filepath)
+        variant = genshaders.ShaderVariant(variant_name, shader_name + suffix, archive_prefix + suffix, spirv_digest)
+        variant.reflections_by_stage = variant_reflections_by_suffix.get(suffix, {})
+        shader.variants.append(variant)
 
     # Check mappings before we proceed
+    from . import validate
     validate.validate_descriptor_set_bindings(shader)
+    validate.validate_variant_interfaces(shader)
     
     genshaders.generate_shader_file(output_path, shader)
     
@@ -174,11 +413,333 @@ def find_argument_bindings(metal_source: str) -> List[ArgumentBufferBinding]:
 
 
 ACTION_COMPILE_TO_SPV = 'compile_to_spv'
+ACTION_OPTIMIZE_SPV_PERFORMANCE = 'spvopt_performance'
+ACTION_OPTIMIZE_SPV_SIZE = 'spvopt_size'
 ACTION_COMPILE_TO_OPENGL = 'spvcross_opengl'
+ACTION_COMPILE_OPENGL_TO_SPV = 'compile_gl_to_spv'
 ACTION_SPVCROSS_METAL = 'spvcross_metal'
 ACTION_SPVCROSS_REFLECT = 'spvcross_reflect'
 ACTION_LINK_VULKAN = 'link_vulkan' 
 ACTION_GEN_CS = 'gen_cs'
+ACTION_GEN_BUFFERS = 'gen_buffers'
+ACTION_PACK_ARCHIVE = 'pack_archive'
+
+BACKENDS = ('gl', 'metal', 'vulkan')
+
+# The backend whose shader code each action produces. Other actions are needed regardless of the backends built.
+ACTION_BACKENDS = {
+    ACTION_COMPILE_TO_OPENGL: 'gl',
+    ACTION_COMPILE_OPENGL_TO_SPV: 'gl',
+    ACTION_SPVCROSS_METAL: 'metal',
+    ACTION_LINK_VULKAN: 'vulkan',
+    ACTION_COMPILE_TO_SPV: 'vulkan',
+    ACTION_OPTIMIZE_SPV_PERFORMANCE: 'vulkan',
+    ACTION_OPTIMIZE_SPV_SIZE: 'vulkan',
+}
+
+# Actions which output SPIR-V, which has its debug info stripped when packed into the shader archive.
+SPIRV_ACTIONS = {ACTION_COMPILE_TO_SPV, ACTION_OPTIMIZE_SPV_PERFORMANCE, ACTION_OPTIMIZE_SPV_SIZE, ACTION_LINK_VULKAN,
+                 ACTION_COMPILE_OPENGL_TO_SPV}
+
+
+SPIRV_OPT_PRESET_FLAGS = {
+    ACTION_OPTIMIZE_SPV_PERFORMANCE: '-O',
+    ACTION_OPTIMIZE_SPV_SIZE: '-Os',
+}
+
+SPIRV_OPT_PRESET_ACTIONS = {
+    SpirvOptPreset.PERFORMANCE: ACTION_OPTIMIZE_SPV_PERFORMANCE,
+    SpirvOptPreset.SIZE: ACTION_OPTIMIZE_SPV_SIZE,
+}
+
+
+# Actions which only run a tool on their input files, and so can run on a worker.
+REMOTE_ACTIONS = {
+    ACTION_COMPILE_TO_SPV: compile_to_spv,
+    ACTION_OPTIMIZE_SPV_PERFORMANCE: optimize_spv,
+    ACTION_OPTIMIZE_SPV_SIZE: optimize_spv,
+    ACTION_COMPILE_TO_OPENGL: spv_to_opengl,
+    ACTION_COMPILE_OPENGL_TO_SPV: compile_opengl_to_spv,
+    ACTION_SPVCROSS_METAL: spv_to_metal,
+    ACTION_SPVCROSS_REFLECT: spv_to_reflection,
+    ACTION_LINK_VULKAN: link_spv_for_vulkan,
+}
+
+INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.MULTILINE)
+
+
+def find_includes(path: str, found: Optional[List[str]] = None) -> List[str]:
+    """
+    Finds the files a shader includes, recursively. Doesn't evaluate the preprocessor, so this may find more includes
+    than are actually used, which is fine for sending them to a worker. Includes which don't exist are left out.
+    """
+    if found is None:
+        found = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        source = f.read()
+    for include in INCLUDE_PATTERN.findall(source):
+        include_path = os.path.normpath(os.path.join(os.path.dirname(path), include))
+        if include_path not in found and os.path.isfile(include_path):
+            found.append(include_path)
+            find_includes(include_path, found)
+    return found
+
+
+def run_node_remotely(node: Node, pool: 'remote.WorkerPool'):
+    from . import remote
+    tagged_inputs = [(tag, input.filepath) for tag, input in node.tagged_inputs if tag != 'include']
+    extra_paths = []
+    if node.action == ACTION_COMPILE_TO_SPV:
+        extra_paths = find_includes(node.tagged_inputs[0][1].filepath)
+    try:
+        pool.run(node.action, node.options, tagged_inputs, extra_paths, node.filepath)
+    except remote.RemoteActionError as e:
+        raise ActionFailed(str(e), e.output) from None
+
+
+def run_action(action: 'Action', node: Node):
+    try:
+        action.run(node)
+    except ValueError as e:
+        # Problems ggen finds itself, e.g. conflicting bindings.
+        raise ActionFailed(str(e)) from e
+
+
+# glslangValidator's messages, e.g. "ERROR: shaders/foo.vert.glsl:12: 'bar' : undeclared identifier".
+GLSLANG_DIAGNOSTIC_PATTERN = re.compile(
+    r'^(?P<severity>ERROR|WARNING): (?P<path>.+?):(?P<line>\d+):(?:\d+:)? (?P<message>.*?)\s*$', re.MULTILINE)
+
+
+class Diagnostic(object):
+    def __init__(self, severity: str, path: str, line: Optional[int], message: str):
+        self.severity = severity
+        self.path = path
+        self.line = line
+        self.message = message
+    
+    def format(self) -> str:
+        # The canonical error format, which MSBuild and IDEs pick up from the output of Exec.
+        location = self.path if self.line is None else f'{self.path}({self.line})'
+        return f'{location}: {self.severity}: {self.message}'
+
+
+def get_diagnostics(node: Node, error: ActionFailed) -> List[Diagnostic]:
+    """
+    Gets the diagnostics of a failed action from the output of its tool. Failures without any are blamed on the node's 
+    first source input, or its first input.
+    """
+    diagnostics = [Diagnostic(match.group('severity').lower(), match.group('path'), int(match.group('line')), 
+                              match.group('message'))
+                   for match in GLSLANG_DIAGNOSTIC_PATTERN.finditer(error.output)]
+    if any(diagnostic.severity == 'error' for diagnostic in diagnostics):
+        return diagnostics
+    
+    input_nodes = list(node.get_input_nodes())
+    source_nodes = [input for input in input_nodes if not input.action]
+    path = (source_nodes or input_nodes or [node])[0].filepath
+    output = error.output.strip()
+    message = f'[{node.action}] {node.filepath}: {error}' + (f'\n{output}' if output else '')
+    return diagnostics + [Diagnostic('error', path, None, message)]
+
+
+def report_failures(failures: List[Tuple[Node, ActionFailed]], unbuilt_count: int):
+    print(f'ggen: {len(failures)} action(s) failed, {unbuilt_count} other output(s) weren\'t built.')
+    for node, error in failures:
+        for diagnostic in get_diagnostics(node, error):
+            print(diagnostic.format())
+    sys.stdout.flush()
+
+
+def run_nodes_in_parallel(nodes: List[Node], run_locally: Callable[[Node], None], pool: 'remote.WorkerPool',
+                          on_done: Callable[[Node], None], on_failed: Callable[[Node, ActionFailed], None],
+                          keep_going: bool):
+    """
+    Runs the nodes, in dependency order. Actions which can run remotely are sent to the workers as soon as their 
+    inputs are done, the others run on this thread. Nodes depending on a failed node aren't run. Unless keep_going is 
+    set, nothing new is started after a failure either.
+    """
+    from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+    pending = set(nodes)
+    remaining_input_counts: Dict[Node, int] = {}
+    dependents: Dict[Node, List[Node]] = {}
+    for node in nodes:
+        pending_inputs = {input for input in node.get_input_nodes() if input in pending}
+        remaining_input_counts[node] = len(pending_inputs)
+        for input in pending_inputs:
+            dependents.setdefault(input, []).append(node)
+    
+    ready = deque(node for node in nodes if remaining_input_counts[node] == 0)
+    
+    def complete(node: Node):
+        on_done(node)
+        for dependent in dependents.get(node, []):
+            remaining_input_counts[dependent] -= 1
+            if remaining_input_counts[dependent] == 0:
+                ready.append(dependent)
+    
+    stopping = False
+    
+    def fail(node: Node, error: ActionFailed):
+        nonlocal stopping
+        on_failed(node, error)
+        stopping = not keep_going
+    
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        futures: Dict[Future, Node] = {}
+        while (ready and not stopping) or futures:
+            while ready and not stopping:
+                node = ready.popleft()
+                print(f'[{node.action}] {node.filepath}')
+                sys.stdout.flush()
+                os.makedirs(os.path.dirname(node.filepath), exist_ok=True)
+                if node.action in REMOTE_ACTIONS:
+                    futures[executor.submit(run_node_remotely, node, pool)] = node
+                    continue
+                try:
+                    run_locally(node)
+                except ActionFailed as e:
+                    fail(node, e)
+                    continue
+                complete(node)
+            
+            if futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = futures.pop(future)
+                    try:
+                        future.result()
+                    except ActionFailed as e:
+                        fail(node, e)
+                        continue
+                    complete(node)
+
+
+# Extensions of the shader stages, e.g. foo.vert.glsl.
+SHADER_STAGE_MODES = {'vert', 'frag'}
+
+# Vertex definitions shared between shaders, see genbuffers.py.
+BUFFER_FILE_SUFFIX = '.buffer.json'
+
+
+GGEN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Recorded fingerprints of the actions which produced each output, see Action.
+VERSIONS_FILENAME = 'ggen_versions.json'
+
+# Written by a full build, see write_manifest.
+MANIFEST_INPUTS_FILENAME = 'ggen_inputs.txt'
+MANIFEST_OUTPUTS_FILENAME = 'ggen_outputs.txt'
+STAMP_FILENAME = 'ggen.stamp'
+
+
+class Action(object):
+    """
+    How the outputs of nodes with a given action are produced. Besides the node's inputs, an output depends on the
+    code and tools that produced it. Each action declares those, and an output is rebuilt when the fingerprint of what
+    its action depends on changes. Editing the C# emitter then only re-runs gen_cs, instead of every action.
+    
+    Bump version when changing how the action invokes its tools.
+    """
+    def __init__(self, run: Callable[[Node], None], version: int, scripts: Iterable[str] = (), 
+                 tools: Iterable[str] = (), options: Any = None):
+        self.run = run
+        self.version = version
+        # ggen modules the action runs, relative to the ggen package.
+        self.scripts = list(scripts)
+        self.tools = list(tools)
+        # Command line options the output depends on.
+        self.options = options
+        self._fingerprint: Optional[str] = None
+        
+    def get_fingerprint(self) -> str:
+        if self._fingerprint is None:
+            h = hashlib.sha256(repr((self.version, self.options)).encode('utf-8'))
+            for script in self.scripts:
+                with open(os.path.join(GGEN_DIR, script), 'rb') as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+            for tool in self.tools:
+                # Tools are large, so go by their size and modification time rather than their contents.
+                if os.path.isfile(tool):
+                    stat = os.stat(tool)
+                    h.update(repr((os.path.basename(tool), stat.st_size, stat.st_mtime_ns)).encode('utf-8'))
+                else:
+                    h.update(repr((os.path.basename(tool), None)).encode('utf-8'))
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+
+def get_node_fingerprint(node: Node, actions: Dict[str, Action]) -> str:
+    options = repr(sorted(node.options.items()))
+    return hashlib.sha256(f'{node.action}\0{options}\0{actions[node.action].get_fingerprint()}'.encode('utf-8')).hexdigest()
+
+
+def load_versions(path: str) -> Dict[str, str]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # Missing or corrupt, everything gets rebuilt.
+        return {}
+
+
+def save_versions(path: str, versions: Dict[str, str]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(versions, f, indent=1, sort_keys=True)
+
+
+def write_manifest(graph: Graph, actions: Dict[str, Action], output_dir: str):
+    """
+    Lists every file the build read and every output it owns, and touches the stamp. The MSBuild target uses the 
+    inputs as Inputs and the stamp as Outputs of running ggen, so that a build where none of them changed doesn't start
+    Python at all.
+    """
+    inputs = {os.path.join(GGEN_DIR, filename) for filename in os.listdir(GGEN_DIR) if filename.endswith('.py')}
+    for action in actions.values():
+        inputs.update(action.tools)
+    
+    outputs = {os.path.join(output_dir, filename) 
+               for filename in (VERSIONS_FILENAME, MANIFEST_INPUTS_FILENAME, MANIFEST_OUTPUTS_FILENAME, STAMP_FILENAME)}
+    for node in graph.walk():
+        if not node.action:
+            inputs.add(node.filepath)
+            continue
+        outputs.add(node.filepath)
+        if node.action == ACTION_COMPILE_TO_SPV:
+            # Includes found by this build's compiles, which the graph didn't know about yet.
+            depfile_path = get_depfile_path(node.filepath)
+            outputs.add(depfile_path)
+            if os.path.isfile(depfile_path):
+                inputs.update(parse_depfile(depfile_path))
+    
+    for filename, paths in ((MANIFEST_INPUTS_FILENAME, inputs), (MANIFEST_OUTPUTS_FILENAME, outputs)):
+        with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+            f.writelines(f'{path}\n' for path in sorted({os.path.abspath(path) for path in paths}))
+    
+    with open(os.path.join(output_dir, STAMP_FILENAME), 'w'):
+        pass
+
+
+def parse_backends(value: str) -> List[str]:
+    backends = [backend.strip().lower() for backend in value.split(',') if backend.strip()]
+    for backend in backends:
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown backend {backend}, expected one of {", ".join(BACKENDS)}')
+    return backends
+
+
+def is_for_backends(node: Node, backends: List[str]) -> bool:
+    backend = ACTION_BACKENDS.get(node.action)
+    return backend is None or backend in backends
+
+
+def matches_target(node: Node, targets: List[str], output_dir: str) -> bool:
+    path = os.path.normcase(os.path.abspath(node.filepath))
+    for target in targets:
+        for pattern in (target, os.path.join(output_dir, target)):
+            if fnmatch.fnmatch(path, os.path.normcase(os.path.abspath(pattern))):
+                return True
+    return False
 
 
 def get_mode(path: str):
@@ -187,9 +748,47 @@ def get_mode(path: str):
     return mode.lstrip('.')
 
 
+def merge_variant_defines(directives_by_mode: Dict[str, ShaderDirectives]) -> Dict[str, List[str]]:
+    """
+    Merges the variants declared in each stage of a shader. Variants apply to all stages, and when several stages 
+    declare the same variant its defines are combined.
+    """
+    merged: Dict[str, List[str]] = {}
+    for mode, directives in sorted(directives_by_mode.items(), key=lambda x: (x[0] != 'vert', x[0])):
+        for name, defines in directives.variant_defines_by_name.items():
+            merged_defines = merged.setdefault(name, [])
+            merged_defines.extend(define for define in defines if define not in merged_defines)
+    return merged
+
+
+def get_variant_suffixes(variant_defines_by_name: Dict[str, List[str]]) -> Dict[str, str]:
+    """
+    Gets the suffix appended to the shader name for the outputs of each variant. Variants are keyed by their set of
+    defines, so that variants which would compile to the same code share their outputs. A variant without defines
+    shares the outputs of the default variant.
+    """
+    suffixes_by_defines: Dict[Tuple[str, ...], str] = {(): ''}
+    suffixes: Dict[str, str] = {}
+    for name, defines in variant_defines_by_name.items():
+        key = tuple(sorted(set(defines)))
+        suffixes[name] = suffixes_by_defines.setdefault(key, f'@{name}')
+    return suffixes
+
+
+def get_spirv_opt_preset(directives: ShaderDirectives, default: SpirvOptPreset) -> SpirvOptPreset:
+    preset = directives.spirv_opt_preset
+    return default if preset is None else preset
+
+
 def process_shaders(args):
+    started_at = time.perf_counter()
+    if args.tools_dir:
+        set_tools_dir(args.tools_dir)
+    
     if args.files:
         paths = set(args.files.split(';'))
+        buffer_paths = sorted(p for p in paths if p.endswith(BUFFER_FILE_SUFFIX))
+        paths.difference_update(buffer_paths)
         
         # Find shaders which belong together
         companion_files: List[str] = []
@@ -201,6 +800,10 @@ def process_shaders(args):
         paths = [p for p in paths if p]
     else:
         paths = glob.glob(f'{args.root}/**/*.glsl', recursive=True)
+        buffer_paths = sorted(glob.glob(f'{args.root}/**/*{BUFFER_FILE_SUFFIX}', recursive=True))
+    
+    # Other .glsl files are headers, which are only compiled as part of the shaders including them.
+    paths = [path for path in paths if get_mode(path) in SHADER_STAGE_MODES]
 
     shaders_by_name: Dict[str, List[str]] = {}
 
@@ -211,78 +814,276 @@ def process_shaders(args):
         shaders = shaders_by_name.setdefault(name, [])
         shaders.append(path)
 
+    default_spirv_opt_preset = SpirvOptPreset[args.spirv_opt.upper()]
+    backends = parse_backends(args.backends)
+
     graph = Graph()
     
+    # Everything that gets embedded, tagged with its name in the shader archive.
+    archive_inputs: List[Tuple[str, Node]] = []
+    
+    # Headers are shared between shaders, so share their nodes too.
+    include_nodes_by_path: Dict[str, Node] = {}
+    
+    # Each buffer definition file generates the structs it defines, which shaders naming them in their input 
+    # directives use instead of declaring their own.
+    buffers_by_name = parse_buffers(buffer_paths) if buffer_paths else {}
+    buffer_nodes_by_path: Dict[str, Node] = {}
+    for path in buffer_paths:
+        buffer_node = Node(path, '', [])
+        buffer_nodes_by_path[path] = buffer_node
+        rel_path = os.path.relpath(path, args.root)
+        generated_buffer_path = os.path.join(args.output_dir, rel_path[:-len('.json')] + '.Generated.cs')
+        graph.root_nodes.append(Node(generated_buffer_path, ACTION_GEN_BUFFERS, [('', buffer_node)]))
+    
     for name, paths in shaders_by_name.items():
         rel_dir = os.path.dirname(os.path.relpath(paths[0], args.root))
         rel_out_dir = os.path.join(args.output_dir, rel_dir)
         
-        source_nodes: List[Tuple[str, Node]] = []
-        reflection_nodes: List[Tuple[str, Node]] = []
-        metal_nodes: List[Tuple[str, Node]] = []
-        spv_nodes: List[Tuple[str, Node]] = []
+        directives_by_mode = {get_mode(path): genshaders.parse_shader_directives(path) for path in paths}
         
-        for path in paths:
-            mode = get_mode(path)
-            
-            source_node = Node(path, '', [])
-            source_nodes.append((mode, source_node))
-            
-            filename_no_ext = os.path.splitext(os.path.basename(path))[0]
-            output_no_ext = os.path.join(rel_out_dir, filename_no_ext)
-            spv_path = output_no_ext + '.spv'
-            opengl_path = output_no_ext + '_gl.glsl'
-            metal_path = output_no_ext + '.metal'
-            reflection_path = output_no_ext + '.reflection.json'
-            
-            spv_node = Node(spv_path, ACTION_COMPILE_TO_SPV, [('', source_node)])
-            spv_nodes.append((mode, spv_node))
+        # Each distinct set of variant defines gets its own outputs, the default variant's having no suffix.
+        variant_defines_by_name = merge_variant_defines(directives_by_mode)
+        variant_defines_by_suffix: Dict[str, List[str]] = {'': []}
+        for variant_name, suffix in get_variant_suffixes(variant_defines_by_name).items():
+            variant_defines_by_suffix.setdefault(suffix, variant_defines_by_name[variant_name])
+        
+        source_nodes: List[Tuple[str, Node]] = [(get_mode(path), Node(path, '', [])) for path in paths]
+        
+        # The generated class needs the reflection of every variant, and the linked code of every variant to hash.
+        gen_cs_inputs: List[Tuple[str, Node]] = []
+        
+        for suffix, defines in variant_defines_by_suffix.items():
+            is_default_variant = suffix == ''
+            compile_options = {'defines': defines} if defines else None
             
-            opengl_node = Node(opengl_path, ACTION_COMPILE_TO_OPENGL, [('', spv_node)])
-            graph.root_nodes.append(opengl_node)
+            reflection_nodes: List[Tuple[str, Node]] = []
+            metal_nodes: List[Tuple[str, Node]] = []
+            spv_nodes: List[Tuple[str, Node]] = []
             
-            metal_node = Node(metal_path, ACTION_SPVCROSS_METAL, [('', spv_node)])
-            metal_nodes.append((mode, metal_node))
+            for mode, source_node in source_nodes:
+                output_no_ext = os.path.join(rel_out_dir, f'{name}{suffix}.{mode}')
+                spv_path = output_no_ext + '.spv'
+                opengl_path = output_no_ext + '_gl.glsl'
+                opengl_spv_path = output_no_ext + '_gl.spv'
+                metal_path = output_no_ext + '.metal'
+                reflection_path = output_no_ext + '.reflection.json'
+                
+                spirv_opt_preset = get_spirv_opt_preset(directives_by_mode[mode], default_spirv_opt_preset)
+                if spirv_opt_preset == SpirvOptPreset.NONE:
+                    spv_node = Node(spv_path, ACTION_COMPILE_TO_SPV, [('', source_node)], compile_options)
+                    add_include_inputs(spv_node, include_nodes_by_path)
+                else:
+                    # Optimize between compiling and everything else, so that the embedded SPIR-V and the cross 
+                    # compiled GLSL and MSL all benefit.
+                    unoptimized_spv_node = Node(output_no_ext + '.unopt.spv', ACTION_COMPILE_TO_SPV, 
+                                                [('', source_node)], compile_options)
+                    add_include_inputs(unoptimized_spv_node, include_nodes_by_path)
+                    spv_node = Node(spv_path, SPIRV_OPT_PRESET_ACTIONS[spirv_opt_preset], [('', unoptimized_spv_node)])
+                spv_nodes.append((mode, spv_node))
+                
+                opengl_node = Node(opengl_path, ACTION_COMPILE_TO_OPENGL, [('', spv_node)])
+                graph.root_nodes.append(opengl_node)
+                
+                opengl_spv_node = Node(opengl_spv_path, ACTION_COMPILE_OPENGL_TO_SPV, [(mode, opengl_node)])
+                graph.root_nodes.append(opengl_spv_node)
+                
+                metal_node = Node(metal_path, ACTION_SPVCROSS_METAL, [('', spv_node)])
+                metal_nodes.append((mode, metal_node))
+                
+                # The generated class is based on the default variant. Other variants are reflected too, to check that
+                # they have the same interface.
+                reflection_node = Node(reflection_path, ACTION_SPVCROSS_REFLECT, [('', spv_node)])
+                reflection_nodes.append((mode + suffix, reflection_node))
+                if not is_default_variant:
+                    graph.root_nodes.append(metal_node)
+                
+                archive_inputs.append((get_archive_entry_name(spv_path, args.output_dir), spv_node))
+                archive_inputs.append((get_archive_entry_name(opengl_path, args.output_dir), opengl_node))
+                archive_inputs.append((get_archive_entry_name(opengl_spv_path, args.output_dir), opengl_spv_node))
+                archive_inputs.append((get_archive_entry_name(metal_path, args.output_dir), metal_node))
+                
+            linked_vulkan_path = os.path.join(rel_out_dir, f'{name}{suffix}.vulkan')
+            linked_vulkan_node = Node(linked_vulkan_path, ACTION_LINK_VULKAN, spv_nodes)
+            graph.root_nodes.append(linked_vulkan_node)
+            archive_inputs.append((get_archive_entry_name(linked_vulkan_path, args.output_dir), linked_vulkan_node))
             
-            reflection_node = Node(reflection_path, ACTION_SPVCROSS_REFLECT, [('', spv_node)])
-            reflection_nodes.append((mode, reflection_node))
+            if is_default_variant:
+                gen_cs_inputs.extend(metal_nodes + source_nodes)
+            gen_cs_inputs.extend(reflection_nodes)
+            gen_cs_inputs.append((suffix, linked_vulkan_node))
             
-        linked_vulkan_path = os.path.join(rel_out_dir, f'{name}.vulkan')
-        linked_vulkan_node = Node(linked_vulkan_path, ACTION_LINK_VULKAN, spv_nodes)
-        graph.root_nodes.append(linked_vulkan_node)
+        # Changes to the definitions of shared structs regenerate the class, as its layout uses their offsets.
+        structure_names = {input_directive.structure_name 
+                           for directives in directives_by_mode.values()
+                           for input_directive in directives.input_directives_by_input_name.values()}
+        shared_buffer_paths = sorted({buffers_by_name[structure_name][0] for structure_name in structure_names 
+                                      if structure_name in buffers_by_name})
+        gen_cs_inputs.extend(('buffer', buffer_nodes_by_path[path]) for path in shared_buffer_paths)
             
         generated_cs_path = os.path.join(rel_out_dir, f'{name}.Generated.cs')
-        generated_cs_node = Node(generated_cs_path, ACTION_GEN_CS, reflection_nodes + metal_nodes + source_nodes)
+        generated_cs_node = Node(generated_cs_path, ACTION_GEN_CS, gen_cs_inputs)
         graph.root_nodes.append(generated_cs_node)
+    
+    # Only build the shader code of the requested backends. Spirv-cross needs SPIR-V for every backend, but the 
+    # per-stage SPIR-V is only embedded for Vulkan.
+    graph.root_nodes = [node for node in graph.root_nodes if is_for_backends(node, backends)]
+    
+    if args.shader_archive:
+        archive_path = os.path.join(args.output_dir, args.shader_archive)
+        archive_inputs = [(tag, node) for tag, node in archive_inputs if is_for_backends(node, backends)]
+        # The backends are an option of the archive, so that changing them re-packs it.
+        archive_options = {'backends': backends} if len(backends) < len(BACKENDS) else None
+        graph.root_nodes.append(Node(archive_path, ACTION_PACK_ARCHIVE, archive_inputs, archive_options))
+    
+    if args.target:
+        graph.select(lambda node: matches_target(node, args.target, args.output_dir))
+        if not graph.root_nodes:
+            raise ValueError(f'No outputs match --target {", ".join(args.target)}')
+    
+    graph_built_at = time.perf_counter()
+    archive_compression_name = args.shader_archive_compression.upper()
         
     actions = {
-        ACTION_COMPILE_TO_SPV: compile_to_spv,
-        ACTION_COMPILE_TO_OPENGL: spv_to_opengl,
-        ACTION_SPVCROSS_METAL: spv_to_metal,
-        ACTION_SPVCROSS_REFLECT: spv_to_reflection,
-        ACTION_LINK_VULKAN: link_spv_for_vulkan,
-        ACTION_GEN_CS: gen_cs
+        ACTION_COMPILE_TO_SPV: Action(compile_to_spv, 1, tools=[GLSLANG_BINARY]),
+        ACTION_OPTIMIZE_SPV_PERFORMANCE: Action(optimize_spv, 1, tools=[SPIRV_OPT_BINARY]),
+        ACTION_OPTIMIZE_SPV_SIZE: Action(optimize_spv, 1, tools=[SPIRV_OPT_BINARY]),
+        ACTION_COMPILE_TO_OPENGL: Action(spv_to_opengl, 1, tools=[SPIRV_CROSS_BINARY]),
+        ACTION_COMPILE_OPENGL_TO_SPV: Action(compile_opengl_to_spv, 1, tools=[GLSLANG_BINARY]),
+        ACTION_SPVCROSS_METAL: Action(spv_to_metal, 1, tools=[SPIRV_CROSS_BINARY]),
+        ACTION_SPVCROSS_REFLECT: Action(spv_to_reflection, 1, tools=[SPIRV_CROSS_BINARY]),
+        ACTION_LINK_VULKAN: Action(link_spv_for_vulkan, 1, tools=[SPIRV_LINK_BINARY]),
+        # gen_cs itself and the Metal binding parsing live in __main__.py.
+        ACTION_GEN_CS: Action(lambda node: gen_cs(node, args.output_dir), 1, 
+                              scripts=['__main__.py', 'genshaders.py', 'validate.py', 'genbuffers.py', 'gl.py'],
+                              options=os.path.abspath(args.output_dir)),
+        ACTION_GEN_BUFFERS: Action(gen_buffers, 1, scripts=['genbuffers.py', 'gl.py', 'gengl.py']),
+        ACTION_PACK_ARCHIVE: Action(lambda node: pack_shader_archive(node, archive_compression_name), 1, 
+                                    scripts=['shaderarchive.py', 'gl.py'], options=archive_compression_name),
     }
     
-    min_modtime = 0  
-    if args.ggen_script_files:
-        script_files = [p.strip() for p in args.ggen_script_files.split(';')]
-        for ggen_script_file in script_files:
-            min_modtime = max(os.stat(ggen_script_file).st_mtime_ns, min_modtime)
+    versions_path = os.path.join(args.output_dir, VERSIONS_FILENAME)
+    versions = load_versions(versions_path)
+    
+    def is_outdated(node: Node) -> bool:
+        if node.action == ACTION_COMPILE_TO_SPV and not os.path.isfile(get_depfile_path(node.filepath)):
+            # Without its depfile, the includes of the compile are unknown until it runs again.
+            return True
+        return versions.get(node.filepath) != get_node_fingerprint(node, actions)
     
-    dirty_nodes = graph.find_dirty_nodes(min_modtime)
+    dirty_nodes = graph.find_dirty_nodes(is_outdated)
+    
+    if args.timings:
+        checked_at = time.perf_counter()
+        node_count = sum(1 for _ in graph.walk())
+        print(f'ggen startup: imports {(IMPORTED_AT - IMPORT_STARTED_AT) * 1000:.1f} ms, '
+              f'arguments {(started_at - IMPORTED_AT) * 1000:.1f} ms, '
+              f'graph {(graph_built_at - started_at) * 1000:.1f} ms ({node_count} nodes), '
+              f'dirty check {(checked_at - graph_built_at) * 1000:.1f} ms ({len(dirty_nodes)} dirty), '
+              f'{len(sys.modules)} modules loaded')
+    
+    stamp_path = os.path.join(args.output_dir, STAMP_FILENAME)
+    if (dirty_nodes or args.rebuild) and os.path.exists(stamp_path):
+        # Until this build completes, MSBuild has to run ggen again.
+        os.remove(stamp_path)
+    
+    if args.workers or args.spawn_workers > 0:
+        from . import remote
+        worker_addresses = [remote.parse_worker_address(worker) for worker in args.workers.split(',')] \
+            if args.workers else []
+        worker_processes, spawned_addresses = remote.spawn_local_workers(args.spawn_workers, args.tools_dir)
+        pool = None
+        try:
+            pool = remote.WorkerPool(worker_addresses + spawned_addresses, args.worker_jobs)
+            failures = run_dirty_nodes_on_workers(graph, dirty_nodes, args.rebuild, actions, versions, versions_path, 
+                                                  pool, args.keep_going)
+        finally:
+            if pool is not None:
+                pool.close()
+            for process in worker_processes:
+                process.terminate()
+    else:
+        failures = run_dirty_nodes(graph, dirty_nodes, args.rebuild, actions, versions, versions_path, args.keep_going)
+    
+    if failures:
+        # Outputs without a version weren't built, and are retried by the next run.
+        unbuilt_count = sum(1 for node in graph.walk() if node.action and node.filepath not in versions)
+        report_failures(failures, unbuilt_count - len(failures))
+        sys.exit(1)
+    
+    # Builds of only some targets or backends leave other outputs out of date, so only a full build can let MSBuild 
+    # skip running ggen.
+    if not args.target and len(backends) == len(BACKENDS):
+        write_manifest(graph, actions, args.output_dir)
+    
+    if args.timings:
+        print(f'ggen total: {(time.perf_counter() - IMPORT_STARTED_AT) * 1000:.1f} ms')
+
+
+def run_dirty_nodes(graph: Graph, dirty_nodes: Set[Node], rebuild: bool, actions: Dict[str, Action],
+                    versions: Dict[str, str], versions_path: str, keep_going: bool) -> List[Tuple[Node, ActionFailed]]:
+    """
+    Runs the dirty nodes one after the other, returning the actions which failed. Nodes depending on a failed node 
+    are skipped, and unless keep_going is set, so is everything after the first failure.
+    """
+    # Forget the versions of everything that's about to be rebuilt, so that what fails or doesn't get to run is rebuilt
+    # next time.
     for node in graph.walk():
-        if node not in dirty_nodes and not args.rebuild:
-            continue
-        
-        print(f'[{node.action}] {node.filepath}')
-        sys.stdout.flush()
-        if not node.action:
-            continue
+        if node in dirty_nodes or rebuild:
+            versions.pop(node.filepath, None)
+    
+    failures: List[Tuple[Node, ActionFailed]] = []
+    failed_nodes: Set[Node] = set()
+    try:
+        for node in graph.walk():
+            if node not in dirty_nodes and not rebuild:
+                continue
+            if failures and not keep_going:
+                break
+            
+            if any(input in failed_nodes for input in node.get_input_nodes()):
+                failed_nodes.add(node)
+                continue
             
-        os.makedirs(os.path.dirname(node.filepath), exist_ok=True)
+            print(f'[{node.action}] {node.filepath}')
+            sys.stdout.flush()
+            if not node.action:
+                continue
+                
+            os.makedirs(os.path.dirname(node.filepath), exist_ok=True)
             
-        actions[node.action](node)
+            try:
+                run_action(actions[node.action], node)
+            except ActionFailed as e:
+                failures.append((node, e))
+                failed_nodes.add(node)
+                continue
+            versions[node.filepath] = get_node_fingerprint(node, actions)
+    finally:
+        if dirty_nodes or rebuild:
+            save_versions(versions_path, versions)
+    return failures
+
+
+def run_dirty_nodes_on_workers(graph: Graph, dirty_nodes: Set[Node], rebuild: bool, actions: Dict[str, Action],
+                               versions: Dict[str, str], versions_path: str, pool: 'remote.WorkerPool', 
+                               keep_going: bool) -> List[Tuple[Node, ActionFailed]]:
+    nodes = [node for node in graph.walk() if node.action and (node in dirty_nodes or rebuild)]
+    for node in nodes:
+        versions.pop(node.filepath, None)
+    
+    failures: List[Tuple[Node, ActionFailed]] = []
+    
+    def on_done(node: Node):
+        versions[node.filepath] = get_node_fingerprint(node, actions)
+    
+    try:
+        run_nodes_in_parallel(nodes, lambda node: run_action(actions[node.action], node), pool, on_done, 
+                              lambda node, error: failures.append((node, error)), keep_going)
+    finally:
+        if nodes:
+            save_versions(versions_path, versions)
+    return failures
 
 
 def main():
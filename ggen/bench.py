@@ -0,0 +1,406 @@
+"""
+Benchmarks ggen against a synthetic shader library, using stand-in tools that return canned SPIR-V, reflection and MSL
+after a configurable delay. Only needs Python, so it can run on a plain Linux box (e.g. in CI).
+
+    python -m ggen.bench --shaders 200 --ubos 4 --ssbos 2 --textures 4 --vertex-inputs 8
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any, Callable, Optional
+
+
+argparser = argparse.ArgumentParser(prog='python -m ggen.bench')
+
+argparser.add_argument('--shaders', type=int, default=100, help='Number of shaders in the library.')
+argparser.add_argument('--ubos', type=int, default=3, help='Maximum number of uniform buffers per shader.')
+argparser.add_argument('--ssbos', type=int, default=2, help='Maximum number of storage buffers per shader.')
+argparser.add_argument('--textures', type=int, default=4, help='Maximum number of textures per shader.')
+argparser.add_argument('--vertex-inputs', type=int, default=6, help='Maximum number of vertex inputs per shader.')
+argparser.add_argument('--headers', type=int, default=4, help='Number of shared headers the shaders include.')
+argparser.add_argument('--seed', type=int, default=1, help='Seed for the per shader counts.')
+
+argparser.add_argument('--glslang-delay-ms', type=float, default=5, help='Delay of each stand-in glslangValidator run.')
+argparser.add_argument('--spirv-cross-delay-ms', type=float, default=3, help='Delay of each stand-in spirv-cross run.')
+argparser.add_argument('--spirv-tools-delay-ms', type=float, default=1,
+                       help='Delay of each stand-in spirv-link and spirv-opt run.')
+
+argparser.add_argument('--repeat', type=int, default=3, help='Number of times to run each scenario.')
+argparser.add_argument('--work-dir', help='Directory to generate the library and outputs in. Its library, out and tools '
+                                          'subdirectories are replaced. Defaults to a temporary directory, which is '
+                                          'deleted afterwards.')
+argparser.add_argument('--json', help='Also write the results to this file.')
+argparser.add_argument('ggen_args', nargs=argparse.REMAINDER,
+                       help='Extra arguments passed to ggen, after a "--" (e.g. -- --shader-archive shaders.ggenpack).')
+
+
+# Line of a library source holding the reflection the stand-in tools return for it.
+REFLECTION_PREFIX = '// bench-reflection: '
+
+# Source of the stand-in tools. SPIR-V modules carry the source they were compiled from and its reflection, which the
+# library generator writes into a comment, in an OpString. Like real SPIR-V, they don't refer to any other file, so the
+# tools also work on remote workers.
+STANDIN_TOOL_SOURCE = '''\
+import json
+import os
+import re
+import struct
+import sys
+import time
+
+TOOL = {tool!r}
+DELAY = {delay!r}
+SPIRV_PADDING_WORDS = 1024
+REFLECTION_PREFIX = {reflection_prefix!r}
+
+
+def make_spirv(tag):
+    data = tag.encode('utf-8') + b'\\0'
+    data += b'\\0' * (-len(data) % 4)
+    string_words = list(struct.unpack('<%dI' % (len(data) // 4), data))
+    words = [0x07230203, 0x00010000, 0, 2, 0]
+    words += [(2 << 16) | 17, 1]  # OpCapability Shader
+    words += [(3 << 16) | 14, 0, 1]  # OpMemoryModel Logical GLSL450
+    words += [((2 + len(string_words)) << 16) | 7, 1] + string_words  # OpString
+    words += [(1 << 16) | 0] * SPIRV_PADDING_WORDS  # OpNop
+    return struct.pack('<%dI' % len(words), *words)
+
+
+def read_spirv_tag(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    words = struct.unpack('<%dI' % (len(data) // 4), data)
+    i = 5
+    while i < len(words):
+        word_count = words[i] >> 16
+        if words[i] & 0xFFFF == 7:
+            return data[(i + 2) * 4:(i + word_count) * 4].split(b'\\0')[0].decode('utf-8')
+        i += word_count
+    raise ValueError('Not a stand-in SPIR-V module: ' + path)
+
+
+def get_arg(args, name):
+    return args[args.index(name) + 1]
+
+
+def glslang(args):
+    input_path = args[-1]
+    with open(input_path) as f:
+        source = f.read()
+    for line_number, line in enumerate(source.split('\\n'), 1):
+        if line.startswith('#error'):
+            print('ERROR: %s:%d: %s' % (input_path, line_number, line[len('#error'):].strip()))
+            sys.exit(1)
+    if '--depfile' in args:
+        includes = [os.path.join(os.path.dirname(input_path), include)
+                    for include in re.findall(r'#include "(.*)"', source)]
+        with open(get_arg(args, '--depfile'), 'w') as f:
+            f.write('%s: %s\\n' % (get_arg(args, '-o'), ' '.join([input_path] + includes)))
+    reflection = {{}}
+    for line in source.split('\\n'):
+        if line.startswith(REFLECTION_PREFIX):
+            reflection = json.loads(line[len(REFLECTION_PREFIX):])
+    with open(get_arg(args, '-o'), 'wb') as f:
+        f.write(make_spirv(json.dumps({{'source': source, 'reflection': reflection}})))
+
+
+def spirv_opt(args):
+    with open(args[-1], 'rb') as f:
+        spirv = f.read()
+    with open(get_arg(args, '-o'), 'wb') as f:
+        f.write(spirv)
+
+
+def spirv_link(args):
+    inputs = args[args.index('-o') + 2:]
+    with open(get_arg(args, '-o'), 'wb') as f:
+        f.write(make_spirv(read_spirv_tag(inputs[0])))
+
+
+def spirv_cross(args):
+    if '--output' in args:
+        input_path = [arg for arg in args if arg.endswith('.spv')][0]
+        with open(get_arg(args, '--output'), 'w') as f:
+            f.write(json.loads(read_spirv_tag(input_path))['source'])
+        return
+
+    reflection = json.loads(read_spirv_tag(args[0]))['reflection']
+    if '--reflect' in args:
+        sys.stdout.write(json.dumps(reflection, indent=2))
+    else:
+        lines = ['#include <metal_stdlib>', 'using namespace metal;', '', 'struct spvDescriptorSetBuffer0', '{{']
+        for i, ubo in enumerate(reflection.get('ubos', []) + reflection.get('ssbos', [])):
+            lines.append('    constant %s* %s [[id(%d)]];' % (ubo['name'], ubo['name'], i))
+        for i, texture in enumerate(reflection.get('textures', [])):
+            lines.append('    texture2d<float> %s [[id(%d)]];' % (texture['name'], 2 * i))
+            lines.append('    sampler %sSmplr [[id(%d)]];' % (texture['name'], 2 * i + 1))
+        lines.append('}};')
+        sys.stdout.write('\\n'.join(lines) + '\\n')
+
+
+time.sleep(DELAY)
+{{'glslangValidator': glslang, 'spirv-opt': spirv_opt, 'spirv-link': spirv_link, 'spirv-cross': spirv_cross}}[TOOL](sys.argv[1:])
+'''
+
+
+def write_standin_tools(tools_dir: str, args):
+    delays = {
+        'glslangValidator': args.glslang_delay_ms,
+        'spirv-cross': args.spirv_cross_delay_ms,
+        'spirv-link': args.spirv_tools_delay_ms,
+        'spirv-opt': args.spirv_tools_delay_ms,
+    }
+    os.makedirs(tools_dir, exist_ok=True)
+    for tool, delay_ms in delays.items():
+        path = os.path.join(tools_dir, tool)
+        with open(path, 'w') as f:
+            f.write(f'#!{sys.executable}\n')
+            f.write(STANDIN_TOOL_SOURCE.format(tool=tool, delay=delay_ms / 1000, reflection_prefix=REFLECTION_PREFIX))
+        os.chmod(path, 0o755)
+
+
+def make_vertex_reflection(rng: random.Random, args) -> Dict[str, Any]:
+    types = {}
+    ubos = []
+    for i in range(rng.randint(0, args.ubos)):
+        type_id = f'_{len(types) + 10}'
+        types[type_id] = {'name': f'Uniforms{i}', 'members': [
+            {'name': 'color', 'type': 'vec4', 'offset': 0},
+            {'name': 'transform', 'type': 'mat4', 'offset': 16, 'matrix_stride': 16},
+            {'name': 'scale', 'type': 'float', 'offset': 80},
+        ]}
+        ubos.append({'type': type_id, 'name': f'Uniforms{i}', 'block_size': 96, 'set': 0, 'binding': i})
+
+    ssbos = []
+    for i in range(rng.randint(0, args.ssbos)):
+        type_id = f'_{len(types) + 10}'
+        types[type_id] = {'name': f'Storage{i}', 'members': [
+            {'name': 'items', 'type': 'vec4', 'array': [0], 'array_size_is_literal': [True], 'offset': 0,
+             'array_stride': 16},
+        ]}
+        ssbos.append({'type': type_id, 'name': f'Storage{i}', 'readonly': True, 'block_size': 0, 'set': 1,
+                      'binding': i})
+
+    inputs = [{'type': 'vec4', 'name': f'in_attribute{i}', 'location': i}
+              for i in range(rng.randint(1, max(args.vertex_inputs, 1)))]
+
+    return {
+        'entryPoints': [{'name': 'main', 'mode': 'vert'}],
+        'types': types,
+        'inputs': inputs,
+        'outputs': [{'type': 'vec4', 'name': 'out_color', 'location': 0}],
+        'ubos': ubos,
+        'ssbos': ssbos,
+    }
+
+
+def make_fragment_reflection(rng: random.Random, args) -> Dict[str, Any]:
+    return {
+        'entryPoints': [{'name': 'main', 'mode': 'frag'}],
+        'inputs': [{'type': 'vec4', 'name': 'out_color', 'location': 0}],
+        'outputs': [{'type': 'vec4', 'name': 'frag_color', 'location': 0}],
+        'textures': [{'type': 'sampler2D', 'name': f'texture{i}', 'set': 2, 'binding': i}
+                     for i in range(rng.randint(0, args.textures))],
+    }
+
+
+def make_vertex_source(index: int, reflection: Dict[str, Any], header: str) -> str:
+    lines = [f'// #CSNAME:Bench.Shaders.Shader{index}', '#version 450', '#extension GL_GOOGLE_include_directive : require',
+             f'#include "{header}"', '']
+    for input in reflection['inputs']:
+        # Every other attribute comes from a per instance buffer.
+        directive = ' // #input struct:Instance stepmode:PER_INSTANCE' if input['location'] % 2 else ''
+        lines.append(f'layout(location = {input["location"]}) in vec4 {input["name"]};{directive}')
+    for ubo in reflection['ubos']:
+        lines.append(f'layout(set = 0, binding = {ubo["binding"]}) uniform {ubo["name"]} {{ vec4 color; mat4 transform; '
+                     f'float scale; }} u{ubo["binding"]};')
+    for ssbo in reflection['ssbos']:
+        lines.append(f'layout(set = 1, binding = {ssbo["binding"]}) readonly buffer {ssbo["name"]} {{ vec4 items[]; }} '
+                     f's{ssbo["binding"]};')
+    lines += ['layout(location = 0) out vec4 out_color;', '', 'void main()', '{',
+              '    gl_Position = in_attribute0;', '    out_color = vec4(1.0);', '}', '']
+    return '\n'.join(lines)
+
+
+def make_fragment_source(reflection: Dict[str, Any], header: str) -> str:
+    lines = ['#version 450', '#extension GL_GOOGLE_include_directive : require', f'#include "{header}"', '',
+             'layout(location = 0) in vec4 out_color;', 'layout(location = 0) out vec4 frag_color;']
+    for texture in reflection['textures']:
+        lines.append(f'layout(set = 2, binding = {texture["binding"]}) uniform sampler2D {texture["name"]};')
+    lines += ['', 'void main()', '{', '    frag_color = out_color;', '}', '']
+    return '\n'.join(lines)
+
+
+def write_library(root: str, args):
+    rng = random.Random(args.seed)
+    os.makedirs(root, exist_ok=True)
+
+    headers = [f'common{i}.glsl' for i in range(max(args.headers, 1))]
+    for header in headers:
+        with open(os.path.join(root, header), 'w') as f:
+            f.write('// Shared header\nconst float PI = 3.14159265;\n')
+
+    for i in range(args.shaders):
+        # Spread the shaders over a few directories, like a real library.
+        shader_dir = os.path.join(root, f'group{i % 8}')
+        os.makedirs(shader_dir, exist_ok=True)
+        header = os.path.join('..', headers[i % len(headers)]).replace(os.sep, '/')
+
+        vertex_reflection = make_vertex_reflection(rng, args)
+        fragment_reflection = make_fragment_reflection(rng, args)
+        for mode, source, reflection in (
+                ('vert', make_vertex_source(i, vertex_reflection, header), vertex_reflection),
+                ('frag', make_fragment_source(fragment_reflection, header), fragment_reflection)):
+            path = os.path.join(shader_dir, f'Shader{i}.{mode}.glsl')
+            with open(path, 'w') as f:
+                f.write(REFLECTION_PREFIX + json.dumps(reflection) + '\n' + source)
+
+
+def append_line(path: str, line: str):
+    with open(path, 'a') as f:
+        f.write(line + '\n')
+
+
+class BuildResult(object):
+    def __init__(self, seconds: float, peak_memory_kb: int, actions_run: int):
+        self.seconds = seconds
+        self.peak_memory_kb = peak_memory_kb
+        self.actions_run = actions_run
+
+
+# Runs ggen, then reports its peak memory use. The stand-in tools run in their own processes, so don't count.
+CHILD_SOURCE = '''\
+import resource
+import sys
+from ggen.__main__ import main
+sys.argv[0] = 'ggen'
+try:
+    main()
+finally:
+    sys.stdout.flush()
+    sys.stderr.write('\\nGGEN_BENCH_PEAK_MEMORY_KB %d\\n' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def run_ggen(ggen_args: List[str]) -> BuildResult:
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-c', CHILD_SOURCE, *ggen_args], cwd=package_root,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        sys.stderr.write(process.stdout)
+        sys.stderr.write(process.stderr)
+        raise RuntimeError(f'ggen failed with exit code {process.returncode}')
+
+    peak_memory_kb = 0
+    for line in process.stderr.splitlines():
+        if line.startswith('GGEN_BENCH_PEAK_MEMORY_KB '):
+            peak_memory_kb = int(line.split()[1])
+    actions_run = sum(1 for line in process.stdout.splitlines() if line.startswith('[') and not line.startswith('[]'))
+    return BuildResult(seconds, peak_memory_kb, actions_run)
+
+
+class Scenario(object):
+    def __init__(self, name: str, prepare: Callable[[], None], extra_args: Optional[List[str]] = None):
+        self.name = name
+        # Called before each run, to put the library and outputs into the state the scenario measures.
+        self.prepare = prepare
+        self.extra_args = extra_args or []
+
+
+# Subdirectories of the work dir the bench generates the library, outputs and stand-in tools in.
+WORK_SUBDIRS = ('library', 'out', 'tools')
+
+
+def run_benchmark(args, work_dir: str) -> List[Dict[str, Any]]:
+    library_dir, output_dir, tools_dir = (os.path.join(work_dir, subdir) for subdir in WORK_SUBDIRS)
+
+    write_standin_tools(tools_dir, args)
+    write_library(library_dir, args)
+
+    extra_ggen_args = [arg for arg in args.ggen_args if arg != '--']
+    ggen_args = [library_dir, '--output-dir', output_dir, '--tools-dir', tools_dir, *extra_ggen_args]
+
+    def clean():
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    def nothing():
+        pass
+
+    edit_count = 0
+
+    def edit_shader():
+        nonlocal edit_count
+        edit_count += 1
+        append_line(os.path.join(library_dir, 'group0', 'Shader0.frag.glsl'), f'// edit {edit_count}')
+
+    def edit_header():
+        nonlocal edit_count
+        edit_count += 1
+        append_line(os.path.join(library_dir, 'common0.glsl'), f'// edit {edit_count}')
+
+    scenarios = [
+        Scenario('cold', clean),
+        # Everything is rebuilt, but outputs exist and the file system cache is warm.
+        Scenario('warm', nothing, ['--rebuild']),
+        Scenario('no-op', nothing),
+        Scenario('single-file-edit', edit_shader),
+        Scenario('header-edit', edit_header),
+    ]
+
+    results = []
+    for scenario in scenarios:
+        build_results = []
+        for _ in range(max(args.repeat, 1)):
+            scenario.prepare()
+            build_results.append(run_ggen(ggen_args + scenario.extra_args))
+        results.append({
+            'scenario': scenario.name,
+            'median_seconds': statistics.median(r.seconds for r in build_results),
+            'min_seconds': min(r.seconds for r in build_results),
+            'peak_memory_kb': max(r.peak_memory_kb for r in build_results),
+            'actions_run': build_results[-1].actions_run,
+        })
+    return results
+
+
+def print_results(results: List[Dict[str, Any]]):
+    print(f'{"scenario":<18} {"median s":>10} {"min s":>10} {"peak MB":>10} {"actions":>8}')
+    for result in results:
+        print(f'{result["scenario"]:<18} {result["median_seconds"]:>10.3f} {result["min_seconds"]:>10.3f} '
+              f'{result["peak_memory_kb"] / 1024:>10.1f} {result["actions_run"]:>8}')
+
+
+def main():
+    args = argparser.parse_args()
+
+    if args.work_dir:
+        work_dir = args.work_dir
+        # Only remove what a previous run generated, never anything else in the directory.
+        for subdir in WORK_SUBDIRS:
+            shutil.rmtree(os.path.join(work_dir, subdir), ignore_errors=True)
+        results = run_benchmark(args, work_dir)
+    else:
+        with tempfile.TemporaryDirectory(prefix='ggen-bench-') as work_dir:
+            results = run_benchmark(args, work_dir)
+
+    print(f'{args.shaders} shaders, up to {args.ubos} UBOs, {args.ssbos} SSBOs, {args.textures} textures and '
+          f'{args.vertex_inputs} vertex inputs each')
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'arguments': {k: v for k, v in vars(args).items() if k != 'json'}, 'results': results}, f,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    main()
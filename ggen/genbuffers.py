@@ -2,10 +2,15 @@ import glob
 import json
 import os
 import sys
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 from . import gl
-from . import gengl
+from .gl import VERTEX_ATTRIBUTE_ALIGNMENT, align_up
+
+
+# GL version the helpers are generated for, unless a buffer definition asks for a newer one, e.g. "glVersion": "4.5".
+# The default target of gengl.py, so that the helpers only use functions the CeresGL package has.
+DEFAULT_GL_VERSION = (4, 0)
 
 
 class Vertex(object):
@@ -13,6 +18,8 @@ class Vertex(object):
         self.namespace = ''
         self.name = ''
         self.attributes: List[Attribute] = []
+        # Helpers needing a newer GL version are left out.
+        self.gl_version = DEFAULT_GL_VERSION
 
 
 class Attribute(object):
@@ -26,7 +33,7 @@ class Attribute(object):
 def main():
     # TODO: Argparser
     os.chdir(sys.argv[1])
-    paths = glob.glob('**/buffers.json', recursive=True)
+    paths = glob.glob('**/*.buffer.json', recursive=True)
     print(f'{len(paths)} buffer definition file(s) found.')
     for path in paths:
         generate_buffers(path)
@@ -36,6 +43,9 @@ def parse_buffer(buffer_data: Dict[str, Any]) -> Vertex:
     vertex = Vertex()
     vertex.name = buffer_data['name']
     vertex.namespace = buffer_data['namespace']
+    if 'glVersion' in buffer_data:
+        major, _, minor = str(buffer_data['glVersion']).partition('.')
+        vertex.gl_version = (int(major), int(minor or 0))
 
     for attribute_data in buffer_data['attributes']:
         attrib = Attribute()
@@ -48,24 +58,23 @@ def parse_buffer(buffer_data: Dict[str, Any]) -> Vertex:
     return vertex
 
 
-def generate_buffers(bufferfile_path: str) -> None:
-    print(f'Generating buffers for {bufferfile_path}')
-
-    with open(bufferfile_path, encoding='utf-8-sig') as f:
+def parse_buffer_file(path: str) -> List[Vertex]:
+    """
+    Parses a buffer definition file, which holds either a single vertex definition or a list of them.
+    """
+    with open(path, encoding='utf-8-sig') as f:
         root = json.load(f)
 
-    vertices: List[Vertex] = []
-    for buffer_data in root:
-        vertices.append(parse_buffer(buffer_data))
+    if isinstance(root, dict):
+        root = [root]
+    return [parse_buffer(buffer_data) for buffer_data in root]
 
-    for vertex in vertices:
-        gen_and_write_buffer()
-        code = gen_buffer(vertex)
-        namespace_parts = vertex.namespace.split('.')
-        project_path = os.path.join(*namespace_parts)
-        os.makedirs(project_path, exist_ok=True)
-        with open(os.path.join(project_path, f'{vertex.name}.Generated.cs'), 'w') as f:
-            f.write(code)
+
+def generate_buffers(bufferfile_path: str) -> None:
+    print(f'Generating buffers for {bufferfile_path}')
+
+    for vertex in parse_buffer_file(bufferfile_path):
+        gen_and_write_buffer('.', vertex)
 
 
 def gen_and_write_buffer(root: str, buffer: Vertex) -> None:
@@ -77,17 +86,25 @@ def gen_and_write_buffer(root: str, buffer: Vertex) -> None:
         f.write(code)
 
 
+def generate_buffer_file(bufferfile_path: str, output_path: str) -> None:
+    """
+    Generates the structs and helpers of every vertex defined in a buffer definition file into a single file.
+    """
+    code = gen_buffers(parse_buffer_file(bufferfile_path))
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(code)
+
+
 def gen_buffer(vertex: Vertex) -> str:
-    parts: List[str] = []
+    return gen_buffers([vertex])
 
-    # Validate buffer counts
-    for attrib in vertex.attributes:
-        if attrib.count < 1 or attrib.count > 4:
-            raise ValueError(f'Invalid count of components for attribute {attrib.name} in vertex {attrib.name}. '
-                             'Must be 1, 2, 3, or 4.')
 
-    element_size = sum(gl.get_byte_size_of_vertex_attrib_type(a.type) * a.count for a in vertex.attributes)
-    max_component_size = max(gl.get_byte_size_of_vertex_attrib_type(a.type) for a in vertex.attributes)
+def gen_buffers(vertices: List[Vertex]) -> str:
+    # Only needed for generating code. gengl imports what it needs to parse the GL registry, which ggen shouldn't pay
+    # for when it only reads the layout of buffers.
+    from . import gengl
+
+    parts: List[str] = []
 
     # Using statements
     parts.append(f'''using System;
@@ -97,23 +114,46 @@ using {gengl.NAMESPACE};
 
 ''')
 
+    for vertex in vertices:
+        gen_vertex(parts, vertex)
+
+    return ''.join(parts)
+
+
+def gen_vertex(parts: List[str], vertex: Vertex) -> None:
+    # Validate buffer counts
+    for attrib in vertex.attributes:
+        if attrib.count < 1 or attrib.count > 4:
+            raise ValueError(f'Invalid count of components for attribute {attrib.name} in vertex {attrib.name}. '
+                             'Must be 1, 2, 3, or 4.')
+
+    for attrib in vertex.attributes:
+        if gl.is_packed_vertex_attrib_type(attrib.type) and attrib.count != gl.get_packed_component_count(attrib.type):
+            raise ValueError(f'Invalid count of components for attribute {attrib.name} in vertex {vertex.name}. '
+                             f'Packed type {attrib.type} must have {gl.get_packed_component_count(attrib.type)}.')
+
+    attrib_offsets, element_size = get_attribute_layout(vertex)
+
     # Begin Namespace
     parts.append(f'namespace {vertex.namespace}\n{{\n')
 
     # Begin Vertex struct
     parts.append(f'''    [GeneratedCode("genbuffers.py", "0")]
-    [StructLayout(LayoutKind.Explicit)]
+    [StructLayout(LayoutKind.Explicit, Size = {element_size})]
     public struct {vertex.name}
     {{
 ''')
 
     # Generate vertex fields
-    current_attrib_offset = 0
-    for attrib in vertex.attributes:
+    for attrib, attrib_offset in zip(vertex.attributes, attrib_offsets):
+        cs_type = gl.get_cs_type_for_vertex_attrib_type(attrib.type)
+        if gl.is_packed_vertex_attrib_type(attrib.type):
+            # All components live in one packed value.
+            parts.append(f'        [FieldOffset({attrib_offset})] public {cs_type} {attrib.name};\n')
+            continue
         for i in range(attrib.count):
-            parts.append(
-                f'        [FieldOffset({current_attrib_offset})] public {gl.get_cs_type_for_vertex_attrib_type(attrib.type)} {attrib.name}_{i};\n')
-            current_attrib_offset += gl.get_byte_size_of_vertex_attrib_type(attrib.type)
+            component_offset = attrib_offset + i * gl.get_byte_size_of_vertex_attrib_type(attrib.type)
+            parts.append(f'        [FieldOffset({component_offset})] public {cs_type} {attrib.name}_{i};\n')
 
     # End Vertex Struct
     parts.append('    }\n\n')
@@ -143,54 +183,314 @@ using {gengl.NAMESPACE};
 
 ''')
 
-    current_attrib_offset = 0
-    for attrib in vertex.attributes:
+    if vertex.gl_version >= (4, 5):
+        parts.append(f'''        // Direct state access variants (GL 4.5 / ARB_direct_state_access). These take the buffer name directly, so the
+        // buffer doesn't need to be bound to a target before uploading.
+
+        public static unsafe void NamedBufferData(GL gl, uint buffer, Span<{vertex.name}> vertices, BufferUsageARB usage)
+        {{
+            fixed (void* dataPtr = vertices) {{
+                gl.glNamedBufferData(buffer, new IntPtr({element_size} * vertices.Length), (IntPtr)dataPtr, (uint)usage);
+            }}
+        }}
+
+        public static unsafe void NamedBufferSubData(GL gl, uint buffer, uint startVertex, Span<{vertex.name}> vertices)
+        {{
+            fixed (void* dataPtr = vertices) {{
+                gl.glNamedBufferSubData(buffer, new IntPtr({element_size} * startVertex), new IntPtr({element_size} * vertices.Length), (IntPtr)dataPtr);
+            }}
+        }}
+
+''')
+
+    for attrib, attrib_offset in zip(vertex.attributes, attrib_offsets):
         parts.append(f'        public static void Setup{attrib.name}VertexAttribute(GL gl, uint location, uint offset = 0)\n')
         parts.append(f'        {{\n')
         normalized = 'true' if attrib.normalized else 'false'
         type_arg = f'(uint)VertexAttribPointerType.{gl.get_abbreviated_enum_name(attrib.type)}'
         parts.append(
-            f'            gl.glVertexAttribPointer(location, {attrib.count}, {type_arg}, {normalized}, {element_size}, new IntPtr({current_attrib_offset} + {element_size} * offset));\n')
+            f'            gl.glVertexAttribPointer(location, {attrib.count}, {type_arg}, {normalized}, {element_size}, new IntPtr({attrib_offset} + {element_size} * offset));\n')
         parts.append(f'            gl.EnableVertexAttribArray(location);\n')
         parts.append(f'        }}\n\n')
-        current_attrib_offset += gl.get_byte_size_of_vertex_attrib_type(attrib.type) * attrib.count
         
         
-    # Begin SetupVertexAttributes Method Opening
-    parts.append('        public static void SetupVertexAttributes(GL gl')
-
-    # Generate SetupVertexAttributes index parameters
-    for attrib in vertex.attributes:
-        parts.append(f', uint {attrib.name}_location')
-
-    # Finish SetupVertexAttributes Method Opening
-    parts.append(', uint offset = 0)\n        {\n')
+    location_parameters = ''.join(f', uint {attrib.name}_location' for attrib in vertex.attributes)
+
+    # Begin SetupVertexAttributes Method, the pre GL 4.3 fallback. Specifies the whole layout in one call, sourcing
+    # from the buffer currently bound to GL_ARRAY_BUFFER.
+    has_vertex_attrib_binding = vertex.gl_version >= (4, 3)
+    fallback_doc = (' Fallback for when <see cref="SetupVertexFormat"/> is not available (before GL 4.3).'
+                    if has_vertex_attrib_binding else '')
+    parts.append(f'''        /// <summary>
+        /// Set up all vertex attributes of the bound vertex array object to source from the buffer bound to
+        /// GL_ARRAY_BUFFER.{fallback_doc}
+        /// </summary>
+        public static void SetupVertexAttributes(GL gl{location_parameters}, uint offset = 0)
+        {{
+''')
 
     # Generate SetupVertexAttributes Method Body
-    current_attrib_offset = 0
+    for attrib, attrib_offset in zip(vertex.attributes, attrib_offsets):
+        normalized = 'true' if attrib.normalized else 'false'
+        type_arg = f'(uint)VertexAttribPointerType.{gl.get_abbreviated_enum_name(attrib.type)}'
+        parts.append(
+            '            '
+            f'gl.glVertexAttribPointer({attrib.name}_location, {attrib.count}, {type_arg}, {normalized}, {element_size}, new IntPtr({attrib_offset} + {element_size} * offset));\n')
+
     for attrib in vertex.attributes:
-        parts.append(f'            Setup{attrib.name}VertexAttribute(gl, {attrib.name}_location, offset);\n')
-        # normalized = 'true' if attrib.normalized else 'false'
-        # type_arg = f'(uint)VertexAttribPointerType.{gl.get_abbreviated_enum_name(attrib.type)}'
-        # parts.append(
-        #     '            '
-        #     f'gl.glVertexAttribPointer({attrib.name}_location, {attrib.count}, {type_arg}, {normalized}, {element_size}, new IntPtr({current_attrib_offset}));\n')
-        # 
-        # current_attrib_offset += gl.get_byte_size_of_vertex_attrib_type(attrib.type) * attrib.count
-
-    # for attrib in vertex.attributes:
-    #     parts.append(f'            gl.EnableVertexAttribArray({attrib.name}_location);\n')
+        parts.append(f'            gl.glEnableVertexAttribArray({attrib.name}_location);\n')
 
     # End SetupVertexAttributes Method
     parts.append('        }\n')
 
+    if has_vertex_attrib_binding:
+        gen_vertex_format_setup(parts, vertex, attrib_offsets, element_size, location_parameters)
+
     # End Buffer Class
-    parts.append('    }\n')
+    parts.append('    }\n\n')
+
+    if vertex.gl_version >= (4, 4):
+        gen_persistent_ring_buffer(parts, vertex, element_size)
 
     # End namespace
     parts.append('}\n')
 
-    return ''.join(parts)
+
+def gen_vertex_format_setup(parts: List[str], vertex: Vertex, attrib_offsets: List[int], element_size: int,
+                            location_parameters: str) -> None:
+    """
+    Generate SetupVertexFormat and BindVertexBuffer, using the separate attribute format / buffer binding state of 
+    GL 4.3 (ARB_vertex_attrib_binding). The format only needs to be specified once per vertex array object, after which
+    only the buffer binding needs to change with BindVertexBuffer.
+    """
+    parts.append(f'''
+        /// <summary>
+        /// Specify the format of all vertex attributes of the bound vertex array object, sourcing from the vertex
+        /// buffer binding point <paramref name="bindingIndex"/>. Only needs to be done once per vertex array object.
+        /// Afterwards, use <see cref="BindVertexBuffer"/> to change which buffer is read.
+        /// Requires GL 4.3 or ARB_vertex_attrib_binding.
+        /// </summary>
+        public static void SetupVertexFormat(GL gl, uint bindingIndex{location_parameters})
+        {{
+''')
+
+    for attrib, attrib_offset in zip(vertex.attributes, attrib_offsets):
+        normalized = 'true' if attrib.normalized else 'false'
+        type_arg = f'(uint)VertexAttribPointerType.{gl.get_abbreviated_enum_name(attrib.type)}'
+        parts.append(
+            f'            gl.glVertexAttribFormat({attrib.name}_location, {attrib.count}, {type_arg}, {normalized}, {attrib_offset});\n'
+            f'            gl.glVertexAttribBinding({attrib.name}_location, bindingIndex);\n'
+            f'            gl.glEnableVertexAttribArray({attrib.name}_location);\n')
+
+    parts.append(f'''        }}
+
+        /// <summary>
+        /// Bind <paramref name="buffer"/> to the vertex buffer binding point of a vertex array object set up with
+        /// <see cref="SetupVertexFormat"/>, starting at vertex <paramref name="offset"/>.
+        /// Requires GL 4.3 or ARB_vertex_attrib_binding.
+        /// </summary>
+        public static void BindVertexBuffer(GL gl, uint bindingIndex, uint buffer, uint offset = 0)
+        {{
+            gl.glBindVertexBuffer(bindingIndex, buffer, new IntPtr({element_size} * offset), {element_size});
+        }}
+''')
+
+
+def get_attribute_layout(vertex: Vertex) -> Tuple[List[int], int]:
+    """
+    Returns the byte offset of each attribute of the vertex, and the byte size (stride) of the whole vertex.
+    """
+    offsets: List[int] = []
+    current_offset = 0
+    for attrib in vertex.attributes:
+        current_offset = align_up(current_offset, VERTEX_ATTRIBUTE_ALIGNMENT)
+        offsets.append(current_offset)
+        current_offset += gl.get_byte_size_of_vertex_attrib(attrib.type, attrib.count)
+
+    return offsets, align_up(current_offset, VERTEX_ATTRIBUTE_ALIGNMENT)
+
+
+# The shader vertex format (see buffer_type_to_mtlvertexformat in genshaders.py) that reads each kind of attribute, by
+# (type, count, normalized).
+_vertex_formats = {
+    ('GL_FLOAT', 1, False): 'R32_SFLOAT',
+    ('GL_FLOAT', 2, False): 'R32G32_SFLOAT',
+    ('GL_FLOAT', 3, False): 'R32G32B32_SFLOAT',
+    ('GL_FLOAT', 4, False): 'R32G32B32A32_SFLOAT',
+    ('GL_HALF_FLOAT', 1, False): 'R16_SFLOAT',
+    ('GL_HALF_FLOAT', 2, False): 'R16G16_SFLOAT',
+    ('GL_HALF_FLOAT', 4, False): 'R16G16B16A16_SFLOAT',
+    ('GL_INT', 1, False): 'R32_SINT',
+    ('GL_UNSIGNED_INT', 1, False): 'R32_UINT',
+    ('GL_UNSIGNED_BYTE', 1, True): 'R8_UNORM',
+    ('GL_UNSIGNED_BYTE', 2, True): 'R8G8_UNORM',
+    ('GL_UNSIGNED_BYTE', 4, True): 'R8G8B8A8_UNORM',
+    ('GL_UNSIGNED_BYTE', 4, False): 'R8G8B8A8_UINT',
+    ('GL_BYTE', 1, True): 'R8_SNORM',
+    ('GL_BYTE', 2, True): 'R8G8_SNORM',
+    ('GL_BYTE', 4, True): 'R8G8B8A8_SNORM',
+    ('GL_BYTE', 4, False): 'R8G8B8A8_SINT',
+    ('GL_UNSIGNED_SHORT', 1, True): 'R16_UNORM',
+    ('GL_UNSIGNED_SHORT', 2, True): 'R16G16_UNORM',
+    ('GL_UNSIGNED_SHORT', 4, True): 'R16G16B16A16_UNORM',
+    ('GL_UNSIGNED_SHORT', 2, False): 'R16G16_UINT',
+    ('GL_UNSIGNED_SHORT', 4, False): 'R16G16B16A16_UINT',
+    ('GL_SHORT', 1, True): 'R16_SNORM',
+    ('GL_SHORT', 2, True): 'R16G16_SNORM',
+    ('GL_SHORT', 4, True): 'R16G16B16A16_SNORM',
+    ('GL_SHORT', 2, False): 'R16G16_SINT',
+    ('GL_SHORT', 4, False): 'R16G16B16A16_SINT',
+    ('GL_UNSIGNED_INT_2_10_10_10_REV', 4, True): 'A2B10G10R10_UNORM_PACK32',
+    ('GL_INT_2_10_10_10_REV', 4, True): 'A2B10G10R10_SNORM_PACK32',
+}
+
+
+def get_vertex_format(vertex: Vertex, attrib: Attribute) -> str:
+    """
+    Returns the vertex format shaders read the given attribute with, for vertices shared with shaders.
+    """
+    vertex_format = _vertex_formats.get((attrib.type, attrib.count, attrib.normalized))
+    if vertex_format is None:
+        normalized = 'normalized ' if attrib.normalized else ''
+        raise ValueError(f'Attribute {attrib.name} of vertex {vertex.name} can\'t be read by shaders: no vertex format '
+                         f'for {attrib.count} {normalized}{attrib.type} component(s).')
+    return vertex_format
+
+
+def gen_persistent_ring_buffer(parts: List[str], vertex: Vertex, element_size: int) -> None:
+    """
+    Generate a ring buffer class for vertex, backed by a persistently mapped buffer (GL 4.4 / ARB_buffer_storage).
+    Vertices are written straight into the mapped memory through a Span, instead of being copied in with
+    glBufferData/glBufferSubData.
+    """
+    name = f'{vertex.name}PersistentRingBuffer'
+
+    parts.append(f'''    /// <summary>
+    /// A vertex buffer split into <see cref="SectionCount"/> sections, persistently mapped for writing.
+    /// Write one section per frame with <see cref="BeginSection"/> and <see cref="EndSection"/> while the GPU reads
+    /// the others. When not created as coherent, written ranges must be made visible with <see cref="Flush"/>.
+    /// Requires GL 4.4 or ARB_buffer_storage.
+    /// </summary>
+    [GeneratedCode("genbuffers.py", "0")]
+    public sealed unsafe class {name} : IDisposable
+    {{
+        private const uint GL_MAP_WRITE_BIT = 0x0002;
+        private const uint GL_MAP_FLUSH_EXPLICIT_BIT = 0x0010;
+        private const uint GL_MAP_PERSISTENT_BIT = 0x0040;
+        private const uint GL_MAP_COHERENT_BIT = 0x0080;
+        private const uint GL_SYNC_GPU_COMMANDS_COMPLETE = 0x9117;
+        private const uint GL_SYNC_FLUSH_COMMANDS_BIT = 0x00000001;
+        private const uint GL_TIMEOUT_EXPIRED = 0x911B;
+        private const uint GL_WAIT_FAILED = 0x911D;
+
+        private readonly GL _gl;
+        private readonly uint _target;
+        private readonly bool _isCoherent;
+        private readonly IntPtr[] _fences;
+        private {vertex.name}* _mapped;
+        private uint _buffer;
+
+        public uint Buffer => _buffer;
+        public uint VerticesPerSection {{ get; }}
+        public uint SectionCount {{ get; }}
+
+        public {name}(GL gl, BufferTargetARB target, uint verticesPerSection, uint sectionCount, bool coherent = true)
+        {{
+            _gl = gl;
+            _target = (uint)target;
+            _isCoherent = coherent;
+            _fences = new IntPtr[sectionCount];
+            VerticesPerSection = verticesPerSection;
+            SectionCount = sectionCount;
+
+            uint coherencyFlag = coherent ? GL_MAP_COHERENT_BIT : GL_MAP_FLUSH_EXPLICIT_BIT;
+            IntPtr size = new IntPtr((long){element_size} * verticesPerSection * sectionCount);
+
+            uint buffer;
+            gl.glGenBuffers(1, (IntPtr)(&buffer));
+            _buffer = buffer;
+            gl.glBindBuffer(_target, _buffer);
+            gl.glBufferStorage(_target, size, IntPtr.Zero, GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | (coherent ? GL_MAP_COHERENT_BIT : 0));
+            _mapped = ({vertex.name}*)gl.glMapBufferRange(_target, IntPtr.Zero, size, GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | coherencyFlag);
+            if (_mapped == null) {{
+                throw new InvalidOperationException("Failed to persistently map vertex buffer.");
+            }}
+        }}
+
+        /// <summary>
+        /// The index of the first vertex of the given section, for use as the base vertex of draws.
+        /// </summary>
+        public uint GetSectionStartVertex(uint section)
+        {{
+            return section * VerticesPerSection;
+        }}
+
+        /// <summary>
+        /// Wait until the GPU has finished reading the given section, then return the mapped memory of the section.
+        /// </summary>
+        public Span<{vertex.name}> BeginSection(uint section)
+        {{
+            IntPtr fence = _fences[section];
+            if (fence != IntPtr.Zero) {{
+                while (true) {{
+                    uint result = _gl.glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1_000_000);
+                    if (result == GL_WAIT_FAILED) {{
+                        throw new InvalidOperationException("glClientWaitSync failed.");
+                    }}
+                    if (result != GL_TIMEOUT_EXPIRED) {{
+                        break;
+                    }}
+                }}
+                _gl.glDeleteSync(fence);
+                _fences[section] = IntPtr.Zero;
+            }}
+            return new Span<{vertex.name}>(_mapped + GetSectionStartVertex(section), (int)VerticesPerSection);
+        }}
+
+        /// <summary>
+        /// Make vertices written to the given section visible to the GPU. Only needed when not coherent.
+        /// The buffer must be bound to the target it was created with.
+        /// </summary>
+        public void Flush(uint section, uint startVertex, uint vertexCount)
+        {{
+            if (_isCoherent) {{
+                return;
+            }}
+            long offset = (long){element_size} * (GetSectionStartVertex(section) + startVertex);
+            _gl.glFlushMappedBufferRange(_target, new IntPtr(offset), new IntPtr((long){element_size} * vertexCount));
+        }}
+
+        /// <summary>
+        /// Call after the draws reading the given section have been submitted, so that the section isn't written to
+        /// again until the GPU is done with it.
+        /// </summary>
+        public void EndSection(uint section)
+        {{
+            if (_fences[section] != IntPtr.Zero) {{
+                _gl.glDeleteSync(_fences[section]);
+            }}
+            _fences[section] = _gl.glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0);
+        }}
+
+        public void Dispose()
+        {{
+            for (int i = 0; i < _fences.Length; ++i) {{
+                if (_fences[i] != IntPtr.Zero) {{
+                    _gl.glDeleteSync(_fences[i]);
+                    _fences[i] = IntPtr.Zero;
+                }}
+            }}
+            if (_buffer != 0) {{
+                _gl.glBindBuffer(_target, _buffer);
+                _gl.glUnmapBuffer(_target);
+                uint buffer = _buffer;
+                _gl.glDeleteBuffers(1, (IntPtr)(&buffer));
+                _buffer = 0;
+                _mapped = null;
+            }}
+        }}
+    }}
+''')
 
 
 if __name__ == '__main__':
@@ -1,4 +1,8 @@
-from typing import List, Set, Dict
+import argparse
+import hashlib
+import os
+import pickle
+from typing import List, Set, Dict, Optional
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element
 
@@ -8,6 +12,13 @@ GL_TARGET_MINOR = 0
 NAMESPACE = 'CeresGL'
 OUTPUT_PATH = 'GL.Generated.cs'
 
+REGISTRY_PATH = 'gl.xml'
+REGISTRY_CACHE_DIR = '.gengl_cache'
+
+# Bump whenever the layout of the cached Registry (or anything it references) changes, so that stale caches are
+# ignored instead of unpickled into the wrong shape.
+REGISTRY_CACHE_VERSION = 2
+
 
 class Feature(object):
     def __init__(self):
@@ -50,14 +61,88 @@ class Enum(object):
         self.groups: List[str] = []
 
 
-def apply_feature(feature: Feature, element: Element):
+class FeatureDefinition(object):
+    """
+    The parts of a <feature> or <extension> element of the registry that we care about, in a form that can be cached.
+    """
+    def __init__(self):
+        self.name = ''
+        self.api = ''
+        self.number = ''
+        self.supported: List[str] = []
+        self.required_commands: List[str] = []
+        self.required_enums: List[str] = []
+        # Commands required only when generating for a specific api, keyed by api.
+        self.api_required_commands: Dict[str, List[str]] = {}
+        self.removed_commands: List[str] = []
+        self.removed_enums: List[str] = []
+
+
+class Registry(object):
+    """
+    Everything gengl needs out of gl.xml. This is what gets cached, so that regenerating doesn't require re-parsing
+    the (rather large) registry XML.
+    """
+    def __init__(self):
+        self.commands: Dict[str, Command] = {}
+        self.enums: Dict[str, Enum] = {}
+        self.features: List[FeatureDefinition] = []
+        self.extensions: List[FeatureDefinition] = []
+
+
+class Profile(object):
+    """
+    What to generate bindings for: a core version of an api, plus any number of extensions.
+    """
+    def __init__(self, api: str, major: int, minor: int, extensions: List[str]):
+        self.api = api
+        self.major = major
+        self.minor = minor
+        self.extensions = extensions
+
+
+class ExtensionGroup(object):
+    def __init__(self, name: str, commands: List[str]):
+        self.name = name
+        self.commands = commands
+
+    @property
+    def flag_name(self) -> str:
+        return get_extension_flag_name(self.name)
+
+
+def apply_feature(feature: Feature, definition: FeatureDefinition):
+    feature.commands.update(definition.required_commands)
+    feature.enums.update(definition.required_enums)
+
+    feature.commands.difference_update(definition.removed_commands)
+    feature.commands.difference_update(definition.removed_enums)
+
+
+def parse_feature_definition(element: Element) -> FeatureDefinition:
+    definition = FeatureDefinition()
+    definition.name = element.attrib['name']
+    definition.api = element.attrib.get('api', '')
+    definition.number = element.attrib.get('number', '')
+    supported = element.attrib.get('supported', '').strip()
+    if supported:
+        definition.supported = supported.split('|')
+
     for require in element.findall('require'):
-        feature.commands.update([command.attrib['name'] for command in require.findall('command')])
-        feature.enums.update([enum.attrib['name'] for enum in require.findall('enum')])
+        # Extension requirements can be restricted to a single api (e.g. gl vs. gles2).
+        require_api = require.attrib.get('api')
+        if require_api:
+            definition.api_required_commands.setdefault(require_api, []).extend(
+                command.attrib['name'] for command in require.findall('command'))
+            continue
+        definition.required_commands.extend(command.attrib['name'] for command in require.findall('command'))
+        definition.required_enums.extend(enum.attrib['name'] for enum in require.findall('enum'))
 
     for remove in element.findall('remove'):
-        feature.commands.difference_update([command.attrib['name'] for command in remove.findall('command')])
-        feature.commands.difference_update([enum.attrib['name'] for enum in remove.findall('enum')])
+        definition.removed_commands.extend(command.attrib['name'] for command in remove.findall('command'))
+        definition.removed_enums.extend(enum.attrib['name'] for enum in remove.findall('enum'))
+
+    return definition
 
 
 def parse_type(element: Element) -> Type:
@@ -119,53 +204,196 @@ def parse_enum(element: Element) -> Enum:
     return enum
 
 
+def parse_registry(xml_path: str) -> Registry:
+    """
+    Parse gl.xml into a Registry. Uses iterparse so that each top level element can be thrown away as soon as it has
+    been digested, instead of holding the whole element tree in memory.
+    """
+    registry = Registry()
+
+    # Stack of the tags of the elements we're currently inside of.
+    tag_stack: List[str] = []
+
+    for event, element in ElementTree.iterparse(xml_path, events=('start', 'end')):
+        if event == 'start':
+            tag_stack.append(element.tag)
+            continue
+
+        tag_stack.pop()
+        parent_tag = tag_stack[-1] if tag_stack else ''
+
+        if element.tag == 'command' and parent_tag == 'commands':
+            command = parse_command(element)
+            registry.commands[command.name] = command
+            element.clear()
+        elif element.tag == 'enum' and parent_tag == 'enums':
+            enum = parse_enum(element)
+            registry.enums[enum.name] = enum
+            element.clear()
+        elif element.tag == 'feature' and parent_tag == 'registry':
+            registry.features.append(parse_feature_definition(element))
+            element.clear()
+        elif element.tag == 'extension' and parent_tag == 'extensions':
+            registry.extensions.append(parse_feature_definition(element))
+            element.clear()
+        elif parent_tag == 'registry':
+            # Some other top level element (types, kinds, etc.) that we don't use.
+            element.clear()
+
+    return registry
+
+
+def get_registry_cache_path(xml_path: str, cache_dir: str) -> str:
+    hasher = hashlib.sha256()
+    with open(xml_path, 'rb') as f:
+        hasher.update(f.read())
+    return os.path.join(cache_dir, f'registry.{REGISTRY_CACHE_VERSION}.{hasher.hexdigest()}.pickle')
+
+
+def load_registry(xml_path: str, cache_dir: Optional[str] = REGISTRY_CACHE_DIR) -> Registry:
+    """
+    Load the registry from the cache keyed by the hash of gl.xml, parsing (and caching) gl.xml on a cache miss.
+    Pass a cache_dir of None to always parse.
+    """
+    if cache_dir is None:
+        return parse_registry(xml_path)
+
+    cache_path = get_registry_cache_path(xml_path, cache_dir)
+    if os.path.isfile(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            print(f'Ignoring unreadable registry cache {cache_path}: {e}')
+
+    registry = parse_registry(xml_path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first so that an interrupted run can't leave a truncated cache behind.
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump(registry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, cache_path)
+
+    return registry
+
+
+argparser = argparse.ArgumentParser(description='Generate C# GL bindings from the Khronos gl.xml registry.')
+argparser.add_argument('--registry', default=REGISTRY_PATH, help='Path to gl.xml.')
+argparser.add_argument('--output', default=OUTPUT_PATH, help='Path of the C# file to generate.')
+argparser.add_argument('--api', default='gl', help='Registry api to generate for. Defaults to gl.')
+argparser.add_argument('--version', default=f'{GL_TARGET_MAJOR}.{GL_TARGET_MINOR}',
+                       help='Core version to generate, as MAJOR.MINOR.')
+argparser.add_argument('--extension', dest='extensions', action='append', default=[],
+                       help='Name of an extension to generate entry points for, e.g. GL_ARB_buffer_storage. '
+                            'Can be given multiple times, or as a comma delimited list.')
+argparser.add_argument('--no-cache', default=False, action='store_true',
+                       help='Always parse the registry, ignoring and not writing the parsed registry cache.')
+
+
+def parse_profile(args) -> Profile:
+    major, minor = args.version.split('.', maxsplit=1)
+
+    extensions: List[str] = []
+    for extension_arg in args.extensions:
+        for name in extension_arg.split(','):
+            name = name.strip()
+            if name and name not in extensions:
+                extensions.append(name)
+
+    return Profile(args.api, int(major), int(minor), sorted(extensions))
+
+
+def get_extension_flag_name(extension_name: str) -> str:
+    if extension_name.startswith('GL_'):
+        extension_name = extension_name[3:]
+    return extension_name
+
+
+def find_extension_groups(registry: Registry, profile: Profile, core_commands: Set[str]) -> List[ExtensionGroup]:
+    """
+    Find the commands needed by each extension in the profile that aren't already provided by the core version.
+    """
+    definitions_by_name = {definition.name: definition for definition in registry.extensions}
+
+    groups: List[ExtensionGroup] = []
+    for name in profile.extensions:
+        definition = definitions_by_name.get(name)
+        if definition is None:
+            raise ValueError(f'Extension {name} is not in the registry')
+        if profile.api not in definition.supported:
+            raise ValueError(f'Extension {name} is not supported by api {profile.api} '
+                             f'(supported: {"|".join(definition.supported)})')
+
+        required_commands = set(definition.required_commands)
+        required_commands.update(definition.api_required_commands.get(profile.api, []))
+        commands = sorted(required_commands - core_commands)
+        groups.append(ExtensionGroup(name, commands))
+
+    return groups
+
+
 def main():
-    tree = ElementTree.parse('gl.xml')
-    commands_elem = tree.getroot().find('commands')
-    feature_elems: List[Element] = tree.getroot().findall('feature')
-    enums_elems: List[Element] = tree.getroot().findall('enums')
+    args = argparser.parse_args()
+    profile = parse_profile(args)
+    registry = load_registry(args.registry, None if args.no_cache else REGISTRY_CACHE_DIR)
 
     feature = Feature()
 
-    for feature_elem in feature_elems:
-        if feature_elem.attrib['api'] != 'gl':
+    for definition in registry.features:
+        if definition.api != profile.api:
             continue
 
-        major, minor = feature_elem.attrib['number'].split('.', maxsplit=2)
-        if int(major) > GL_TARGET_MAJOR:
+        major, minor = definition.number.split('.', maxsplit=2)
+        if int(major) > profile.major:
             continue
 
-        if int(major) == GL_TARGET_MAJOR and int(minor) > GL_TARGET_MINOR:
+        if int(major) == profile.major and int(minor) > profile.minor:
             continue
 
-        apply_feature(feature, feature_elem)
+        apply_feature(feature, definition)
 
-    commands: Dict[str, Command] = {}
+    commands = registry.commands
 
-    for command_elem in commands_elem.findall('command'):
-        command = parse_command(command_elem)
-        commands[command.name] = command
+    extension_groups = find_extension_groups(registry, profile, feature.commands)
+    if extension_groups:
+        # Extension availability is queried with the indexed GL_EXTENSIONS query, which needs GL 3.0.
+        for required_command in ('glGetIntegerv', 'glGetStringi'):
+            if required_command not in feature.commands:
+                raise ValueError(f'Generating extensions requires {required_command}, which is not in '
+                                 f'{profile.api} {profile.major}.{profile.minor}')
 
     #
-    # Parse and organise enums
+    # Organise enums
     #
-    enums: Dict[str, Enum] = {}
     enums_by_group: Dict[str, List[Enum]] = {}
 
-    for enums_element in enums_elems:
-        for enum_element in enums_element.findall('enum'):
-            enum = parse_enum(enum_element)
-            enums[enum.name] = enum
-
-            for group in enum.groups:
-                group_list = enums_by_group.get(group)
-                if group_list is None:
-                    group_list = []
-                    enums_by_group[group] = group_list
-                group_list.append(enum)
+    for enum in registry.enums.values():
+        for group in enum.groups:
+            group_list = enums_by_group.get(group)
+            if group_list is None:
+                group_list = []
+                enums_by_group[group] = group_list
+            group_list.append(enum)
 
     enum_groups = set(enums_by_group.keys())
 
+    # Everything emitted below is iterated in sorted order, never in set order. Set iteration order changes between
+    # runs due to hash randomisation, which would cause GL.Generated.cs to change (and be recompiled) every time.
+    sorted_group_names = sorted(enums_by_group.keys())
+    sorted_command_names = sorted(feature.commands)
+
+    # Commands of each extension group, skipping commands already emitted by the core version or an earlier extension.
+    # (Several extensions can share entry points)
+    emitted_command_names = set(sorted_command_names)
+    extension_command_names: Dict[str, List[str]] = {}
+    for group in extension_groups:
+        group_command_names = [name for name in group.commands if name not in emitted_command_names]
+        emitted_command_names.update(group_command_names)
+        extension_command_names[group.name] = group_command_names
+
+    core_group_title = f'{profile.api} {profile.major}.{profile.minor}'
+
     #
     # Generate Usings, Namespace Opening, and Class Opening
     #
@@ -182,7 +410,8 @@ namespace {NAMESPACE}
     # Generate Enums classes
     #
 
-    for group_name, enum_list in enums_by_group.items():
+    for group_name in sorted_group_names:
+        enum_list = enums_by_group[group_name]
         builder.append(f'    {get_codegen_attribute()}\n    public enum {group_name} : uint\n    {{\n')
 
         for enum in enum_list:
@@ -206,14 +435,30 @@ namespace {NAMESPACE}
     {{
 ''')
 
+    #
+    # Generate extension availability flags
+    #
+    for group in extension_groups:
+        builder.append(f'        /// <summary>True if the driver supports {group.name}. Only valid after Init().'
+                       f'</summary>\n')
+        builder.append(f'        public bool {group.flag_name} {{ get; private set; }}\n\n')
+
     #
     # Generate Commands delegates and fields
     #
     builder.append('        #pragma warning disable CS8618\n\n')
 
-    for command_name in feature.commands:
+    builder.append(f'        // {core_group_title}\n\n')
+    for command_name in sorted_command_names:
         builder.extend(gen_command_field(commands[command_name]))
 
+    for group in extension_groups:
+        if not extension_command_names[group.name]:
+            continue
+        builder.append(f'        // {group.name}\n\n')
+        for command_name in extension_command_names[group.name]:
+            builder.extend(gen_command_field(commands[command_name]))
+
     builder.append('        #pragma warning restore CS8618\n\n')
 
     #
@@ -227,9 +472,23 @@ namespace {NAMESPACE}
     #
     # Generate loading code inside the Init() method.
     #
-    for command_name in feature.commands:
+    for command_name in sorted_command_names:
         builder.extend(gen_command_loading_code(commands[command_name]))
 
+    #
+    # Generate extension detection and loading code inside the Init() method.
+    # Entry points of an extension are only loaded if the driver reports the extension as supported.
+    #
+    if extension_groups:
+        builder.extend(gen_extension_query_code(extension_groups))
+
+    for group in extension_groups:
+        builder.append(f'\n            if ({group.flag_name}) {{\n')
+        for command_name in group.commands:
+            builder.append('    ')
+            builder.extend(gen_command_loading_code(commands[command_name]))
+        builder.append('            }\n')
+
     #
     # Close the Init() method.
     #
@@ -238,9 +497,13 @@ namespace {NAMESPACE}
     #
     # Generate wrapper methods
     #
-    for command_name in feature.commands:
+    for command_name in sorted_command_names:
         builder.extend(gen_wrapper_method(enum_groups, commands[command_name]))
 
+    for group in extension_groups:
+        for command_name in extension_command_names[group.name]:
+            builder.extend(gen_wrapper_method(enum_groups, commands[command_name]))
+
     #
     # Close the GL class, close the namespace. EOF.
     #
@@ -249,9 +512,26 @@ namespace {NAMESPACE}
 }
 ''')
 
-    with open(OUTPUT_PATH, 'w') as f:
-        for part in builder:
-            f.write(part)
+    if write_if_changed(args.output, ''.join(builder)):
+        print(f'Wrote {args.output}')
+    else:
+        print(f'{args.output} is up to date')
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """
+    Write content to path, unless the file already has exactly that content. Leaving the file untouched keeps its
+    modification time, so that builds depending on it aren't needlessly redone.
+    Returns True if the file was written.
+    """
+    if os.path.isfile(path):
+        with open(path, 'r', newline='') as f:
+            if f.read() == content:
+                return False
+
+    with open(path, 'w', newline='') as f:
+        f.write(content)
+    return True
 
 
 def get_codegen_attribute() -> str:
@@ -293,6 +573,32 @@ def gen_command_loading_code(command: Command) -> List[str]:
     return parts
 
 
+def gen_extension_query_code(extension_groups: List[ExtensionGroup]) -> List[str]:
+    parts = ['\n']
+    append_method_code(
+        parts,
+        'int numExtensions = 0;',
+        'unsafe {',
+        '    glGetIntegerv(0x821D /* GL_NUM_EXTENSIONS */, (IntPtr)(&numExtensions));',
+        '}',
+        'for (uint i = 0; i < numExtensions; ++i) {',
+        '    switch (Marshal.PtrToStringAnsi(glGetStringi(0x1F03 /* GL_EXTENSIONS */, i))) {',
+    )
+    for group in extension_groups:
+        append_method_code(
+            parts,
+            f'        case "{group.name}":',
+            f'            {group.flag_name} = true;',
+            '            break;'
+        )
+    append_method_code(
+        parts,
+        '    }',
+        '}'
+    )
+    return parts
+
+
 # =============================================================================
 #
 # Wrapper Method Generation Code
@@ -1,16 +1,20 @@
+import hashlib
 import os
 import re
 from enum import Enum, auto
-from typing import List, Dict, Any, TextIO, Set, Optional
+from typing import List, Dict, Any, TextIO, Set, Optional, Tuple
+
+from .gl import VERTEX_ATTRIBUTE_ALIGNMENT, align_up
 
 
 class Member(object):
     def __init__(self, name: str, type: str, offset: int, matrix_stride: int, array_sizes: List[int],
-                 array_size_is_literal: bool, array_stride: int):
+                 array_size_is_literal: bool, array_stride: int, row_major: bool = False):
         self.name = name
         self.type = type
         self.offset = offset
         self.matrix_stride = matrix_stride
+        self.row_major = row_major
         self.array_sizes = array_sizes
         self.array_size_is_literal = array_size_is_literal
         self.array_stride = array_stride
@@ -92,19 +96,65 @@ class InputDirective(object):
         self.buffer_type = ''
 
 
+# noinspection PyArgumentList
+class SpirvOptPreset(Enum):
+    NONE = auto()
+    PERFORMANCE = auto()
+    SIZE = auto()
+
+
 class ShaderDirectives(object):
     def __init__(self):
         self.full_class_name = ''
         self.input_directives_by_input_name: Dict[str, InputDirective] = {}
         self.descriptor_field_hints_by_name: Dict[str, str] = {}
+        # None when the shader doesn't specify a preset, in which case the command line default is used.
+        self.spirv_opt_preset: Optional[SpirvOptPreset] = None
+        # Preprocessor defines of each variant, by variant name. Doesn't include the default variant.
+        self.variant_defines_by_name: Dict[str, List[str]] = {}
+        # Names of structs to emit a Writer for.
+        self.writer_struct_names: Set[str] = set()
+
+
+class ShaderVariant(object):
+    def __init__(self, name: str, resource_prefix: str, archive_prefix: str, spirv_digest: bytes = b''):
+        self.name = name
+        self.resource_prefix = resource_prefix
+        self.archive_prefix = archive_prefix
+        self.spirv_digest = spirv_digest
+        # Reflection of the variant's own code, to check that it has the interface of the default variant. Empty for
+        # variants which share the code of the default variant.
+        self.reflections_by_stage: Dict[ShaderStage, SpirvReflection] = {}
 
 
 class Shader(object):
-    def __init__(self, resource_prefix: str, directives: ShaderDirectives,
+    def __init__(self, resource_prefix: str, archive_prefix: str, directives: ShaderDirectives,
                  reflections_by_stage: Dict[ShaderStage, SpirvReflection]):
         self.resource_prefix = resource_prefix
+        # Prefix of this shader's entries in the shader archive, if one is built.
+        self.archive_prefix = archive_prefix
         self.directives = directives
         self.reflections_by_stage = reflections_by_stage
+        # Variants other than the default one. They must have the same interface as the default variant, as the
+        # generated class is based on its reflection.
+        self.variants: List[ShaderVariant] = []
+        # Digest of the linked Vulkan SPIR-V of the default variant. Part of the interface hash, so that it changes
+        # whenever the compiled code does.
+        self.spirv_digest = b''
+        # Vertex structs defined outside of the shader, by name.
+        self.shared_structures_by_name: Dict[str, SharedVertexStructure] = {}
+
+
+class SharedVertexStructure(object):
+    """
+    A vertex struct defined in a .buffer.json file instead of by the shader. Shaders naming it with // #input struct:
+    read its attributes at the offsets of the definition, so that they all share one struct and vertex layout.
+    """
+    def __init__(self, full_name: str, stride: int):
+        self.full_name = full_name
+        self.stride = stride
+        # Offset and vertex format of each attribute, by attribute name.
+        self.attributes_by_name: Dict[str, Tuple[int, str]] = {}
 
 
 class InputAttribute(object):
@@ -142,10 +192,11 @@ def parse_member(data: Dict[str, Any]) -> Member:
         name=data['name'],
         type=data['type'],
         offset=data['offset'],
-        matrix_stride=data.get('array_stride', 0),
+        matrix_stride=data.get('matrix_stride', 0),
         array_sizes=data.get('array', []),
         array_size_is_literal=data.get('array_size_is_literal', False),
-        array_stride=data.get('array_stride', 0)
+        array_stride=data.get('array_stride', 0),
+        row_major=data.get('row_major', False)
     )
 
 
@@ -222,6 +273,20 @@ def parse_shader_directives(path: str) -> ShaderDirectives:
                     name, hint = [part.strip() for part in directive_value.strip().split('=', maxsplit=2)]
                     data.descriptor_field_hints_by_name[name] = hint
 
+                if directive_name == 'SpirvOpt':
+                    data.spirv_opt_preset = SpirvOptPreset[directive_value.strip().upper()]
+
+                if directive_name == 'UniformWriter':
+                    # e.g. // #UniformWriter: FrameConstants
+                    data.writer_struct_names.update(directive_value.split())
+
+                if directive_name == 'Variant':
+                    # e.g. // #Variant: Skinned SKINNED MAX_BONES=64
+                    name, *defines = directive_value.split()
+                    if not re.fullmatch(r'[A-Za-z_]\w*', name) or name == 'Default':
+                        raise ValueError(f'Invalid shader variant name {name} in {path}')
+                    data.variant_defines_by_name[name] = defines
+
             input_match = input_pattern.search(line)
             if input_match:
                 input_name = input_match.group(1)
@@ -280,6 +345,56 @@ def make_multiline_cs_string_literal(lines: List[str]) -> str:
     return ''.join(parts)
 
 
+def hash64(*parts: Any) -> int:
+    """
+    64 bit hash of the given values, made of tuples, lists, strings and numbers. Unlike hash(), the result is the same
+    across runs and machines.
+    """
+    return int.from_bytes(hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def format_hash(value: int) -> str:
+    return f'0x{value:016X}UL'
+
+
+def get_shader_interface_hash(shader: Shader, attributes_by_index: List[Optional['InputAttribute']], 
+                              spirv_digest: bytes) -> int:
+    """
+    Hashes everything about a shader that pipeline creation depends on: its vertex inputs, its descriptor layout and
+    its compiled code.
+    """
+    vertex_inputs = []
+    for attribute in attributes_by_index:
+        if attribute is None:
+            vertex_inputs.append(None)
+        else:
+            buffer_type = attribute.directive.buffer_type or spirv_to_default_buffer_types[attribute.input.type]
+            vertex_inputs.append((attribute.input.location, attribute.input.type, buffer_type))
+    
+    descriptors = []
+    for stage, reflection in sorted(shader.reflections_by_stage.items(), key=lambda x: x[0].value):
+        descriptors.extend(('ubo', stage.value, ubo.set, ubo.binding, ubo.block_size) for ubo in reflection.ubos)
+        descriptors.extend(('ssbo', stage.value, ssbo.set, ssbo.binding, ssbo.block_size) for ssbo in reflection.ssbos)
+        descriptors.extend(('texture', stage.value, tex.set, tex.binding, tex.type) for tex in reflection.textures)
+    
+    return hash64(vertex_inputs, descriptors, spirv_digest.hex())
+
+
+def get_vertex_buffer_layout_hash(input_attributes_by_structure: Dict[str, List['InputAttribute']],
+                                  strides_by_structure: Dict[str, int]) -> int:
+    """
+    Hashes the buffer and attribute descriptors of a generated DefaultVertexBufferLayout.
+    """
+    buffers = []
+    for structure_name, attributes in input_attributes_by_structure.items():
+        buffers.append((
+            attributes[0].directive.step_mode.name,
+            strides_by_structure[structure_name],
+            [(attribute.input.location, attribute.offset) for attribute in attributes]
+        ))
+    return hash64(buffers)
+
+
 def generate_shader_file(output_path: str, shader: Shader):
     output_dir = os.path.dirname(output_path)
     os.makedirs(output_dir, exist_ok=True)
@@ -305,6 +420,58 @@ def generate_shader_file(output_path: str, shader: Shader):
         generate_shader_class(SourceWriter(f), shader)
 
 
+def gen_variant_declarations(f: SourceWriter, shader: Shader):
+    class_name = shader.directives.full_class_name.split('.')[-1]
+    
+    f.write_line(
+        'public enum Variant',
+        '{',
+        '    Default,',
+        *(f'    {variant.name},' for variant in shader.variants),
+        '}',
+        '',
+        'public Variant ShaderVariant { get; }',
+        '',
+    )
+    
+    # Indexed by Variant. Variants with the same defines share their compiled code, and so their prefixes.
+    archive_prefixes = [shader.archive_prefix] + [variant.archive_prefix for variant in shader.variants]
+    resource_prefixes = [shader.resource_prefix] + [variant.resource_prefix for variant in shader.variants]
+    f.write_line(
+        'private static readonly string[] _variantArchivePrefixes = {',
+        *(f'    "{make_cs_string_literal(prefix)}",' for prefix in archive_prefixes),
+        '};',
+        '',
+        'private static readonly string[] _variantResourcePrefixes = {',
+        *(f'    "{make_cs_string_literal(prefix)}",' for prefix in resource_prefixes),
+        '};',
+        '',
+    )
+    
+    # A subclass per variant, so that each variant is a distinct shader type to ShaderManager.GetShader<T>().
+    for variant in shader.variants:
+        f.write_line(
+            f'public sealed class {variant.name}Variant : {class_name}',
+            '{',
+            f'    public {variant.name}Variant() : base(Variant.{variant.name})',
+            '    {',
+            '    }',
+            '}',
+            '',
+        )
+    
+    f.write_line(
+        f'public static {class_name} Create(Variant variant)',
+        '{',
+        '    return variant switch {',
+        *(f'        Variant.{variant.name} => new {variant.name}Variant(),' for variant in shader.variants),
+        f'        _ => new {class_name}()',
+        '    };',
+        '}',
+        '',
+    )
+
+
 def generate_shader_class(f: SourceWriter, shader: Shader):
     directives = shader.directives
     # reflection = shader.reflection
@@ -324,6 +491,30 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
     for input_attributes in input_attributes_by_structure.values():
         input_attributes.sort(key=lambda attrib: attrib.input.location)
 
+    # Attributes of shared structs are where the definition puts them, in its format.
+    for structure_name, attributes in input_attributes_by_structure.items():
+        shared_structure = shader.shared_structures_by_name.get(structure_name)
+        if shared_structure is None:
+            continue
+        for attribute in attributes:
+            if attribute.name not in shared_structure.attributes_by_name:
+                raise ValueError(f'Input {attribute.name} of shader {class_name} is in struct {structure_name}, but '
+                                 f'{shared_structure.full_name} has no attribute {attribute.name}.')
+            offset, buffer_type = shared_structure.attributes_by_name[attribute.name]
+            if attribute.directive.buffer_type and attribute.directive.buffer_type != buffer_type:
+                raise ValueError(f'Input {attribute.name} of shader {class_name} has buffertype '
+                                 f'{attribute.directive.buffer_type}, but is {buffer_type} in '
+                                 f'{shared_structure.full_name}.')
+            attribute.offset = offset
+            attribute.directive.buffer_type = buffer_type
+
+    # Type names of the vertex structs, for use inside the generated class.
+    cs_names_by_structure = {
+        structure_name: f'global::{shader.shared_structures_by_name[structure_name].full_name}' 
+        if structure_name in shader.shared_structures_by_name else structure_name
+        for structure_name in input_attributes_by_structure
+    }
+
     # Using statements
     f.write_line(
         '#nullable enable',
@@ -332,6 +523,7 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
         'using System.CodeDom.Compiler;',
         'using System.IO;',
         'using System.Numerics;',
+        'using System.Runtime.CompilerServices;',
         'using System.Runtime.InteropServices;',
         'using CeresGL;',
         'using CeresGpu.Graphics;',
@@ -339,6 +531,7 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
         'using CeresGpu.Graphics.OpenGL;',
         'using CeresGpu.Graphics.Metal;',
         'using CeresGpu.Graphics.Vulkan;',
+        'using Vk = Silk.NET.Vulkan;',
         ''
     )
 
@@ -350,7 +543,7 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
     # Begin Class
     f.write_line(
         '[GeneratedCode("genshaders.py", "0")]',
-        f'public class {class_name} : IShader',
+        f'public class {class_name} : IShader, IVulkanBakedShader',
         '{',
         '    public IShaderBacking? Backing { get; set; }',
         '    public readonly ShaderVertexAttributeDescriptor[] _vertexAttributeDescriptors;',
@@ -358,12 +551,26 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
     )
     f.indent()
     
+    if shader.variants:
+        gen_variant_declarations(f, shader)
+    
     # Begin Constructor
 
-    f.write_line(
-        f'public {class_name}()',
-        '{',
-    )
+    if shader.variants:
+        f.write_line(
+            f'public {class_name}() : this(Variant.Default)',
+            '{',
+            '}',
+            '',
+            f'protected {class_name}(Variant variant)',
+            '{',
+            '    ShaderVariant = variant;',
+        )
+    else:
+        f.write_line(
+            f'public {class_name}()',
+            '{',
+        )
     f.indent()
 
     # Output initialization of _vertexAttributeDescriptors in constructor
@@ -565,43 +772,92 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
         ''
     )
 
-    # Emit GetShaderResource Method
+    # Emit GetShaderResource Method. Prefer the assembly's shader archive, and fall back to individually embedded
+    # resources for projects which don't pack their shaders.
+    if shader.variants:
+        archive_prefix_expression = '_variantArchivePrefixes[(int)ShaderVariant]'
+        resource_prefix_expression = '_variantResourcePrefixes[(int)ShaderVariant]'
+    else:
+        archive_prefix_expression = f'"{make_cs_string_literal(shader.archive_prefix)}"'
+        resource_prefix_expression = f'"{make_cs_string_literal(shader.resource_prefix)}"'
     f.write_line(
         'public Stream? GetShaderResource(string postfix)',
         '{',
         f'    Type thisType = typeof({class_name});',
-        f'    return thisType.Assembly.GetManifestResourceStream(thisType, "{make_cs_string_literal(shader.resource_prefix)}" + postfix);',
+        f'    Stream? archived = ShaderArchive.Get(thisType.Assembly)?.OpenEntry({archive_prefix_expression} + postfix);',
+        '    if (archived != null) {',
+        '        return archived;',
+        '    }',
+        f'    return thisType.Assembly.GetManifestResourceStream(thisType, {resource_prefix_expression} + postfix);',
         # f'    return "{shader.resource_prefix}";',
         '}',
         '',
+        'public ShaderArtifacts Artifacts => ShaderArtifacts.GLSource | ShaderArtifacts.GLSpirv | ShaderArtifacts.VulkanSpirv | ShaderArtifacts.MetalSource;',
+        '',
     )
+    
+    # Emit InterfaceHash, which backends can key pipeline caches on.
+    interface_hashes = [get_shader_interface_hash(shader, attributes_by_index, shader.spirv_digest)]
+    interface_hashes.extend(get_shader_interface_hash(shader, attributes_by_index, variant.spirv_digest) 
+                            for variant in shader.variants)
+    if shader.variants:
+        f.write_line(
+            'private static readonly ulong[] _variantInterfaceHashes = {',
+            *(f'    {format_hash(h)},' for h in interface_hashes),
+            '};',
+            '',
+            'public ulong InterfaceHash => _variantInterfaceHashes[(int)ShaderVariant];',
+            '',
+        )
+    else:
+        f.write_line(f'public ulong InterfaceHash => {format_hash(interface_hashes[0])};', '')
 
-    # Emit Structures
+    # Emit Structures. Structs shared between stages are only emitted once.
+    layouts = StructLayouts(list(shader.reflections_by_stage.values()))
+    emitted_structures: Dict[str, ShaderType] = {}
     for reflection in shader.reflections_by_stage.values():
         for type in reflection.types.values():
-            gen_structure(f, type, reflection, shader.directives.descriptor_field_hints_by_name)
+            if type.name in emitted_structures:
+                continue
+            emitted_structures[type.name] = type
+            gen_structure(f, type, reflection, shader.directives.descriptor_field_hints_by_name, layouts,
+                          type.name in shader.directives.writer_struct_names)
+    
+    if layouts.sizes_by_name:
+        gen_structure_size_checks(f, shader, layouts)
 
     current_vert_buffer_index = 0
     for structure_name, attributes in input_attributes_by_structure.items():
+        shared_structure = shader.shared_structures_by_name.get(structure_name)
+        if shared_structure is not None:
+            strides_by_structure[structure_name] = shared_structure.stride
+            f.write_line(f'private const int VERT_BUFFER_INDEX_{structure_name} = {current_vert_buffer_index};', '')
+            current_vert_buffer_index += 1
+            continue
+        
+        # Lay out the attributes first, so that the struct size is known up front.
+        current_offset = 0
+        for attribute in attributes:
+            cs_type = get_cs_type(attribute.input, attribute.directive)
+            current_offset = align_up(current_offset, VERTEX_ATTRIBUTE_ALIGNMENT)
+            attribute.offset = current_offset
+            current_offset += cs_sizes[cs_type]
+
+        strides_by_structure[structure_name] = align_up(current_offset, VERTEX_ATTRIBUTE_ALIGNMENT)
+
         f.write_line(
-            '[StructLayout(LayoutKind.Explicit)]',
+            f'[StructLayout(LayoutKind.Explicit, Size = {strides_by_structure[structure_name]})]',
             f'public struct {structure_name}',
             '{'
         )
         f.indent()
 
-        current_offset = 0
         for attribute in attributes:
             input = attribute.input
-            input_directive = directives.input_directives_by_input_name.get(input.name, InputDirective())
-            cs_type = get_cs_type(input, input_directive)
+            cs_type = get_cs_type(input, attribute.directive)
             if attribute.directive.hint:
                 f.write_line(f'[Hint("{make_cs_string_literal(attribute.directive.hint)}")]')
-            f.write_line(f'[FieldOffset({current_offset})] public {cs_type} {input.name};')
-            attribute.offset = current_offset
-            current_offset += cs_sizes[cs_type]
-
-        strides_by_structure[structure_name] = current_offset
+            f.write_line(f'[FieldOffset({attribute.offset})] public {cs_type} {input.name};')
 
         f.deindent()
         f.write_line('}', '')
@@ -623,6 +879,7 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
         '    private readonly VblAttributeDescriptor[] _attributeDescriptors;',
         '    public ReadOnlySpan<VblBufferDescriptor> BufferDescriptors => _bufferDescriptors;',
         '    public ReadOnlySpan<VblAttributeDescriptor> AttributeDescriptors => _attributeDescriptors;',
+        f'    public ulong LayoutHash => {format_hash(get_vertex_buffer_layout_hash(input_attributes_by_structure, strides_by_structure))};',
         ''
     )
     f.indent()
@@ -657,7 +914,7 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
             'new VblBufferDescriptor() {',
             f'    StepFunction = VertexStepFunction.{step_mode},',
             f'    Stride = {strides_by_structure[structure_name]},',
-            f'    BufferType = typeof({structure_name})',
+            f'    BufferType = typeof({cs_names_by_structure[structure_name]})',
             '},'
         )
     f.deindent()
@@ -696,23 +953,42 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
         ''
     )
     
+    gen_vulkan_descriptor_set_layouts(f, shader)
+
     # DefaultVertexBufferAdapter class
+    # Buffers are kept in typed fields, and handed to backends through a struct visitor, so that binding the vertex
+    # buffers on a draw doesn't involve any casts or boxing.
+    buffer_field_names = {
+        structure_name: f'_{structure_name[0].lower()}{structure_name[1:]}Buffer'
+        for structure_name in input_attributes_by_structure
+    }
     f.write_line(
         f'public class DefaultVertexBufferAdapter : IVertexBufferAdapter<{class_name}, DefaultVertexBufferLayout>',
-        '{',
-        f'    private readonly object[] _buffers = new object[{len(input_attributes_by_structure)}];',
+        '{'
+    )
+    f.indent()
+    for structure_name, field_name in buffer_field_names.items():
+        f.write_line(f'private IBuffer<{cs_names_by_structure[structure_name]}>? {field_name};')
+    f.write_line(
         '',
-        '    ReadOnlySpan<object?> IUntypedVertexBufferAdapter.VertexBuffers => _buffers;',
+        f'public int VertexBufferCount => {len(input_attributes_by_structure)};',
         ''
     )
-    f.indent()
-    for structure_name, attributes in input_attributes_by_structure.items():
+    for structure_name, field_name in buffer_field_names.items():
         f.write_line(
-            f'public void Set{structure_name}(IBuffer<{structure_name}> buffer)',
+            f'public void Set{structure_name}(IBuffer<{cs_names_by_structure[structure_name]}> buffer)',
             '{',
-            f'    _buffers[VERT_BUFFER_INDEX_{structure_name}] = buffer;',
-            '}'
+            f'    {field_name} = buffer;',
+            '}',
+            ''
         )
+    f.write_line(
+        'public void VisitVertexBuffers<TVisitor>(ref TVisitor visitor) where TVisitor : struct, IVertexBufferVisitor',
+        '{'
+    )
+    for structure_name, field_name in buffer_field_names.items():
+        f.write_line(f'    visitor.Visit(VERT_BUFFER_INDEX_{structure_name}, {field_name});')
+    f.write_line('}')
     f.deindent()
     f.write_line('}', '')
     
@@ -830,28 +1106,249 @@ def generate_shader_class(f: SourceWriter, shader: Shader):
     f.write_line('}')
 
 
-def gen_structure(f: SourceWriter, shader_type: ShaderType, reflection: SpirvReflection, hints: Dict[str, str]):
-    size = -1
-    for member in shader_type.members:
-        if len(member.array_sizes) == 1 and member.array_sizes[0] == 0:
-            size = max(size, member.offset + member.array_stride)
+spirv_descriptor_kind_to_vk_descriptor_type = {
+    'ubo': 'UniformBuffer',
+    'ssbo': 'StorageBuffer',
+    # spirv-cross reflects combined image samplers as textures.
+    'texture': 'CombinedImageSampler',
+}
 
-    if size > 0:
-        f.write_line(f'[StructLayout(LayoutKind.Explicit, Size={size})]')
-    else:
-        f.write_line(f'[StructLayout(LayoutKind.Explicit)]')
+
+def gen_vulkan_descriptor_set_layouts(f: SourceWriter, shader: Shader):
+    """
+    Emit the Vulkan descriptor set layout bindings and per set descriptor type counts of the shader, implementing
+    IVulkanBakedShader. Descriptors are visited in the same order as the emitted DescriptorInfos.
+    """
+    bindings_by_set: Dict[int, List[Tuple[int, str]]] = {}
+    counts_by_set: Dict[int, Dict[str, int]] = {}
+
+    for reflection in shader.reflections_by_stage.values():
+        descriptors: List[Tuple[str, int, int]] = []  # (kind, set, binding)
+        descriptors.extend(('ubo', ubo.set, ubo.binding) for ubo in reflection.ubos)
+        descriptors.extend(('ssbo', ssbo.set, ssbo.binding) for ssbo in reflection.ssbos)
+        descriptors.extend(('texture', tex.set, tex.binding) for tex in reflection.textures)
+
+        for kind, descriptor_set, binding in descriptors:
+            vk_type = spirv_descriptor_kind_to_vk_descriptor_type[kind]
+            bindings_by_set.setdefault(descriptor_set, []).append((binding, vk_type))
+            counts = counts_by_set.setdefault(descriptor_set, {})
+            counts[vk_type] = counts.get(vk_type, 0) + 1
+
+    num_sets = max(bindings_by_set.keys()) + 1 if bindings_by_set else 0
+
+    f.write_line('private static readonly Vk.DescriptorSetLayoutBinding[][] _vulkanDescriptorSetLayoutBindings = {')
+    f.indent()
+    for set_index in range(num_sets):
+        bindings = bindings_by_set.get(set_index)
+        if not bindings:
+            f.write_line('Array.Empty<Vk.DescriptorSetLayoutBinding>(),')
+            continue
+        f.write_line('new Vk.DescriptorSetLayoutBinding[] {')
+        f.indent()
+        for binding, vk_type in bindings:
+            f.write_line(
+                f'new() {{ Binding = {binding}, DescriptorType = Vk.DescriptorType.{vk_type}, DescriptorCount = 1, '
+                'StageFlags = Vk.ShaderStageFlags.VertexBit | Vk.ShaderStageFlags.FragmentBit },'
+            )
+        f.deindent()
+        f.write_line('},')
+    f.deindent()
+    f.write_line('};', '')
+
+    f.write_line('private static readonly (Vk.DescriptorType, int)[][] _vulkanDescriptorCountsBySet = {')
+    f.indent()
+    for set_index in range(num_sets):
+        counts = counts_by_set.get(set_index, {})
+        entries = ', '.join(f'(Vk.DescriptorType.{vk_type}, {count})' for vk_type, count in counts.items())
+        f.write_line(f'new (Vk.DescriptorType, int)[] {{ {entries} }},')
+    f.deindent()
+    f.write_line('};', '')
 
     f.write_line(
+        'public Vk.DescriptorSetLayoutBinding[][] VulkanDescriptorSetLayoutBindings => _vulkanDescriptorSetLayoutBindings;',
+        'public (Vk.DescriptorType, int)[][] VulkanDescriptorCountsBySet => _vulkanDescriptorCountsBySet;',
+        ''
+    )
+
+
+def get_member_cs_type(member: Member, reflection: SpirvReflection) -> str:
+    """
+    Returns the C# type of a single element of the member.
+    """
+    if member.type[0] == '_':
+        return reflection.types[member.type].name
+    if member.type in spirv_to_cs_types:
+        return spirv_to_cs_types[member.type]
+    if get_matrix_shape(member.type):
+        # Emitted as a struct nested in the member's struct, see gen_matrix_structure.
+        return f'{to_cs_style(member.name)}Matrix'
+    raise ValueError(f'Don\'t know what C# type to use for {member.type} member {member.name}')
+
+
+matrix_type_pattern = re.compile(r'(d?)mat(\d)(?:x(\d))?')
+
+
+def get_matrix_shape(glsl_type: str) -> Optional[Tuple[str, int, int]]:
+    """
+    Returns the scalar type, column count and row count of a GLSL matrix type, or None if it isn't a matrix.
+    """
+    match = matrix_type_pattern.fullmatch(glsl_type)
+    if not match:
+        return None
+    scalar = 'double' if match.group(1) else 'float'
+    columns = int(match.group(2))
+    rows = int(match.group(3)) if match.group(3) else columns
+    return scalar, columns, rows
+
+
+def get_matrix_vectors(member: Member) -> Tuple[str, int]:
+    """
+    Returns the C# type of each column of a matrix member (or row, for row major matrices), and how many there are.
+    Each vector is matrix_stride apart.
+    """
+    scalar, columns, rows = get_matrix_shape(member.type)
+    if member.row_major:
+        columns, rows = rows, columns
+    return matrix_vector_cs_types[(scalar, rows)], columns
+
+
+def is_runtime_array(member: Member) -> bool:
+    return len(member.array_sizes) > 0 and member.array_sizes[-1] == 0
+
+
+def get_array_element_count(member: Member) -> int:
+    count = 1
+    for size in member.array_sizes:
+        count *= size
+    return count
+
+
+def get_array_element_stride(member: Member) -> int:
+    """
+    Returns the stride between the innermost elements of an array member, which is how arrays of arrays are emitted.
+    (spirv-cross lists array sizes innermost first, and reflects the stride of the outermost array.)
+    """
+    inner_count = 1
+    for size in member.array_sizes[:-1]:
+        inner_count *= size
+    if member.array_stride % inner_count != 0:
+        raise ValueError(f'Array stride {member.array_stride} of {member.name} is not a multiple of its inner array size')
+    return member.array_stride // inner_count
+
+
+class StructLayouts(object):
+    """
+    Works out the size that each struct needs on the CPU side, so that it can be copied straight into a UBO or SSBO.
+    """
+    def __init__(self, reflections: List[SpirvReflection]):
+        self.sizes_by_name: Dict[str, int] = {}
+        
+        # Blocks have their size reflected. A block ending in a runtime array is emitted as a single element of the
+        # array, as IBuffer<T> holds the array elements.
+        for reflection in reflections:
+            for buffer in reflection.ubos + reflection.ssbos:
+                shader_type = reflection.types.get(buffer.type)
+                if shader_type is None:
+                    continue
+                runtime_array = next((m for m in shader_type.members if is_runtime_array(m)), None)
+                if runtime_array is not None:
+                    self.set_size(shader_type.name, runtime_array.offset + runtime_array.array_stride)
+                elif buffer.block_size > 0:
+                    self.set_size(shader_type.name, buffer.block_size)
+        
+        # Structs used as array elements must fill the whole stride.
+        for reflection in reflections:
+            for shader_type in reflection.types.values():
+                for member in shader_type.members:
+                    if member.type[0] == '_' and member.array_sizes and not is_runtime_array(member):
+                        self.set_size(reflection.types[member.type].name, get_array_element_stride(member))
+                    
+        for reflection in reflections:
+            for shader_type in reflection.types.values():
+                self.get_size(shader_type, reflection)
+
+    def set_size(self, name: str, size: int):
+        existing_size = self.sizes_by_name.get(name)
+        if existing_size is not None and existing_size != size:
+            raise ValueError(f'Struct {name} is used with different sizes ({existing_size} and {size}). '
+                             f'Use the same layout (std140/std430) everywhere it is used.')
+        self.sizes_by_name[name] = size
+
+    def get_size(self, shader_type: ShaderType, reflection: SpirvReflection) -> int:
+        size = self.sizes_by_name.get(shader_type.name)
+        if size is None:
+            # Only used as a plain member, so it only needs to cover its own members.
+            size = max((self.get_member_extent(member, reflection) for member in shader_type.members), default=0)
+            self.sizes_by_name[shader_type.name] = size
+        return size
+
+    def get_cs_type_size(self, member: Member, reflection: SpirvReflection) -> int:
+        if member.type[0] == '_':
+            return self.get_size(reflection.types[member.type], reflection)
+        if member.type in spirv_to_cs_types:
+            return cs_sizes[spirv_to_cs_types[member.type]]
+        if get_matrix_shape(member.type):
+            if member.matrix_stride == 0:
+                raise ValueError(f'Matrix member {member.name} has no matrix stride')
+            vector_type, vector_count = get_matrix_vectors(member)
+            return member.matrix_stride * vector_count
+        return cs_sizes[get_member_cs_type(member, reflection)]
+
+    def get_member_extent(self, member: Member, reflection: SpirvReflection) -> int:
+        element_size = self.get_cs_type_size(member, reflection)
+        if not member.array_sizes or is_runtime_array(member):
+            return member.offset + element_size
+        return member.offset + get_array_element_stride(member) * (get_array_element_count(member) - 1) + element_size
+
+
+def verify_structure_layout(shader_type: ShaderType, reflection: SpirvReflection, layouts: StructLayouts):
+    """
+    Checks that the C# types of each member fit where the shader expects them, so that mismatches are found at build 
+    time rather than as garbage on the GPU.
+    """
+    size = layouts.sizes_by_name[shader_type.name]
+    members = sorted(shader_type.members, key=lambda m: m.offset)
+    for i, member in enumerate(members):
+        where = f'{shader_type.name}.{member.name}'
+        cs_type = get_member_cs_type(member, reflection)
+        element_size = layouts.get_cs_type_size(member, reflection)
+        
+        if member.array_sizes and not is_runtime_array(member):
+            element_stride = get_array_element_stride(member)
+            if element_size > element_stride:
+                raise ValueError(f'{where}: {cs_type} is {element_size} bytes, more than the array stride of {element_stride}')
+        
+        matrix_stride = cs_matrix_strides.get(cs_type)
+        if matrix_stride is not None and member.matrix_stride and member.matrix_stride != matrix_stride:
+            raise ValueError(f'{where}: matrix stride is {member.matrix_stride}, but {cs_type} has a stride of '
+                             f'{matrix_stride}')
+        
+        end = size if i + 1 == len(members) else members[i + 1].offset
+        if is_runtime_array(member):
+            end = size
+        if layouts.get_member_extent(member, reflection) > end:
+            raise ValueError(f'{where}: {cs_type} at offset {member.offset} overlaps the next member or the end of the '
+                             f'struct at {end}')
+
+
+def gen_structure(f: SourceWriter, shader_type: ShaderType, reflection: SpirvReflection, hints: Dict[str, str],
+                  layouts: StructLayouts, emit_writer: bool):
+    verify_structure_layout(shader_type, reflection, layouts)
+    
+    # Explicit offsets and size, taken from reflection, so that the struct can be copied into the buffer as-is.
+    f.write_line(
+        f'[StructLayout(LayoutKind.Explicit, Size = {layouts.sizes_by_name[shader_type.name]})]',
         f'public struct {shader_type.name}',
         '{'
     )
     f.indent()
 
+    array_members: List[Member] = []
     for member in shader_type.members:
-        if member.type[0] == '_':
-            type_name = reflection.types[member.type].name
-        else:
-            type_name = spirv_to_cs_types[member.type]
+        type_name = get_member_cs_type(member, reflection)
+        if member.array_sizes and not is_runtime_array(member):
+            type_name = f'{to_cs_style(member.name)}Array'
+            array_members.append(member)
         
         hint = hints.get(f'{shader_type.name}.{member.name}')
         if hint:
@@ -859,49 +1356,314 @@ def gen_structure(f: SourceWriter, shader_type: ShaderType, reflection: SpirvRef
 
         f.write_line(f'[FieldOffset({member.offset})] public {type_name} {member.name};')
 
+    for member in shader_type.members:
+        if member.type not in spirv_to_cs_types and get_matrix_shape(member.type):
+            gen_matrix_structure(f, member, layouts.get_cs_type_size(member, reflection))
+
+    # Fixed size arrays are inline arrays. Arrays of arrays are flattened, innermost index first.
+    for member in array_members:
+        element_type = get_member_cs_type(member, reflection)
+        element_size = layouts.get_cs_type_size(member, reflection)
+        element_stride = get_array_element_stride(member)
+        array_type = f'{to_cs_style(member.name)}Array'
+        
+        f.write_line('')
+        if element_size != element_stride:
+            # e.g. std140 arrays of scalars, where each element takes up 16 bytes. 
+            element_wrapper_type = f'{to_cs_style(member.name)}Element'
+            f.write_line(
+                f'[StructLayout(LayoutKind.Explicit, Size = {element_stride})]',
+                f'public struct {element_wrapper_type}',
+                '{',
+                f'    [FieldOffset(0)] public {element_type} Value;',
+                '',
+                f'    public static implicit operator {element_type}({element_wrapper_type} element) => element.Value;',
+                f'    public static implicit operator {element_wrapper_type}({element_type} value) => new() {{ Value = value }};',
+                '}',
+                ''
+            )
+            element_type = element_wrapper_type
+        
+        f.write_line(
+            f'[InlineArray({get_array_element_count(member)})]',
+            f'public struct {array_type}',
+            '{',
+            f'    private {element_type} _element0;',
+            '}'
+        )
+        
+    if emit_writer:
+        gen_structure_writer(f, shader_type, reflection, layouts)
+
     f.deindent()
     f.write_line('}')
     f.write_line('')
 
 
+def gen_structure_writer(f: SourceWriter, shader_type: ShaderType, reflection: SpirvReflection, layouts: StructLayouts):
+    """
+    Emits a ref struct which writes individual members straight into the bytes of the struct (e.g. mapped buffer 
+    memory), keeping track of the range of bytes that was written.
+    """
+    size = layouts.sizes_by_name[shader_type.name]
+    f.write_line(
+        '',
+        '/// <summary>',
+        f'/// Writes members of a {shader_type.name} in place, tracking the written range in <see cref="DirtyOffset"/> and',
+        '/// <see cref="DirtyLength"/>.',
+        '/// </summary>',
+        'public ref struct Writer',
+        '{',
+    )
+    f.indent()
+    f.write_line(
+        'private readonly Span<byte> _bytes;',
+        'private int _dirtyStart;',
+        'private int _dirtyEnd;',
+        '',
+        'public Writer(Span<byte> bytes)',
+        '{',
+        f'    if (bytes.Length < {size}) {{',
+        f'        throw new ArgumentException("Need at least {size} bytes to write a {shader_type.name}.", nameof(bytes));',
+        '    }',
+        '    _bytes = bytes;',
+        '    _dirtyStart = int.MaxValue;',
+        '    _dirtyEnd = 0;',
+        '}',
+        '',
+        f'public Writer(ref {shader_type.name} target)',
+        '    : this(MemoryMarshal.AsBytes(MemoryMarshal.CreateSpan(ref target, 1)))',
+        '{',
+        '}',
+        '',
+        'public bool IsDirty => _dirtyEnd > _dirtyStart;',
+        'public int DirtyOffset => IsDirty ? _dirtyStart : 0;',
+        'public int DirtyLength => IsDirty ? _dirtyEnd - _dirtyStart : 0;',
+        '',
+        'public void ClearDirty()',
+        '{',
+        '    _dirtyStart = int.MaxValue;',
+        '    _dirtyEnd = 0;',
+        '}',
+        '',
+        'private void Write<T>(int offset, in T value) where T : unmanaged',
+        '{',
+        '    MemoryMarshal.Write(_bytes.Slice(offset), in value);',
+        '    _dirtyStart = Math.Min(_dirtyStart, offset);',
+        '    _dirtyEnd = Math.Max(_dirtyEnd, offset + Unsafe.SizeOf<T>());',
+        '}',
+    )
+    
+    for member in shader_type.members:
+        if is_runtime_array(member):
+            continue
+        
+        cs_type = get_member_cs_type(member, reflection)
+        setter_name = f'Set{to_cs_style(member.name)}'
+        
+        if member.array_sizes:
+            count = get_array_element_count(member)
+            stride = get_array_element_stride(member)
+            f.write_line(
+                '',
+                f'public void {setter_name}(int index, in {cs_type} value)',
+                '{',
+                f'    if ((uint)index >= {count}) {{',
+                '        throw new ArgumentOutOfRangeException(nameof(index));',
+                '    }',
+                f'    Write({member.offset} + index * {stride}, in value);',
+                '}',
+            )
+        else:
+            f.write_line(
+                '',
+                f'public void {setter_name}(in {cs_type} value)',
+                '{',
+                f'    Write({member.offset}, in value);',
+                '}',
+            )
+    
+    f.deindent()
+    f.write_line('}')
+
+
+def gen_matrix_structure(f: SourceWriter, member: Member, size: int):
+    """
+    Emits a struct for a matrix member which has no C# equivalent with the same layout (e.g. std140 mat3, where each 
+    column is padded to 16 bytes).
+    """
+    vector_type, vector_count = get_matrix_vectors(member)
+    vector_name = 'Row' if member.row_major else 'Column'
+    f.write_line(
+        '',
+        f'[StructLayout(LayoutKind.Explicit, Size = {size})]',
+        f'public struct {to_cs_style(member.name)}Matrix',
+        '{',
+        *(f'    [FieldOffset({i * member.matrix_stride})] public {vector_type} {vector_name}{i};' for i in range(vector_count)),
+        '}'
+    )
+
+
+def gen_structure_size_checks(f: SourceWriter, shader: Shader, layouts: StructLayouts):
+    """
+    C# has no compile time sizeof for user structs, so check the sizes once when the shader type is initialized.
+    """
+    class_name = shader.directives.full_class_name.split('.')[-1]
+    f.write_line(
+        f'static {class_name}()',
+        '{',
+    )
+    f.indent()
+    for name, size in sorted(layouts.sizes_by_name.items()):
+        f.write_line(
+            f'if (Unsafe.SizeOf<{name}>() != {size}) {{',
+            f'    throw new InvalidOperationException("Struct {name} is not laid out like in the shader. Expected {size} bytes.");',
+            '}',
+        )
+    f.deindent()
+    f.write_line('}', '')
+
+
+# Matrices other than mat4 have their own struct generated per member, as their layout depends on the matrix stride.
 spirv_to_cs_types = {
-    'float': 'float',
+    # bool is 32 bits in buffers.
+    'bool': 'uint',
     'int': 'int',
     'uint': 'uint',
+    'int64_t': 'long',
+    'uint64_t': 'ulong',
+    'float16_t': 'Half',
+    'float': 'float',
+    'double': 'double',
     'mat4': 'Matrix4x4',
+    'bvec2': 'UIntVector2',
+    'bvec3': 'UIntVector3',
+    'bvec4': 'UIntVector4',
     'ivec2': 'IntVector2',
+    'ivec3': 'IntVector3',
+    'ivec4': 'IntVector4',
+    'uvec2': 'UIntVector2',
+    'uvec3': 'UIntVector3',
+    'uvec4': 'UIntVector4',
     'vec2': 'Vector2',
     'vec3': 'Vector3',
-    'vec4': 'Vector4'
+    'vec4': 'Vector4',
+    'dvec2': 'DoubleVector2',
+    'dvec3': 'DoubleVector3',
+    'dvec4': 'DoubleVector4',
+}
+
+# C# types of the columns (or rows) of matrices, by scalar type and component count.
+matrix_vector_cs_types = {
+    ('float', 2): 'Vector2',
+    ('float', 3): 'Vector3',
+    ('float', 4): 'Vector4',
+    ('double', 2): 'DoubleVector2',
+    ('double', 3): 'DoubleVector3',
+    ('double', 4): 'DoubleVector4',
 }
 
+# C# types used for vertex attributes with an explicit buffertype. Formats with multiple components that have no
+# matching C# vector type use an integer type of the same size, holding the packed components.
 buffer_type_to_cs_type = {
+    'R8_UNORM': 'byte',
+    'R8_SNORM': 'sbyte',
+    'R8G8_UNORM': 'ushort',
+    'R8G8_SNORM': 'short',
     'R8G8B8A8_UNORM': 'uint',
-    'R8G8B8A8_SNORM': 'int'
+    'R8G8B8A8_SNORM': 'int',
+    'R8G8B8A8_UINT': 'uint',
+    'R8G8B8A8_SINT': 'int',
+    'B8G8R8A8_UNORM': 'uint',
+    'R16_UNORM': 'ushort',
+    'R16_SNORM': 'short',
+    'R16_SFLOAT': 'Half',
+    'R16G16_UNORM': 'uint',
+    'R16G16_SNORM': 'int',
+    'R16G16_UINT': 'uint',
+    'R16G16_SINT': 'int',
+    'R16G16_SFLOAT': 'uint',
+    'R16G16B16A16_UNORM': 'ulong',
+    'R16G16B16A16_SNORM': 'long',
+    'R16G16B16A16_UINT': 'ulong',
+    'R16G16B16A16_SINT': 'long',
+    'R16G16B16A16_SFLOAT': 'ulong',
+    'A2B10G10R10_UNORM_PACK32': 'uint',
+    'A2B10G10R10_SNORM_PACK32': 'int',
+    'R32_SINT': 'int',
+    'R32_UINT': 'uint',
+    'R32_SFLOAT': 'float',
+    'R32G32_SFLOAT': 'Vector2',
+    'R32G32B32_SFLOAT': 'Vector3',
+    'R32G32B32A32_SFLOAT': 'Vector4',
+}
+
+# Stride between the columns of matrix types, as they are laid out in memory.
+cs_matrix_strides = {
+    'Matrix4x4': 16,
 }
 
 cs_sizes = {
+    'byte': 1,
+    'sbyte': 1,
+    'short': 2,
+    'ushort': 2,
+    'Half': 2,
     'float': 4,
     'int': 4,
     'uint': 4,
+    'long': 8,
+    'ulong': 8,
+    'double': 8,
     'Matrix4x4': 64,
     'IntVector2': 8,
+    'IntVector3': 12,
+    'IntVector4': 16,
+    'UIntVector2': 8,
+    'UIntVector3': 12,
+    'UIntVector4': 16,
     'Vector2': 8,
     'Vector3': 12,
-    'Vector4': 16
+    'Vector4': 16,
+    'DoubleVector2': 16,
+    'DoubleVector3': 24,
+    'DoubleVector4': 32,
 }
 
 spirv_to_default_buffer_types = {
     'int': 'R32_SINT',
     'uint': 'R32_UINT',
+    'float': 'R32_SFLOAT',
     'vec2': 'R32G32_SFLOAT',
     'vec3': 'R32G32B32_SFLOAT',
     'vec4': 'R32G32B32A32_SFLOAT'
 }
 
 buffer_type_to_mtlvertexformat = {
-    'R8G8B8A8_UNORM': 'UChar4',
-    'R8G8B8A8_SNORM': 'Char4',
+    'R8_UNORM': 'UCharNormalized',
+    'R8_SNORM': 'CharNormalized',
+    'R8G8_UNORM': 'UChar2Normalized',
+    'R8G8_SNORM': 'Char2Normalized',
+    'R8G8B8A8_UNORM': 'UChar4Normalized',
+    'R8G8B8A8_SNORM': 'Char4Normalized',
+    'R8G8B8A8_UINT': 'UChar4',
+    'R8G8B8A8_SINT': 'Char4',
+    'B8G8R8A8_UNORM': 'UChar4Normalized_BGRA',
+    'R16_UNORM': 'UShortNormalized',
+    'R16_SNORM': 'ShortNormalized',
+    'R16_SFLOAT': 'Half',
+    'R16G16_UNORM': 'UShort2Normalized',
+    'R16G16_SNORM': 'Short2Normalized',
+    'R16G16_UINT': 'UShort2',
+    'R16G16_SINT': 'Short2',
+    'R16G16_SFLOAT': 'Half2',
+    'R16G16B16A16_UNORM': 'UShort4Normalized',
+    'R16G16B16A16_SNORM': 'Short4Normalized',
+    'R16G16B16A16_UINT': 'UShort4',
+    'R16G16B16A16_SINT': 'Short4',
+    'R16G16B16A16_SFLOAT': 'Half4',
+    'A2B10G10R10_UNORM_PACK32': 'UInt1010102Normalized',
+    'A2B10G10R10_SNORM_PACK32': 'Int1010102Normalized',
     'R32_SINT': 'Int',
     'R32_UINT': 'UInt',
     'R32_SFLOAT': 'Float',
@@ -917,7 +1679,6 @@ buffer_type_to_mtlvertexformat = {
     # 'Vector4':  'Float4'
 }
 
-
 def get_cs_type(input: StageInput, directive: InputDirective) -> str:
     if directive.buffer_type:
         cs_type = buffer_type_to_cs_type[directive.buffer_type]
@@ -1,22 +1,83 @@
 
+# Byte size of a single component of each vertex attrib type.
+_component_byte_sizes = {
+    'GL_BYTE': 1,
+    'GL_UNSIGNED_BYTE': 1,
+    'GL_SHORT': 2,
+    'GL_UNSIGNED_SHORT': 2,
+    'GL_HALF_FLOAT': 2,
+    'GL_INT': 4,
+    'GL_UNSIGNED_INT': 4,
+    'GL_FLOAT': 4,
+}
+
+# Packed vertex attrib types store all components of an attribute in a single 32 bit value.
+# Maps to the number of components the attribute must have.
+_packed_component_counts = {
+    'GL_INT_2_10_10_10_REV': 4,
+    'GL_UNSIGNED_INT_2_10_10_10_REV': 4,
+    'GL_UNSIGNED_INT_10F_11F_11F_REV': 3,
+}
+
+_cs_types = {
+    'GL_BYTE': 'sbyte',
+    'GL_UNSIGNED_BYTE': 'byte',
+    'GL_SHORT': 'short',
+    'GL_UNSIGNED_SHORT': 'ushort',
+    'GL_HALF_FLOAT': 'Half',
+    'GL_INT': 'int',
+    'GL_UNSIGNED_INT': 'uint',
+    'GL_FLOAT': 'float',
+    'GL_INT_2_10_10_10_REV': 'int',
+    'GL_UNSIGNED_INT_2_10_10_10_REV': 'uint',
+    'GL_UNSIGNED_INT_10F_11F_11F_REV': 'uint',
+}
+
+# Vertex attributes start on 4 byte boundaries, and vertex strides are a multiple of 4 bytes. Metal requires this for
+# vertex descriptors, and it's the fast path on GL and Vulkan implementations.
+VERTEX_ATTRIBUTE_ALIGNMENT = 4
+
+
+def align_up(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def is_packed_vertex_attrib_type(gl_type: str) -> bool:
+    return gl_type in _packed_component_counts
+
+
+def get_packed_component_count(gl_type: str) -> int:
+    return _packed_component_counts[gl_type]
+
+
 def get_byte_size_of_vertex_attrib_type(gl_type: str) -> int:
-    if gl_type == 'GL_FLOAT':
+    """
+    Returns the byte size of one component of the given type. For packed types, this is the size of the whole
+    packed value.
+    """
+    if gl_type in _component_byte_sizes:
+        return _component_byte_sizes[gl_type]
+
+    if gl_type in _packed_component_counts:
         return 4
-    
-    if gl_type == 'GL_UNSIGNED_BYTE':
-        return 1
 
     raise ValueError(f'Don\'t know byte size of GL vertex attrib type {gl_type}')
 
 
-def get_cs_type_for_vertex_attrib_type(gl_type: str) -> str:
-    if gl_type == 'GL_FLOAT':
-        return 'float'
-    
-    if gl_type == 'GL_UNSIGNED_BYTE':
-        return 'byte'
+def get_byte_size_of_vertex_attrib(gl_type: str, count: int) -> int:
+    """
+    Returns the byte size of a whole vertex attribute with count components of the given type.
+    """
+    if is_packed_vertex_attrib_type(gl_type):
+        return get_byte_size_of_vertex_attrib_type(gl_type)
+    return get_byte_size_of_vertex_attrib_type(gl_type) * count
+
 
-    raise ValueError(f'Don\'t know what C# type to use for vertex attrib type {gl_type}')
+def get_cs_type_for_vertex_attrib_type(gl_type: str) -> str:
+    cs_type = _cs_types.get(gl_type)
+    if cs_type is None:
+        raise ValueError(f'Don\'t know what C# type to use for vertex attrib type {gl_type}')
+    return cs_type
 
 
 def get_abbreviated_enum_name(name: str) -> str:
@@ -1,12 +1,15 @@
 import os
-from typing import List, Set, Tuple, Iterable
+from typing import List, Set, Tuple, Iterable, Dict, Any, Optional, Callable
 
 
 class Node(object):
-    def __init__(self, filepath: str, action: str, inputs: List[Tuple[str, 'Node']]):
+    def __init__(self, filepath: str, action: str, inputs: List[Tuple[str, 'Node']],
+                 options: Optional[Dict[str, Any]] = None):
         self.filepath = filepath
         self.action = action
         self.tagged_inputs = inputs
+        # Extra, action specific parameters. (e.g. preprocessor defines)
+        self.options = options or {}
         
     def get_input_nodes(self) -> Iterable['Node']:
         return (input for tag, input in self.tagged_inputs)
@@ -19,12 +22,17 @@ class Graph(object):
     def __init__(self):
         self.root_nodes: List[Node] = []
         
-    def find_dirty_nodes(self, min_modtime: int) -> Set[Node]:
+    def find_dirty_nodes(self, is_outdated: Optional[Callable[[Node], bool]] = None) -> Set[Node]:
+        """
+        Finds the nodes which need to be rebuilt: those with missing or older outputs than their inputs, those with
+        dirty inputs, and those which is_outdated returns true for (e.g. because the action producing them changed).
+        """
         dirty_nodes: Set[Node] = set()
         
         stack: List[Node] = list(self.root_nodes)
         
         visited_nodes: Set[Node] = set()
+        checked_nodes: Set[Node] = set()
         
         while len(stack) > 0:
             node = stack[-1]
@@ -35,6 +43,11 @@ class Graph(object):
                 continue
             
             stack.pop()
+            
+            # A node which is the input of multiple nodes gets pushed multiple times. Only check it once.
+            if node in checked_nodes:
+                continue
+            checked_nodes.add(node)
                 
             # Check if any of the inputs are dirty
             is_dirty = False
@@ -44,9 +57,14 @@ class Graph(object):
                     break
             
             # If this is a source file node (we can tell since it has no inputs), assert that the file exists.
-            if len(node.tagged_inputs) == 0 and not os.path.isfile(node.filepath):
+            # Implicit inputs (e.g. includes found by a previous compile) may have been deleted since, in which case
+            # the nodes depending on them are dirty and get to report the error themselves.
+            if len(node.tagged_inputs) == 0 and not node.options.get('implicit') and not os.path.isfile(node.filepath):
                 raise ValueError(f'Missing source file {node.filepath}')
                 
+            if not is_dirty and len(node.tagged_inputs) > 0 and is_outdated is not None:
+                is_dirty = is_outdated(node)
+            
             # Inputs are clean, check if this node itself is dirty based on inputs
             if not is_dirty:
                 if not os.path.isfile(node.filepath):
@@ -59,7 +77,7 @@ class Graph(object):
                             is_dirty = True
                             break
                         else:
-                            input_modtime = max(os.stat(input.filepath).st_mtime_ns, min_modtime)
+                            input_modtime = os.stat(input.filepath).st_mtime_ns
                             if input_modtime >= output_modtime:
                                 is_dirty = True
                                 break
@@ -69,16 +87,28 @@ class Graph(object):
         
         return dirty_nodes
     
+    def select(self, predicate: Callable[[Node], bool]):
+        """
+        Makes the nodes matching the predicate the root nodes, so that only they and their inputs get built.
+        """
+        self.root_nodes = [node for node in self.walk() if predicate(node)]
+    
     def walk(self) -> Iterable[Node]:
         stack: List[Node] = list(self.root_nodes)
         
         visited_nodes = set()
+        yielded_nodes = set()
         
         while len(stack) > 0:
             node = stack[-1]
             
             if node in visited_nodes:
-                yield stack.pop()
+                stack.pop()
+                # A node which is the input of multiple nodes gets pushed multiple times. Only yield it once, so that
+                # its action isn't run multiple times.
+                if node not in yielded_nodes:
+                    yielded_nodes.add(node)
+                    yield node
             else:
                 stack.extend(node.get_input_nodes())
                 visited_nodes.add(node)
@@ -0,0 +1,356 @@
+"""
+Runs graph actions on worker processes, which can be on other hosts of a trusted local network. Start a worker with
+
+    python -m ggen.remote --host 0.0.0.0 --port 7700 --tools-dir <dir with glslangValidator, spirv-cross, ...>
+
+and pass --workers host:7700 to ggen. Without --host, workers only accept connections from the same machine.
+
+A request carries the action, the node's options and the paths and hashes of the files it reads. Paths are relative to
+a common base directory, which the worker mirrors in a scratch directory. Workers keep the files they've received by
+hash and only ask for the ones they don't have, so headers and SPIR-V shared by many requests are sent once. The least
+recently used files are dropped once they exceed --cache-size. The worker then runs the same action function ggen would
+run locally, and returns every file the action wrote.
+
+Workers only run ggen's own actions, but don't authenticate clients. Only run them on networks you trust.
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import shutil
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Any, Callable, Optional, Iterable
+
+from .graph import Node
+
+
+PROTOCOL_VERSION = 1
+
+# Messages are a big endian uint32 header size, a utf-8 JSON header, then the blobs whose sizes the header lists.
+MESSAGE_HEADER_SIZE = struct.Struct('>I')
+
+
+def send_message(sock: socket.socket, header: Dict[str, Any], blobs: Iterable[bytes] = ()):
+    blobs = list(blobs)
+    header = dict(header, blob_sizes=[len(blob) for blob in blobs])
+    encoded_header = json.dumps(header).encode('utf-8')
+    sock.sendall(MESSAGE_HEADER_SIZE.pack(len(encoded_header)) + encoded_header)
+    for blob in blobs:
+        sock.sendall(blob)
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    parts = []
+    while size > 0:
+        part = sock.recv(min(size, 1 << 20))
+        if not part:
+            raise ConnectionError('Connection closed')
+        parts.append(part)
+        size -= len(part)
+    return b''.join(parts)
+
+
+def recv_message(sock: socket.socket) -> Tuple[Dict[str, Any], List[bytes]]:
+    header_size, = MESSAGE_HEADER_SIZE.unpack(recv_exactly(sock, MESSAGE_HEADER_SIZE.size))
+    header = json.loads(recv_exactly(sock, header_size).decode('utf-8'))
+    blobs = [recv_exactly(sock, size) for size in header.pop('blob_sizes', [])]
+    return header, blobs
+
+
+def get_blob_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def to_wire_path(path: str, base: str) -> str:
+    return os.path.relpath(path, base).replace(os.sep, '/')
+
+
+def from_wire_path(path: str, base: str) -> str:
+    parts = path.split('/')
+    if os.path.isabs(path) or '..' in parts or ':' in path:
+        raise ValueError(f'Invalid path in request: {path}')
+    return os.path.join(base, *parts)
+
+
+class RemoteActionError(Exception):
+    """
+    An action failed on a worker. output is what the failed tool printed.
+    """
+    def __init__(self, message: str, output: str = ''):
+        super().__init__(message)
+        self.output = output
+
+
+class WorkerConnection(object):
+    def __init__(self, address: Tuple[str, int]):
+        self.address = address
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def run(self, action: str, options: Dict[str, Any], tagged_inputs: List[Tuple[str, str]], extra_paths: List[str],
+            output_path: str):
+        """
+        Runs the action on the worker, and writes the files it outputs next to output_path.
+        """
+        input_paths = [path for tag, path in tagged_inputs] + extra_paths
+        base = os.path.commonpath([os.path.abspath(path) for path in input_paths + [output_path]])
+        if os.path.isfile(base):
+            base = os.path.dirname(base)
+
+        blobs_by_hash: Dict[str, bytes] = {}
+        hashes_by_path: Dict[str, str] = {}
+        for path in input_paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            blob_hash = get_blob_hash(data)
+            blobs_by_hash[blob_hash] = data
+            hashes_by_path[path] = blob_hash
+
+        send_message(self.sock, {
+            'type': 'run',
+            'version': PROTOCOL_VERSION,
+            'action': action,
+            'options': options,
+            'inputs': [[tag, to_wire_path(path, base), hashes_by_path[path]] for tag, path in tagged_inputs],
+            'files': [[to_wire_path(path, base), hashes_by_path[path]] for path in extra_paths],
+            'output': to_wire_path(output_path, base),
+        })
+
+        header, blobs = recv_message(self.sock)
+        if header['type'] == 'missing':
+            missing_hashes = header['hashes']
+            send_message(self.sock, {'type': 'blobs', 'hashes': missing_hashes},
+                         [blobs_by_hash[blob_hash] for blob_hash in missing_hashes])
+            header, blobs = recv_message(self.sock)
+
+        if header['type'] == 'error':
+            # Refer to the local files instead of the worker's copies.
+            message = header['message']
+            output = header.get('output', '')
+            if header.get('root'):
+                message = message.replace(header['root'], base)
+                output = output.replace(header['root'], base)
+            raise RemoteActionError(message, output)
+        if header['type'] != 'result':
+            raise ConnectionError(f'Unexpected message {header["type"]} from worker {self.address}')
+
+        for wire_path, data in zip(header['outputs'], blobs):
+            path = from_wire_path(wire_path, base)
+            if path.endswith('.d'):
+                # Depfiles list paths in the worker's scratch directory.
+                data = data.replace(header['root'].encode('utf-8'), base.encode('utf-8'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    def close(self):
+        self.sock.close()
+
+
+class WorkerPool(object):
+    """
+    Connections to the workers, each running one action at a time.
+    """
+    def __init__(self, addresses: List[Tuple[str, int]], jobs_per_worker: int):
+        self.connections: queue.Queue[WorkerConnection] = queue.Queue()
+        self.size = 0
+        for address in addresses:
+            for _ in range(jobs_per_worker):
+                self.connections.put(WorkerConnection(address))
+                self.size += 1
+
+    def run(self, action: str, options: Dict[str, Any], tagged_inputs: List[Tuple[str, str]], extra_paths: List[str],
+            output_path: str):
+        connection = self.connections.get()
+        try:
+            connection.run(action, options, tagged_inputs, extra_paths, output_path)
+        finally:
+            self.connections.put(connection)
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+def parse_worker_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.strip().rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f'Expected a worker address of the form host:port, got {value}')
+    return host, int(port)
+
+
+def spawn_local_workers(count: int, tools_dir: Optional[str]) -> Tuple[List[subprocess.Popen], List[Tuple[str, int]]]:
+    """
+    Starts workers as subprocesses listening on localhost.
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    processes = []
+    addresses = []
+    for _ in range(count):
+        command = [sys.executable, '-m', 'ggen.remote', '--host', '127.0.0.1', '--port', '0']
+        if tools_dir:
+            command += ['--tools-dir', os.path.abspath(tools_dir)]
+        process = subprocess.Popen(command, cwd=package_root, stdout=subprocess.PIPE, text=True)
+        processes.append(process)
+        # The worker reports the port it got before serving.
+        line = process.stdout.readline()
+        if not line.startswith('listening '):
+            raise RuntimeError(f'Failed to start worker: {line}')
+        addresses.append(('127.0.0.1', int(line.split()[1])))
+    return processes, addresses
+
+
+class BlobStore(object):
+    """
+    The files received from clients by hash, dropping the least recently used ones once their total size exceeds
+    max_size.
+    """
+    def __init__(self, max_size: int):
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.size = 0
+        self.blobs_by_hash: OrderedDict[str, bytes] = OrderedDict()
+
+    def get_many(self, hashes: Iterable[str]) -> Tuple[Dict[str, bytes], List[str]]:
+        """
+        Returns the stored blobs with the given hashes, and the hashes of the ones which aren't stored. The caller 
+        keeps the returned blobs, as they can be dropped from the store at any time.
+        """
+        found: Dict[str, bytes] = {}
+        missing = set()
+        with self.lock:
+            for blob_hash in hashes:
+                data = self.blobs_by_hash.get(blob_hash)
+                if data is None:
+                    missing.add(blob_hash)
+                else:
+                    self.blobs_by_hash.move_to_end(blob_hash)
+                    found[blob_hash] = data
+        return found, sorted(missing)
+
+    def add(self, blob_hash: str, data: bytes):
+        if get_blob_hash(data) != blob_hash:
+            raise ValueError(f'Received blob does not match its hash {blob_hash}')
+        with self.lock:
+            if blob_hash in self.blobs_by_hash:
+                return
+            self.blobs_by_hash[blob_hash] = data
+            self.size += len(data)
+            while self.size > self.max_size and self.blobs_by_hash:
+                _, evicted = self.blobs_by_hash.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], actions: Dict[str, Callable[[Node], None]], cache_size: int):
+        super().__init__(address, WorkerRequestHandler)
+        self.actions = actions
+        self.blob_store = BlobStore(cache_size)
+
+
+class WorkerRequestHandler(socketserver.BaseRequestHandler):
+    server: WorkerServer
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            try:
+                header, blobs = recv_message(self.request)
+            except ConnectionError:
+                return
+            try:
+                response = self.run(header)
+            except Exception as e:
+                send_message(self.request, {'type': 'error', 'message': f'{type(e).__name__}: {e}'})
+                continue
+            send_message(self.request, *response)
+
+    def run(self, header: Dict[str, Any]) -> Tuple[Dict[str, Any], List[bytes]]:
+        if header['type'] != 'run' or header.get('version') != PROTOCOL_VERSION:
+            raise ValueError(f'Unsupported request {header["type"]} version {header.get("version")}')
+        action = self.server.actions.get(header['action'])
+        if action is None:
+            raise ValueError(f'Action {header["action"]} can\'t be run remotely')
+
+        blob_store = self.server.blob_store
+        files = [(path, blob_hash) for tag, path, blob_hash in header['inputs']] + header['files']
+        blobs_by_hash, missing_hashes = blob_store.get_many(blob_hash for path, blob_hash in files)
+        if missing_hashes:
+            send_message(self.request, {'type': 'missing', 'hashes': missing_hashes})
+            blobs_header, blobs = recv_message(self.request)
+            for blob_hash, data in zip(blobs_header['hashes'], blobs):
+                blob_store.add(blob_hash, data)
+                blobs_by_hash[blob_hash] = data
+
+        root = tempfile.mkdtemp(prefix='ggen-worker-')
+        try:
+            input_paths = set()
+            for wire_path, blob_hash in files:
+                path = from_wire_path(wire_path, root)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(blobs_by_hash[blob_hash])
+                input_paths.add(path)
+
+            inputs = [(tag, Node(from_wire_path(path, root), '', [])) for tag, path, blob_hash in header['inputs']]
+            output_path = from_wire_path(header['output'], root)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            try:
+                action(Node(output_path, header['action'], inputs, header['options']))
+            except Exception as e:
+                # E.g. a shader which doesn't compile. Tool failures carry what the tool printed.
+                return {'type': 'error', 'message': str(e), 'output': getattr(e, 'output', ''), 'root': root}, []
+
+            # Everything the action wrote is an output (e.g. depfiles next to the main output).
+            outputs = []
+            blobs = []
+            for dirpath, dirnames, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    if path in input_paths:
+                        continue
+                    with open(path, 'rb') as f:
+                        blobs.append(f.read())
+                    outputs.append(to_wire_path(path, root))
+            return {'type': 'result', 'root': root, 'outputs': outputs}, blobs
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    argparser = argparse.ArgumentParser(prog='python -m ggen.remote')
+    argparser.add_argument('--host', default='127.0.0.1', 
+                           help='Address to listen on. Defaults to localhost. Use 0.0.0.0 to accept connections from '
+                                'other hosts, on trusted networks only.')
+    argparser.add_argument('--port', type=int, default=7700, help='Port to listen on. 0 picks a free port.')
+    argparser.add_argument('--tools-dir', help='Directory containing the tools used by the actions.')
+    argparser.add_argument('--cache-size', type=int, default=512,
+                           help='Megabytes of received files to keep for later requests. Defaults to 512.')
+    args = argparser.parse_args()
+
+    from . import __main__ as ggen_main
+    if args.tools_dir:
+        ggen_main.set_tools_dir(args.tools_dir)
+
+    with WorkerServer((args.host, args.port), ggen_main.REMOTE_ACTIONS, args.cache_size * 1024 * 1024) as server:
+        print(f'listening {server.server_address[1]}')
+        sys.stdout.flush()
+        # Whoever started the worker may only read the line above. Send the output of the tools to stderr from here on, 
+        # so that it can't fill up an unread pipe.
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
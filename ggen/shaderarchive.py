@@ -0,0 +1,132 @@
+import hashlib
+import struct
+import zlib
+from enum import Enum, auto
+from typing import List, Tuple
+
+from .gl import align_up
+
+
+# Layout of a shader archive. All integers are little endian.
+#
+#   magic          4 bytes, b'CGSA'
+#   version        uint32
+#   entry count    uint32
+#   entries        entry count times:
+#       name length    uint16
+#       name           utf-8, name length bytes
+#       flags          uint8, see ARCHIVE_ENTRY_FLAG_*
+#       offset         uint32, from the start of the archive
+#       stored size    uint32, size of the blob in the archive
+#       size           uint32, size of the entry once decompressed
+#   blobs          each starting at a multiple of ARCHIVE_BLOB_ALIGNMENT
+#
+# Blobs are aligned so that SPIR-V can be handed to the driver straight out of the archive.
+# Must be kept in sync with ShaderArchive.cs.
+ARCHIVE_MAGIC = b'CGSA'
+ARCHIVE_VERSION = 1
+ARCHIVE_BLOB_ALIGNMENT = 8
+ARCHIVE_ENTRY_FLAG_DEFLATE = 1
+
+
+# noinspection PyArgumentList
+class ArchiveCompression(Enum):
+    NONE = auto()
+    DEFLATE = auto()
+
+
+SPIRV_MAGIC = 0x07230203
+SPIRV_HEADER_WORD_COUNT = 5
+
+# Debug instructions which don't affect the semantics of a module.
+SPIRV_DEBUG_OPCODES = {
+    2,    # OpSourceContinued
+    3,    # OpSource
+    4,    # OpSourceExtension
+    5,    # OpName
+    6,    # OpMemberName
+    7,    # OpString
+    8,    # OpLine
+    317,  # OpNoLine
+    330,  # OpModuleProcessed
+}
+
+
+def strip_spirv_debug_info(spirv: bytes) -> bytes:
+    """
+    Removes debug instructions (source, names, line info) from a SPIR-V module.
+    """
+    if len(spirv) % 4 != 0 or len(spirv) < SPIRV_HEADER_WORD_COUNT * 4:
+        raise ValueError('Not a SPIR-V module')
+
+    if struct.unpack_from('<I', spirv)[0] == SPIRV_MAGIC:
+        endian = '<'
+    elif struct.unpack_from('>I', spirv)[0] == SPIRV_MAGIC:
+        endian = '>'
+    else:
+        raise ValueError('Not a SPIR-V module')
+
+    words = struct.unpack(f'{endian}{len(spirv) // 4}I', spirv)
+    stripped = list(words[:SPIRV_HEADER_WORD_COUNT])
+
+    i = SPIRV_HEADER_WORD_COUNT
+    while i < len(words):
+        word_count = words[i] >> 16
+        opcode = words[i] & 0xFFFF
+        if word_count == 0 or i + word_count > len(words):
+            raise ValueError(f'Malformed SPIR-V instruction at word {i}')
+        if opcode not in SPIRV_DEBUG_OPCODES:
+            stripped.extend(words[i:i + word_count])
+        i += word_count
+
+    return struct.pack(f'{endian}{len(stripped)}I', *stripped)
+
+
+def pack_shader_archive(entries: List[Tuple[str, bytes]], compression: ArchiveCompression) -> bytes:
+    """
+    Packs the given (name, data) entries into a shader archive. With compression, entries are only stored compressed
+    when it actually makes them smaller. Entries with identical contents (e.g. shader variants which compile to the same
+    code) share a single blob.
+    """
+    stored_entries = []
+    for name, data in sorted(entries, key=lambda x: x[0]):
+        flags = 0
+        stored = data
+        if compression == ArchiveCompression.DEFLATE:
+            # Raw deflate, as that is what System.IO.Compression.DeflateStream reads.
+            compressor = zlib.compressobj(zlib.Z_BEST_COMPRESSION, zlib.DEFLATED, -15)
+            compressed = compressor.compress(data) + compressor.flush()
+            if len(compressed) < len(data):
+                flags |= ARCHIVE_ENTRY_FLAG_DEFLATE
+                stored = compressed
+        stored_entries.append((name.encode('utf-8'), flags, stored, len(data)))
+
+    table_size = 12
+    for encoded_name, flags, stored, size in stored_entries:
+        table_size += 2 + len(encoded_name) + 1 + 12
+
+    header = [ARCHIVE_MAGIC, struct.pack('<II', ARCHIVE_VERSION, len(stored_entries))]
+    blobs = []
+    offsets_by_hash = {}
+    offset = align_up(table_size, ARCHIVE_BLOB_ALIGNMENT)
+    for encoded_name, flags, stored, size in stored_entries:
+        blob_hash = (flags, hashlib.sha256(stored).digest())
+        blob_offset = offsets_by_hash.get(blob_hash)
+        if blob_offset is None:
+            blob_offset = offset
+            offsets_by_hash[blob_hash] = blob_offset
+            blobs.append(stored)
+            offset = align_up(offset + len(stored), ARCHIVE_BLOB_ALIGNMENT)
+        header.append(struct.pack('<H', len(encoded_name)))
+        header.append(encoded_name)
+        header.append(struct.pack('<BIII', flags, blob_offset, len(stored), size))
+
+    parts = [b''.join(header)]
+    position = table_size
+    for blob in blobs:
+        aligned_position = align_up(position, ARCHIVE_BLOB_ALIGNMENT)
+        parts.append(b'\0' * (aligned_position - position))
+        parts.append(blob)
+        position = aligned_position + len(blob)
+
+    return b''.join(parts)
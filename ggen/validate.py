@@ -1,6 +1,6 @@
-﻿from typing import Dict, Set
+﻿from typing import Dict, Set, List, Tuple, Any
 
-from .genshaders import Shader
+from .genshaders import Shader, SpirvReflection
 
 
 # TODO: SHOULD VERIFY THAT SSBO USAGES IN VERTEX SHADERS ARE MARKED AS READONLY (Required by Vulkan)
@@ -30,3 +30,44 @@ def validate_descriptor_set_bindings(shader: Shader):
             add_binding_or_throw(tex.name, tex.set, tex.binding)
     
     # If we got here, we're all good to go!
+
+
+def get_interface_parts(reflection: SpirvReflection) -> List[Tuple[str, Any]]:
+    """
+    Everything about a stage that the generated class is based on, by what to call it in errors.
+    """
+    def get_type_name(type_id: str) -> str:
+        # Type ids are assigned by the compiler, so compare the types by name.
+        type = reflection.types.get(type_id)
+        return type.name if type else type_id
+    
+    return [
+        ('vertex inputs', sorted((input.location, input.name, input.type) for input in reflection.inputs)),
+        ('uniform buffers', sorted((ubo.set, ubo.binding, ubo.name, get_type_name(ubo.type), ubo.block_size) 
+                                   for ubo in reflection.ubos)),
+        ('storage buffers', sorted((ssbo.set, ssbo.binding, ssbo.name, get_type_name(ssbo.type), ssbo.block_size) 
+                                   for ssbo in reflection.ssbos)),
+        ('textures', sorted((tex.set, tex.binding, tex.name, tex.type) for tex in reflection.textures)),
+        ('struct layouts', sorted(
+            (type.name, [(member.name, get_type_name(member.type), member.offset, member.matrix_stride, 
+                          member.row_major, member.array_sizes, member.array_stride) for member in type.members])
+            for type in reflection.types.values()
+        )),
+    ]
+
+
+def validate_variant_interfaces(shader: Shader):
+    """
+    Validate that every variant has the interface of the default variant. The generated class, its descriptors and 
+    vertex layout are all based on the default variant, so a variant whose defines e.g. remove a uniform buffer would
+    otherwise only fail at runtime.
+    """
+    for variant in shader.variants:
+        for stage, reflection in variant.reflections_by_stage.items():
+            default_parts = dict(get_interface_parts(shader.reflections_by_stage[stage]))
+            for part_name, part in get_interface_parts(reflection):
+                if part != default_parts[part_name]:
+                    raise ValueError(f'Variant {variant.name} of shader {shader.resource_prefix} has different '
+                                     f'{part_name} in its {stage.name.lower()} stage than the default variant: '
+                                     f'{part} instead of {default_parts[part_name]}. Variants must keep the interface '
+                                     f'of the default variant.')